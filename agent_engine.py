@@ -0,0 +1,361 @@
+# agent_engine.py
+# Local agent-based simulation for the multi_agent_forecast heuristic.
+# The LLM only describes the agent groups (where they start, how stubborn and how easily swayed
+# they are); the population is then stepped here in batched NumPy operations, many seeded runs
+# at once, and stops early once the population stops moving. The simulator narrates the numbers.
+
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from llm_gateway import create_message
+from prompts import cached_block
+from deadlines import DeadlineExceeded
+from model_tiers import model_for, timed_call
+
+logger = logging.getLogger(__name__)
+
+# Independent runs stepped together; their spread is the forecast's uncertainty
+AGENT_ENGINE_RUNS = int(os.environ.get("AGENT_ENGINE_RUNS", 32))
+# Consecutive quiet steps needed before the population counts as converged
+CONVERGENCE_PATIENCE = 3
+# Points kept from the trajectory for the narration
+TRAJECTORY_POINTS = 20
+
+DEFAULT_PARAMETERS = {
+    "num_agents": 10,
+    "interaction_depth": 3,
+    "simulation_steps": 100,
+    "convergence_threshold": 0.01,
+    "max_iterations": 1000,
+}
+
+# Allowed range of each behaviour; anything the model returns is clipped into it
+BEHAVIOUR_LIMITS = {
+    "share": (0.0, 1.0),
+    "initial_state": (0.0, 1.0),
+    "stubbornness": (0.0, 1.0),
+    "susceptibility": (0.0, 1.0),
+    "influence": (0.01, 1.0),
+    "drift": (-0.05, 0.05),
+    "noise": (0.0, 0.1),
+}
+
+
+def _number(description: str) -> Dict:
+    return {"type": "number", "description": description}
+
+
+AGENT_TOOL = {
+    "name": "record_agent_groups",
+    "description": "Record the agent groups and behaviours for the agent-based simulation.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "state_label": {
+                "type": "string",
+                "description": "what an agent's state measures, 0 = none, 1 = full "
+                "(e.g. 'support for the merger', 'share of EV buyers')",
+            },
+            "groups": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "share": _number("fraction of the population, 0-1"),
+                        "initial_state": _number("starting state, 0-1"),
+                        "stubbornness": _number(
+                            "pull back towards the starting state, 0-1"
+                        ),
+                        "susceptibility": _number(
+                            "weight given to the neighbours' states, 0-1"
+                        ),
+                        "influence": _number("how strongly others listen to them, 0-1"),
+                        "drift": _number("trend per step, -0.05 to 0.05"),
+                        "noise": _number("random variation per step, 0-0.1"),
+                    },
+                    "required": ["name", "share", "initial_state"],
+                },
+            },
+        },
+        "required": ["state_label", "groups"],
+    },
+}
+
+PARAMETERIZE_INSTRUCTIONS = """
+You set up an agent-based simulation for a forecasting scenario. Describe the population as
+2 to 6 groups of agents. Each agent holds a state between 0 and 1, described by state_label.
+Every step an agent moves towards the influence-weighted state of its neighbours (by its
+susceptibility), is pulled back towards where it started (by its stubbornness), and follows
+its group's drift plus some noise. Choose values that reflect the scenario; the simulation
+itself is run by the application, so do not forecast the outcome.
+"""
+
+
+def _clip(name: str, value) -> float:
+    low, high = BEHAVIOUR_LIMITS[name]
+    return float(min(high, max(low, float(value))))
+
+
+def normalize_groups(groups: List[Dict]) -> List[Dict]:
+    """
+    Validate group behaviours, clip them into range and make the shares sum to 1.
+    Raises ValueError if no usable group is left.
+    """
+    defaults = {
+        "stubbornness": 0.2,
+        "susceptibility": 0.5,
+        "influence": 0.5,
+        "drift": 0.0,
+        "noise": 0.01,
+    }
+    normalized = []
+    for index, group in enumerate(groups or []):
+        if not isinstance(group, dict):
+            continue
+        try:
+            entry = {"name": str(group.get("name") or f"group {index + 1}")}
+            for field in BEHAVIOUR_LIMITS:
+                entry[field] = _clip(field, group.get(field, defaults.get(field)))
+        except (TypeError, ValueError):
+            continue
+        if entry["share"] > 0:
+            normalized.append(entry)
+    if not normalized:
+        raise ValueError("No usable agent groups")
+    total = sum(group["share"] for group in normalized)
+    for group in normalized:
+        group["share"] /= total
+    return normalized
+
+
+def _group_sizes(shares: List[float], num_agents: int) -> np.ndarray:
+    """
+    Split num_agents by share with the largest remainder method.
+    """
+    exact = np.asarray(shares) * num_agents
+    sizes = np.floor(exact).astype(int)
+    remainder = num_agents - sizes.sum()
+    sizes[np.argsort(exact - sizes)[::-1][:remainder]] += 1
+    return sizes
+
+
+class AgentEngine:
+    """
+    A population of agents stepped for several independent runs at once.
+    State arrays have shape (runs, agents); each run has its own random network of
+    interaction_depth neighbours per agent and its own noise, all from one seed.
+    """
+
+    def __init__(
+        self,
+        groups: List[Dict],
+        num_agents: int = DEFAULT_PARAMETERS["num_agents"],
+        interaction_depth: int = DEFAULT_PARAMETERS["interaction_depth"],
+        runs: int = AGENT_ENGINE_RUNS,
+        seed: int = 0,
+    ):
+        self.groups = normalize_groups(groups)
+        self.num_agents = max(2, int(num_agents))
+        self.depth = max(1, min(int(interaction_depth), self.num_agents - 1))
+        self.runs = max(1, int(runs))
+        self.seed = int(seed)
+        self.rng = np.random.default_rng(self.seed)
+
+        sizes = _group_sizes([g["share"] for g in self.groups], self.num_agents)
+        self.group_of = np.repeat(np.arange(len(self.groups)), sizes)
+        behaviour = {
+            field: np.array([g[field] for g in self.groups])[self.group_of]
+            for field in BEHAVIOUR_LIMITS
+        }
+        self.stubbornness = behaviour["stubbornness"]
+        self.susceptibility = behaviour["susceptibility"]
+        self.drift = behaviour["drift"]
+        self.noise = behaviour["noise"]
+
+        shape = (self.runs, self.num_agents)
+        self.initial = np.clip(
+            behaviour["initial_state"] + self.rng.normal(0.0, 0.05, shape), 0.0, 1.0
+        )
+        self.state = self.initial.copy()
+
+        # Neighbours are drawn without the agent itself by shifting indices past it
+        neighbours = self.rng.integers(
+            0, self.num_agents - 1, (self.runs, self.num_agents, self.depth)
+        )
+        neighbours += neighbours >= np.arange(self.num_agents)[None, :, None]
+        self.neighbours = neighbours
+        weights = behaviour["influence"][neighbours]
+        self.weights = weights / weights.sum(axis=2, keepdims=True)
+        self._run_index = np.arange(self.runs)[:, None, None]
+
+    def step(self) -> float:
+        """
+        Advance every run by one step. Returns the largest change in any run's
+        population mean, which is what convergence is judged on.
+        """
+        social = (self.state[self._run_index, self.neighbours] * self.weights).sum(
+            axis=2
+        )
+        moved = (1 - self.susceptibility) * self.state + self.susceptibility * social
+        updated = (
+            self.stubbornness * self.initial
+            + (1 - self.stubbornness) * moved
+            + self.drift
+            + self.noise * self.rng.standard_normal(self.state.shape)
+        )
+        np.clip(updated, 0.0, 1.0, out=updated)
+        change = float(np.abs(updated.mean(axis=1) - self.state.mean(axis=1)).max())
+        self.state = updated
+        return change
+
+    def run(
+        self,
+        simulation_steps: int = DEFAULT_PARAMETERS["simulation_steps"],
+        convergence_threshold: float = DEFAULT_PARAMETERS["convergence_threshold"],
+        max_iterations: int = DEFAULT_PARAMETERS["max_iterations"],
+    ) -> Dict:
+        """
+        Step until the population converges or the horizon is reached.
+        max_iterations caps simulation_steps. Returns a JSON-serializable summary.
+        """
+        started = time.perf_counter()
+        limit = max(1, min(int(simulation_steps), int(max_iterations)))
+        means = [self.state.mean(axis=1)]
+        quiet = 0
+        converged_at = None
+        for step in range(1, limit + 1):
+            change = self.step()
+            means.append(self.state.mean(axis=1))
+            quiet = quiet + 1 if change < convergence_threshold else 0
+            if quiet >= CONVERGENCE_PATIENCE:
+                converged_at = step
+                break
+        steps = len(means) - 1
+        means = np.array(means)
+
+        sample = np.unique(
+            np.linspace(0, steps, min(TRAJECTORY_POINTS, steps + 1)).astype(int)
+        )
+        trajectory = [
+            {
+                "step": int(t),
+                "mean": round(float(means[t].mean()), 4),
+                "p10": round(float(np.percentile(means[t], 10)), 4),
+                "p90": round(float(np.percentile(means[t], 90)), 4),
+            }
+            for t in sample
+        ]
+        groups = []
+        for index, group in enumerate(self.groups):
+            members = self.group_of == index
+            if not members.any():
+                continue
+            final = self.state[:, members].mean(axis=1)
+            groups.append(
+                {
+                    "name": group["name"],
+                    "agents": int(members.sum()),
+                    "initial_mean": round(float(self.initial[:, members].mean()), 4),
+                    "final_mean": round(float(final.mean()), 4),
+                    "final_p10": round(float(np.percentile(final, 10)), 4),
+                    "final_p90": round(float(np.percentile(final, 90)), 4),
+                }
+            )
+        final = means[-1]
+        return {
+            "seed": self.seed,
+            "runs": self.runs,
+            "num_agents": self.num_agents,
+            "interaction_depth": self.depth,
+            "steps_run": steps,
+            "converged": converged_at is not None,
+            "converged_at": converged_at,
+            "agent_steps": steps * self.runs * self.num_agents,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            "final": {
+                "mean": round(float(final.mean()), 4),
+                "p10": round(float(np.percentile(final, 10)), 4),
+                "p90": round(float(np.percentile(final, 90)), 4),
+                "agent_spread": round(float(self.state.std(axis=1).mean()), 4),
+            },
+            "groups": groups,
+            "trajectory": trajectory,
+        }
+
+
+def parameterize_agents(parsed_scenario: Dict) -> Dict:
+    """
+    Ask the model for the agent groups of a scenario. The fast tier answers first and
+    the large tier is asked once if the answer is unusable.
+    Returns {"state_label", "groups"} with normalized groups; raises ValueError if neither works.
+    """
+    last_error = None
+    for tier in ("fast", "large"):
+        with timed_call("agents", tier) as record:
+            try:
+                response = create_message(
+                    model=model_for("agents", tier),
+                    max_tokens=1000,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": f"Scenario: {parsed_scenario}",
+                        }
+                    ],
+                    system=[cached_block(PARAMETERIZE_INSTRUCTIONS)],
+                    tools=[AGENT_TOOL],
+                    tool_choice={"type": "tool", "name": AGENT_TOOL["name"]},
+                )
+                spec = next(
+                    dict(block.input)
+                    for block in response.content
+                    if getattr(block, "type", None) == "tool_use"
+                )
+                return {
+                    "state_label": str(spec.get("state_label") or "state"),
+                    "groups": normalize_groups(spec.get("groups")),
+                }
+            except DeadlineExceeded:
+                raise
+            except (StopIteration, ValueError, TypeError, AttributeError) as e:
+                last_error = e
+                record["escalated"] = tier == "fast"
+                logger.warning(f"Unusable agent groups from the {tier} tier: {e}")
+    raise ValueError(f"Could not parameterize the agent simulation: {last_error}")
+
+
+def run_agent_simulation(
+    world_state: Dict, parameters: Dict, seed: int, spec: Optional[Dict] = None
+) -> Dict:
+    """
+    Parameterize the agents for a session's scenario (unless spec is given) and run the
+    engine with the heuristic's parameters. Same seed and spec, same numbers.
+    """
+    spec = spec or parameterize_agents(world_state.get("parsed_scenario", {}))
+    settings = {**DEFAULT_PARAMETERS, **(parameters or {})}
+    engine = AgentEngine(
+        spec["groups"],
+        num_agents=settings["num_agents"],
+        interaction_depth=settings["interaction_depth"],
+        runs=settings.get("runs", AGENT_ENGINE_RUNS),
+        seed=seed,
+    )
+    results = engine.run(
+        simulation_steps=settings["simulation_steps"],
+        convergence_threshold=settings["convergence_threshold"],
+        max_iterations=settings["max_iterations"],
+    )
+    logger.info(
+        f"Agent simulation: {results['agent_steps']} agent-steps in {results['elapsed_ms']}ms"
+    )
+    return {
+        "engine": "agent_based",
+        "state_label": spec["state_label"],
+        "agent_groups": engine.groups,
+        **results,
+    }
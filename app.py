@@ -22,6 +22,29 @@ class Base(DeclarativeBase):
     pass
 
 
+# Largest Socket.IO message a client may send; Engine.IO drops a connection that sends
+# more, so the browser checks market data uploads against it before sending
+MAX_MESSAGE_BYTES = int(os.environ.get("SOCKETIO_MAX_MESSAGE_BYTES", 1_000_000))
+
+
+def socketio_options():
+    """
+    Socket.IO settings for init_app. With SOCKETIO_MESSAGE_QUEUE set (redis://, amqp://
+    or any kombu URL) emits go through the queue, so several workers can serve one app.
+    """
+    options = {
+        "async_mode": "eventlet",
+        "logger": True,
+        "engineio_logger": True,
+        "max_http_buffer_size": MAX_MESSAGE_BYTES,
+    }
+    message_queue = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+    if message_queue:
+        options["message_queue"] = message_queue
+        options["channel"] = os.environ.get("SOCKETIO_CHANNEL", "flask-socketio")
+    return options
+
+
 # Initialize extensions
 db = SQLAlchemy(model_class=Base)
 # Initialize SocketIO with proper CORS and error handling
@@ -73,7 +96,7 @@ def create_app():
     logger.info("Initializing Flask extensions...")
     db.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, async_mode="eventlet", logger=True, engineio_logger=True)
+    socketio.init_app(app, **socketio_options())
     login_manager.init_app(app)
     login_manager.login_view = "main.login"
 
@@ -97,4 +120,16 @@ def create_app():
         register_error_handlers(app)
         logger.info("Error handlers registered")
 
+        # Optionally watch heuristics.json and hot-reload it without a restart
+        watch_interval = float(os.environ.get("HEURISTICS_WATCH_INTERVAL", 0))
+        if watch_interval > 0:
+            from heuristic_catalog import registry
+
+            def watch_heuristics():
+                with app.app_context():
+                    registry.watch(watch_interval, sleep=socketio.sleep)
+
+            socketio.start_background_task(watch_heuristics)
+            logger.info(f"Watching heuristics catalog every {watch_interval}s")
+
         return app
@@ -0,0 +1,510 @@
+# backtester.py
+# Local backtesting for the trading_strategy heuristic.
+# The LLM proposes candidate strategies as parameter ranges; every combination is checked against
+# the heuristic's risk limits and the compliant ones are backtested together on the uploaded OHLCV
+# data, one array row per combination. Candidates that break a limit are rejected with the reason.
+
+import os
+import csv
+import io
+import time
+import itertools
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from llm_gateway import create_message
+from prompts import cached_block
+from deadlines import DeadlineExceeded
+from model_tiers import model_for, timed_call
+
+logger = logging.getLogger(__name__)
+
+# Uploads are cut to their most recent rows
+MAX_ROWS = int(os.environ.get("BACKTEST_MAX_ROWS", 10000))
+MIN_BARS = 50
+# Parameter combinations evaluated per request
+MAX_COMBINATIONS = int(os.environ.get("BACKTEST_MAX_COMBINATIONS", 5000))
+# The heuristic's "Risk more than 2% per trade" rule: equity lost when a stop is hit
+MAX_RISK_PER_TRADE = float(os.environ.get("BACKTEST_MAX_RISK_PER_TRADE", 0.02))
+# Accepted combinations reported back, best first
+TOP_RESULTS = 5
+BARS_PER_YEAR = 252
+
+DEFAULT_LIMITS = {
+    "max_position_size": 0.1,
+    "stop_loss": 0.02,
+    "take_profit": 0.04,
+    "max_drawdown": 0.15,
+    "risk_reward_ratio": 2.0,
+}
+
+# Signal parameters of each strategy family
+FAMILIES = {
+    "ma_crossover": ("fast_window", "slow_window"),
+    "breakout": ("lookback",),
+    "mean_reversion": ("lookback", "entry_z"),
+}
+RISK_PARAMETERS = ("position_size", "stop_loss", "take_profit")
+
+# Used when the model cannot propose usable candidates
+DEFAULT_CANDIDATES = [
+    {
+        "name": "trend following",
+        "family": "ma_crossover",
+        "fast_window": [5, 10, 20],
+        "slow_window": [50, 100],
+        "position_size": [0.05, 0.1],
+        "stop_loss": [0.01, 0.02],
+        "take_profit": [0.04, 0.06],
+    },
+    {
+        "name": "breakout",
+        "family": "breakout",
+        "lookback": [20, 55],
+        "position_size": [0.05, 0.1],
+        "stop_loss": [0.02],
+        "take_profit": [0.04, 0.08],
+    },
+]
+
+COLUMN_NAMES = {
+    "date": ("date", "datetime", "timestamp", "time"),
+    "open": ("open",),
+    "high": ("high",),
+    "low": ("low",),
+    "close": ("close", "adj close", "adj_close"),
+    "volume": ("volume",),
+}
+
+
+def _is_descending(first: str, last: str) -> bool:
+    try:
+        return datetime.fromisoformat(first) > datetime.fromisoformat(last)
+    except ValueError:
+        return False
+
+
+def parse_ohlcv(text: str, max_rows: int = MAX_ROWS) -> Dict:
+    """
+    Read an OHLCV CSV with a header row. open, high, low and close are required,
+    date and volume are optional; rows with missing or inconsistent prices are dropped.
+    Returns column lists, oldest first. Raises ValueError if the file is unusable.
+    """
+    reader = csv.reader(io.StringIO(text or ""))
+    header = next(reader, None)
+    if not header:
+        raise ValueError("the file is empty")
+    normalized = [name.strip().lower() for name in header]
+    columns = {}
+    for column, names in COLUMN_NAMES.items():
+        for name in names:
+            if name in normalized:
+                columns[column] = normalized.index(name)
+                break
+    missing = [c for c in ("open", "high", "low", "close") if c not in columns]
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(missing)}")
+
+    rows = []
+    for row in reader:
+        try:
+            prices = [float(row[columns[c]]) for c in ("open", "high", "low", "close")]
+            volume = float(row[columns["volume"]]) if "volume" in columns else 0.0
+        except (IndexError, ValueError):
+            continue
+        open_, high, low, close = prices
+        if min(prices) <= 0 or high < max(open_, close, low) or low > min(open_, close):
+            continue
+        date = row[columns["date"]].strip() if "date" in columns else str(len(rows))
+        rows.append((date, open_, high, low, close, volume))
+
+    if len(rows) < MIN_BARS:
+        raise ValueError(f"{len(rows)} usable rows, at least {MIN_BARS} are needed")
+    # Files exported newest first are flipped so time runs forward
+    if "date" in columns and _is_descending(rows[0][0], rows[-1][0]):
+        rows.reverse()
+    rows = rows[-max_rows:]
+    dates, opens, highs, lows, closes, volumes = (list(c) for c in zip(*rows))
+    return {
+        "dates": dates,
+        "open": opens,
+        "high": highs,
+        "low": lows,
+        "close": closes,
+        "volume": volumes,
+    }
+
+
+def expand_candidates(candidates: List[Dict]) -> List[Dict]:
+    """
+    Every combination of each candidate's parameter lists, up to MAX_COMBINATIONS.
+    Candidates from an unknown family or without values are skipped.
+    """
+    combinations = []
+    for candidate in candidates or []:
+        family = candidate.get("family")
+        if family not in FAMILIES:
+            continue
+        names = FAMILIES[family] + RISK_PARAMETERS
+        try:
+            values = [
+                [float(v) for v in np.atleast_1d(candidate[name])] for name in names
+            ]
+        except (KeyError, TypeError, ValueError):
+            continue
+        for combination in itertools.product(*values):
+            combinations.append(
+                {
+                    "name": str(candidate.get("name") or family),
+                    "family": family,
+                    **dict(zip(names, combination)),
+                }
+            )
+            if len(combinations) >= MAX_COMBINATIONS:
+                return combinations
+    return combinations
+
+
+def limit_violations(combination: Dict, limits: Dict) -> List[str]:
+    """
+    Reasons a combination breaks the heuristic's risk limits before any backtest.
+    """
+    reasons = []
+    size, stop, target = (combination[name] for name in RISK_PARAMETERS)
+    if size <= 0 or size > limits["max_position_size"]:
+        reasons.append("position size above max_position_size")
+    if stop <= 0 or stop > limits["stop_loss"]:
+        reasons.append("stop loss missing or wider than stop_loss")
+    elif target / stop < limits["risk_reward_ratio"]:
+        reasons.append("take profit below risk_reward_ratio x stop loss")
+    if size * stop > MAX_RISK_PER_TRADE:
+        reasons.append(f"risks more than {MAX_RISK_PER_TRADE:.0%} per trade")
+    return reasons
+
+
+def _rolling(values: np.ndarray, window: int, reduce) -> np.ndarray:
+    """
+    reduce() over the window bars before each bar, NaN until the window fills.
+    """
+    result = np.full(values.shape, np.nan)
+    if window < len(values):
+        windows = np.lib.stride_tricks.sliding_window_view(values[:-1], window)
+        result[window:] = reduce(windows, axis=1)
+    return result
+
+
+def _sma(close: np.ndarray, window: int) -> np.ndarray:
+    """
+    Simple moving average including the current bar, NaN until the window fills.
+    """
+    sums = np.cumsum(np.r_[0.0, close])
+    result = np.full(close.shape, np.nan)
+    result[window - 1 :] = (sums[window:] - sums[:-window]) / window
+    return result
+
+
+def signals(combinations: List[Dict], bars: Dict[str, np.ndarray]):
+    """
+    Entry and exit signals, each of shape (combinations, bars). Indicators are computed
+    once per distinct window and shared by every combination that uses them.
+    """
+    close, high, low = bars["close"], bars["high"], bars["low"]
+    count, length = len(combinations), close.size
+    entry = np.zeros((count, length), dtype=bool)
+    exit_ = np.zeros((count, length), dtype=bool)
+    cache = {}
+
+    def indicator(kind, window):
+        key = (kind, window)
+        if key not in cache:
+            if kind == "sma":
+                cache[key] = _sma(close, window)
+            elif kind == "std":
+                mean = _sma(close, window)
+                cache[key] = np.sqrt(np.maximum(_sma(close**2, window) - mean**2, 0))
+            elif kind == "high":
+                cache[key] = _rolling(high, window, np.max)
+            else:
+                cache[key] = _rolling(low, window, np.min)
+        return cache[key]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for row, combination in enumerate(combinations):
+            family = combination["family"]
+            if family == "ma_crossover":
+                fast = indicator("sma", max(1, int(combination["fast_window"])))
+                slow = indicator("sma", max(2, int(combination["slow_window"])))
+                entry[row] = fast > slow
+                exit_[row] = fast <= slow
+            elif family == "breakout":
+                window = max(2, int(combination["lookback"]))
+                entry[row] = close > indicator("high", window)
+                exit_[row] = close < indicator("low", max(2, window // 2))
+            else:
+                window = max(2, int(combination["lookback"]))
+                z = (close - indicator("sma", window)) / indicator("std", window)
+                entry[row] = z < -abs(combination["entry_z"])
+                exit_[row] = z >= 0
+    return entry, exit_
+
+
+def backtest(
+    combinations: List[Dict], bars: Dict[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """
+    Trade every combination over the bars at once, long only. Positions open at the close
+    on an entry signal and leave at the stop or target (the open if it gaps through) or at
+    the close on an exit signal. Each trade risks position_size of equity.
+    Returns arrays of metrics, one value per combination.
+    """
+    opens, high, low, close = (bars[c] for c in ("open", "high", "low", "close"))
+    entry, exit_ = signals(combinations, bars)
+    size, stop, target = (
+        np.array([c[name] for c in combinations]) for name in RISK_PARAMETERS
+    )
+    count = len(combinations)
+
+    in_position = np.zeros(count, dtype=bool)
+    entry_price = np.ones(count)
+    equity = np.ones(count)
+    marked = np.ones(count)
+    peak = np.ones(count)
+    max_drawdown = np.zeros(count)
+    trades = np.zeros(count, dtype=int)
+    wins = np.zeros(count, dtype=int)
+    gains = np.zeros(count)
+    losses = np.zeros(count)
+    exposure = np.zeros(count, dtype=int)
+    step_sum = np.zeros(count)
+    step_squares = np.zeros(count)
+
+    for t in range(1, close.size):
+        stop_price = entry_price * (1 - stop)
+        target_price = entry_price * (1 + target)
+        stopped = in_position & (low[t] <= stop_price)
+        took_profit = in_position & ~stopped & (high[t] >= target_price)
+        signalled = in_position & ~stopped & ~took_profit & exit_[:, t]
+        exit_price = np.where(
+            stopped,
+            np.minimum(opens[t], stop_price),
+            np.where(took_profit, np.maximum(opens[t], target_price), close[t]),
+        )
+        closing = stopped | took_profit | signalled
+        trade_return = np.where(closing, exit_price / entry_price - 1, 0.0)
+        equity *= 1 + size * trade_return
+        trades += closing
+        wins += closing & (trade_return > 0)
+        gains += np.where(trade_return > 0, trade_return, 0.0)
+        losses -= np.where(trade_return < 0, trade_return, 0.0)
+        in_position &= ~closing
+
+        opening = ~in_position & ~closing & entry[:, t]
+        entry_price = np.where(opening, close[t], entry_price)
+        in_position |= opening
+        exposure += in_position
+
+        previous = marked
+        marked = np.where(
+            in_position, equity * (1 + size * (close[t] / entry_price - 1)), equity
+        )
+        step = marked / previous - 1
+        step_sum += step
+        step_squares += step**2
+        peak = np.maximum(peak, marked)
+        max_drawdown = np.maximum(max_drawdown, 1 - marked / peak)
+
+    steps = max(close.size - 1, 1)
+    mean = step_sum / steps
+    deviation = np.sqrt(np.maximum(step_squares / steps - mean**2, 0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = np.where(deviation > 0, mean / deviation * np.sqrt(BARS_PER_YEAR), 0.0)
+        payoff = np.where(
+            (losses > 0) & (wins > 0) & (trades > wins),
+            (gains / np.maximum(wins, 1)) / (losses / np.maximum(trades - wins, 1)),
+            0.0,
+        )
+    return {
+        "total_return": marked - 1,
+        "max_drawdown": max_drawdown,
+        "trades": trades,
+        "win_rate": np.where(trades > 0, wins / np.maximum(trades, 1), 0.0),
+        "payoff_ratio": payoff,
+        "sharpe": sharpe,
+        "exposure": exposure / steps,
+    }
+
+
+STRATEGY_TOOL = {
+    "name": "record_strategy_candidates",
+    "description": "Record candidate trading strategies to backtest, as parameter ranges.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "candidates": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string"},
+                        "family": {"type": "string", "enum": sorted(FAMILIES)},
+                        **{
+                            name: {"type": "array", "items": {"type": "number"}}
+                            for name in sorted(
+                                {p for params in FAMILIES.values() for p in params}
+                                | set(RISK_PARAMETERS)
+                            )
+                        },
+                    },
+                    "required": ["name", "family", *RISK_PARAMETERS],
+                },
+            }
+        },
+        "required": ["candidates"],
+    },
+}
+
+PROPOSE_INSTRUCTIONS = """
+You propose trading strategies to backtest on the user's price data. Give 1 to 4 candidates,
+each from one family, with a short list of values for every parameter:
+- ma_crossover: fast_window and slow_window in bars (long while the fast average is above the slow)
+- breakout: lookback in bars (long above the prior lookback high, out below the prior half-lookback low)
+- mean_reversion: lookback in bars and entry_z (long when the close is entry_z deviations below its mean)
+Every candidate also needs position_size (fraction of equity), stop_loss and take_profit
+(fractions of the entry price). The application runs the backtest and enforces the risk limits.
+"""
+
+
+def propose_candidates(parsed_scenario: Dict, limits: Dict) -> List[Dict]:
+    """
+    Ask the fast tier for candidate strategies, falling back to the default candidates
+    when it fails or proposes nothing usable.
+    """
+    with timed_call("strategies", "fast"):
+        try:
+            response = create_message(
+                model=model_for("strategies", "fast"),
+                max_tokens=1500,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": f"Scenario: {parsed_scenario}\nRisk limits: {limits}",
+                    }
+                ],
+                system=[cached_block(PROPOSE_INSTRUCTIONS)],
+                tools=[STRATEGY_TOOL],
+                tool_choice={"type": "tool", "name": STRATEGY_TOOL["name"]},
+            )
+            candidates = next(
+                block.input.get("candidates", [])
+                for block in response.content
+                if getattr(block, "type", None) == "tool_use"
+            )
+            if expand_candidates(candidates):
+                return candidates
+            logger.warning("No usable strategy candidates proposed, using the defaults")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"Could not get strategy candidates: {e}")
+    return DEFAULT_CANDIDATES
+
+
+def _round(value) -> float:
+    return round(float(value), 4)
+
+
+def evaluate(
+    candidates: List[Dict], market_data: Dict, limits: Optional[Dict] = None
+) -> Dict:
+    """
+    Check every combination of the candidates against the risk limits, backtest the
+    compliant ones and reject those whose drawdown exceeds max_drawdown.
+    Returns counts, rejection reasons and the best accepted combinations.
+    """
+    started = time.perf_counter()
+    limits = {**DEFAULT_LIMITS, **(limits or {})}
+    bars = {
+        column: np.asarray(market_data[column], dtype=float)
+        for column in ("open", "high", "low", "close")
+    }
+    combinations = expand_candidates(candidates)
+
+    rejected: Dict[str, int] = {}
+    examples: List[Dict] = []
+
+    def reject(combination, reasons):
+        for reason in reasons:
+            rejected[reason] = rejected.get(reason, 0) + 1
+        if len(examples) < 3:
+            examples.append({**combination, "reasons": reasons})
+
+    compliant = []
+    for combination in combinations:
+        reasons = limit_violations(combination, limits)
+        if reasons:
+            reject(combination, reasons)
+        else:
+            compliant.append(combination)
+
+    accepted: List[Tuple[Dict, Dict]] = []
+    if compliant:
+        metrics = backtest(compliant, bars)
+        for row, combination in enumerate(compliant):
+            result = {name: values[row] for name, values in metrics.items()}
+            if result["max_drawdown"] > limits["max_drawdown"]:
+                reject(combination, ["drawdown above max_drawdown"])
+            else:
+                accepted.append((combination, result))
+
+    accepted.sort(key=lambda item: (item[1]["sharpe"], item[1]["total_return"]))
+    best = [
+        {
+            **combination,
+            **{
+                name: int(value) if name == "trades" else _round(value)
+                for name, value in result.items()
+            },
+        }
+        for combination, result in reversed(accepted[-TOP_RESULTS:])
+    ]
+    close = bars["close"]
+    return {
+        "data": {
+            "filename": market_data.get("filename"),
+            "bars": int(close.size),
+            "start": market_data.get("dates", [None])[0],
+            "end": market_data.get("dates", [None])[-1],
+            "buy_and_hold_return": _round(close[-1] / close[0] - 1),
+        },
+        "limits": {**limits, "max_risk_per_trade": MAX_RISK_PER_TRADE},
+        "evaluated": len(combinations),
+        "accepted": len(accepted),
+        "rejected": rejected,
+        "rejected_examples": examples,
+        "best": best,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def run_backtest(world_state: Dict, parameters: Dict, seed: int) -> Optional[Dict]:
+    """
+    Local engine entry point: backtest candidate strategies on the OHLCV data uploaded
+    for the session. Returns None when no data was uploaded.
+    """
+    market_data = world_state.get("market_data")
+    if not market_data:
+        return None
+    limits = {
+        key: parameters[key] for key in DEFAULT_LIMITS if key in (parameters or {})
+    }
+    limits = {**DEFAULT_LIMITS, **limits}
+    candidates = propose_candidates(world_state.get("parsed_scenario", {}), limits)
+    results = evaluate(candidates, market_data, limits)
+    logger.info(
+        f"Backtested {results['evaluated']} combinations "
+        f"({results['accepted']} accepted) in {results['elapsed_ms']}ms"
+    )
+    return {"engine": "backtest", **results}
@@ -0,0 +1,205 @@
+# comparison.py
+# Side-by-side comparison of one scenario under several heuristics ("/compare negotiation
+# geopolitics <scenario>"). The scenario is parsed once; each heuristic then gets its own branch
+# (local engine, opening simulation turn, rule check) and the branches run concurrently, each in
+# a copy of the caller's context so its LLM calls are queued under the same user in the rate
+# limiter. Branches touch no database state; the caller stores and emits each result as it lands.
+
+import os
+import json
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from heuristic_catalog import HeuristicCatalog
+from deadlines import DeadlineExceeded, deadline_scope
+from local_engines import run_local_engine, simulation_payload
+from rule_checker import check_response, compiled_rules, metrics_instructions
+from simulation import WorldSimulator
+
+logger = logging.getLogger(__name__)
+
+COMMAND = "/compare"
+# Most heuristics one comparison may fan out to
+COMPARE_MAX_HEURISTICS = int(os.environ.get("COMPARE_MAX_HEURISTICS", 4))
+
+comparison_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("COMPARE_MAX_WORKERS", 8)),
+    thread_name_prefix="compare",
+)
+
+
+def is_compare_command(message) -> bool:
+    text = message.get("input") if isinstance(message, dict) else message
+    return isinstance(text, str) and text.strip().lower().startswith(COMMAND)
+
+
+def parse_compare_command(message, catalog: HeuristicCatalog) -> Tuple[List[str], str]:
+    """
+    Split a comparison request into (heuristic ids, scenario text).
+    The heuristics are the ids or aliases following /compare, or the message's
+    "heuristics" list; the rest of the input is the scenario.
+    Raises ValueError for an unusable request.
+    """
+    if isinstance(message, dict):
+        text, codes = message.get("input", ""), message.get("heuristics")
+    else:
+        text, codes = message, None
+    words = text.strip()[len(COMMAND) :].split() if is_compare_command(text) else []
+
+    heuristics = []
+    if codes:
+        for code in codes:
+            heuristic = catalog.resolve(str(code))
+            if heuristic is None:
+                raise ValueError(f"Unknown heuristic: {code}")
+            heuristics.append(heuristic)
+        scenario = " ".join(words) if words else text
+    else:
+        # Leading words that name heuristics, e.g. "negotiation,geopolitics" or two words
+        while words:
+            named = [catalog.resolve(code) for code in words[0].split(",") if code]
+            if not named or None in named:
+                break
+            heuristics.extend(named)
+            words.pop(0)
+        scenario = " ".join(words)
+
+    heuristics = list(dict.fromkeys(heuristics))
+    if len(heuristics) < 2:
+        raise ValueError(
+            f"Name at least two heuristics to compare, e.g. "
+            f"{COMMAND} negotiation geopolitics <scenario>"
+        )
+    if len(heuristics) > COMPARE_MAX_HEURISTICS:
+        raise ValueError(
+            f"At most {COMPARE_MAX_HEURISTICS} heuristics can be compared at once"
+        )
+    if not scenario.strip():
+        raise ValueError("Describe the scenario to compare after the heuristics")
+    return heuristics, scenario.strip()
+
+
+def run_branch(
+    branch: Dict, catalog: HeuristicCatalog, on_chunk: Optional[Callable] = None
+) -> Dict:
+    """
+    Run one heuristic's opening turn: local engine, simulation and rule check, under the
+    heuristic's execution budget. A failure is returned as the branch's error so the
+    other branches still complete.
+    """
+    heuristic = branch["heuristic"]
+    started = time.perf_counter()
+    result = {"heuristic": heuristic, "session_id": branch.get("session_id")}
+    try:
+        with deadline_scope(
+            budget=catalog.execution_budget(heuristic), label=f"comparison {heuristic}"
+        ):
+            world_state = branch["world_state"]
+            world_state = (
+                run_local_engine(world_state, catalog, branch["seed"]) or world_state
+            )
+            rules = compiled_rules(catalog, heuristic)
+            payload = simulation_payload(world_state)
+            instructions = metrics_instructions(rules)
+            if instructions:
+                payload["compliance_metrics"] = instructions
+            simulator = WorldSimulator(history_budget=catalog.history_budget(heuristic))
+            response = simulator.initialize_simulation(payload, on_chunk=on_chunk)
+        response, compliance = check_response(response, rules)
+        result.update(
+            world_state=world_state,
+            simulator=simulator,
+            response=response,
+            compliance=compliance,
+        )
+    except Exception as e:
+        logger.error(f"Comparison branch {heuristic} failed: {e}")
+        result["error"] = str(e)
+        if isinstance(e, DeadlineExceeded):
+            result["code"] = "deadline_exceeded"
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def run_comparison(
+    branches: List[Dict],
+    catalog: HeuristicCatalog,
+    chunk_handler: Callable[[str], Optional[Callable]],
+    on_result: Callable[[Dict], None],
+) -> Dict:
+    """
+    Run every branch concurrently. chunk_handler(heuristic) returns the streaming callback for
+    a branch (or None); on_result is called in the caller's thread as each branch finishes.
+    Returns the merged summary, in the order the heuristics were requested.
+    """
+    started = time.perf_counter()
+    futures = [
+        comparison_executor.submit(
+            contextvars.copy_context().run,
+            run_branch,
+            branch,
+            catalog,
+            chunk_handler(branch["heuristic"]),
+        )
+        for branch in branches
+    ]
+    for future in as_completed(futures):
+        on_result(future.result())
+    results = [future.result() for future in futures]
+    return merge_summary(results, catalog, (time.perf_counter() - started) * 1000)
+
+
+def merge_summary(results: List[Dict], catalog: HeuristicCatalog, elapsed_ms) -> Dict:
+    """
+    Line the branches up side by side: each heuristic's state update, actions and rule check,
+    plus the actions every successful branch proposed.
+    """
+    rows, action_sets = [], []
+    for result in results:
+        row = {
+            "heuristic": result["heuristic"],
+            "name": catalog.name(result["heuristic"]),
+            "session_id": result.get("session_id"),
+            "elapsed_ms": result["elapsed_ms"],
+        }
+        if "error" in result:
+            row["error"] = result["error"]
+        else:
+            parsed = parsed_response(result["response"])
+            compliance = result.get("compliance")
+            row.update(
+                state_update=parsed.get("state_update"),
+                available_actions=parsed.get("available_actions", []),
+                compliance=compliance["status"] if compliance else None,
+                violations=len(compliance["violations"]) if compliance else 0,
+            )
+            action_sets.append(
+                {action.lower() for action in row["available_actions"] if action}
+            )
+        rows.append(row)
+
+    branch_ms = [result["elapsed_ms"] for result in results]
+    return {
+        "heuristics": [row["heuristic"] for row in rows],
+        "rows": rows,
+        "shared_actions": sorted(set.intersection(*action_sets)) if action_sets else [],
+        "elapsed_ms": round(elapsed_ms, 2),
+        "slowest_branch_ms": max(branch_ms, default=0),
+        "total_branch_ms": round(sum(branch_ms), 2),
+    }
+
+
+def parsed_response(response: str) -> Dict:
+    """
+    The parsed form of an opening turn, which the simulator already returns as JSON.
+    """
+    try:
+        parsed = json.loads(response)
+    except (TypeError, ValueError):
+        parsed = None
+    if not isinstance(parsed, dict):
+        parsed = WorldSimulator.parse_response(response)
+    return parsed
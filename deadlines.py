@@ -0,0 +1,98 @@
+# deadlines.py
+# Execution deadlines for a unit of work (routing a scenario, one simulation turn).
+# A deadline is set once from the heuristic's timeout_seconds and max_retries, travels with the
+# work in a ContextVar, and every LLM call below it inherits the remaining time as its timeout.
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Budget used before a heuristic has been selected, and for heuristics without one
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get("DEFAULT_TIMEOUT_SECONDS", 300))
+DEFAULT_MAX_RETRIES = int(os.environ.get("DEFAULT_MAX_RETRIES", 2))
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when work runs past its time budget. The message is safe to show to the user.
+    """
+
+
+class Deadline:
+    """
+    An absolute point in time plus the retry allowance for calls made before it.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        label: str = "request",
+        clock=time.monotonic,
+    ):
+        self.seconds = float(seconds)
+        self.max_retries = int(max_retries)
+        self.label = label
+        self._clock = clock
+        self.expires_at = clock() + self.seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+    def check(self) -> None:
+        """
+        Raise DeadlineExceeded if the deadline has passed.
+        """
+        if self.expired:
+            raise self.exceeded()
+
+    def exceeded(self) -> DeadlineExceeded:
+        return DeadlineExceeded(
+            f"The {self.label} exceeded its {self.seconds:.0f}s time limit and was cancelled. "
+            "Please try again, or simplify the request."
+        )
+
+
+_current_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(
+    seconds: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    label: str = "request",
+    budget: Optional[Dict] = None,
+):
+    """
+    Run a block under a deadline. budget is a heuristic's execution budget
+    ({"timeout_seconds", "max_retries"}); explicit arguments win over it and defaults
+    fill the gaps. A scope nested in another never extends the outer deadline.
+    """
+    budget = budget or {}
+    if seconds is None:
+        seconds = float(budget.get("timeout_seconds", DEFAULT_TIMEOUT_SECONDS))
+    if max_retries is None:
+        max_retries = int(budget.get("max_retries", DEFAULT_MAX_RETRIES))
+
+    deadline = Deadline(seconds, max_retries, label)
+    outer = _current_deadline.get()
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        # The outer deadline comes first, so it is the one that will be reported
+        deadline.seconds, deadline.label = outer.seconds, outer.label
+        deadline.expires_at = outer.expires_at
+
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,259 @@
+# forecasting.py
+# Local time-series forecasting for the standard_forecast heuristic.
+# Series supplied with the request (or typed into the prompt) are truncated to max_lookback,
+# checked against min_data_points, seasonally decomposed, fitted with Holt's linear exponential
+# smoothing and given bootstrap prediction intervals. Series of equal length are processed as
+# one array, so many series cost little more than one. The simulator explains the numbers.
+
+import os
+import re
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Simulated future paths per series for the prediction intervals
+BOOTSTRAP_PATHS = int(os.environ.get("FORECAST_BOOTSTRAP_PATHS", 1000))
+# Smoothing parameters tried for every series; the best one-step fit wins
+ALPHAS = np.linspace(0.1, 0.9, 9)
+BETAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+# At most this many series are forecast per request
+MAX_SERIES = int(os.environ.get("FORECAST_MAX_SERIES", 200))
+
+DEFAULT_PARAMETERS = {
+    "forecast_horizon": 30,
+    "confidence_interval": 0.95,
+    "seasonality_period": 12,
+    "max_lookback": 365,
+    "min_data_points": 30,
+}
+
+# A run of numbers separated by commas, semicolons or whitespace, e.g. "120, 135, 150.5".
+# Numbers may use thousands separators ("1,200, 1,350"), so a comma only separates
+# values when whitespace follows it.
+_NUMBER = r"-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?"
+_NUMBER_RUN = re.compile(rf"{_NUMBER}(?:(?:\s*,\s+|\s*;\s*|\s+){_NUMBER}){{2,}}")
+
+
+def extract_series(text: str) -> Dict[str, List[float]]:
+    """
+    Find runs of three or more numbers in free text, e.g. a prompt that lists
+    monthly sales. Each run becomes a series named by its position.
+    """
+    series = {}
+    for match in _NUMBER_RUN.finditer(text or ""):
+        values = [
+            float(value.replace(",", ""))
+            for value in re.findall(_NUMBER, match.group(0))
+        ]
+        series[f"series {len(series) + 1}"] = values
+    return series
+
+
+def prepare_series(
+    series: Dict, max_lookback: int, min_data_points: int
+) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """
+    Clean the supplied series: drop missing values, keep the last max_lookback points
+    and set aside those with fewer than min_data_points.
+    Returns (usable series, reasons for the skipped ones).
+    """
+    ready, skipped = {}, {}
+    for name, values in list((series or {}).items())[:MAX_SERIES]:
+        try:
+            array = np.asarray(values, dtype=float).ravel()
+        except (TypeError, ValueError):
+            skipped[str(name)] = "values are not numeric"
+            continue
+        array = array[np.isfinite(array)][-int(max_lookback) :]
+        if array.size < max(int(min_data_points), 3):
+            skipped[str(name)] = (
+                f"{array.size} data points, at least {min_data_points} are needed"
+            )
+            continue
+        ready[str(name)] = array
+    return ready, skipped
+
+
+def _moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Centered moving average along the last axis, NaN where the window does not fit.
+    Even windows use the usual 2 x window average so the result stays centered.
+    """
+    if window % 2 == 0:
+        kernel = np.r_[0.5, np.ones(window - 1), 0.5] / window
+    else:
+        kernel = np.ones(window) / window
+    half = len(kernel) // 2
+    windows = np.lib.stride_tricks.sliding_window_view(values, len(kernel), axis=1)
+    result = np.full(values.shape, np.nan)
+    result[:, half : values.shape[1] - half] = windows @ kernel
+    return result
+
+
+def decompose(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Classical additive decomposition of a (series, time) array.
+    Returns the seasonal indices, shape (series, period), centered on zero;
+    zeros when the series are too short to hold two full seasons.
+    """
+    count, length = values.shape
+    if period < 2 or length < 2 * period:
+        return np.zeros((count, max(period, 1)))
+    detrended = values - _moving_average(values, period)
+    phases = np.arange(length) % period
+    seasonal = np.stack(
+        [np.nanmean(detrended[:, phases == phase], axis=1) for phase in range(period)],
+        axis=1,
+    )
+    return seasonal - seasonal.mean(axis=1, keepdims=True)
+
+
+def fit_holt(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit Holt's linear smoothing to every series for every (alpha, beta) on the grid at once
+    and keep the pair with the lowest one-step squared error per series.
+    Returns the chosen alpha, beta, final level and trend, and the one-step residuals.
+    """
+    alphas, betas = np.meshgrid(ALPHAS, BETAS, indexing="ij")
+    alphas, betas = alphas.ravel(), betas.ravel()
+    count, length = values.shape
+    grid = alphas.size
+
+    level = np.repeat(values[:, :1], grid, axis=1)
+    trend = np.repeat(values[:, 1:2] - values[:, :1], grid, axis=1)
+    residuals = np.zeros((count, grid, length - 1))
+    for t in range(1, length):
+        predicted = level + trend
+        error = values[:, t : t + 1] - predicted
+        residuals[:, :, t - 1] = error
+        new_level = predicted + alphas * error
+        trend = trend + betas * (new_level - level - trend)
+        level = new_level
+
+    best = np.argmin((residuals**2).sum(axis=2), axis=1)
+    rows = np.arange(count)
+    return {
+        "alpha": alphas[best],
+        "beta": betas[best],
+        "level": level[rows, best],
+        "trend": trend[rows, best],
+        "residuals": residuals[rows, best],
+    }
+
+
+def bootstrap_paths(
+    fit: Dict[str, np.ndarray], horizon: int, paths: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Simulate future paths by feeding resampled one-step residuals back through the
+    smoothing recursions. Returns an array of shape (series, paths, horizon).
+    """
+    count = fit["level"].shape[0]
+    alpha = fit["alpha"][:, None]
+    beta = fit["beta"][:, None]
+    level = np.repeat(fit["level"][:, None], paths, axis=1)
+    trend = np.repeat(fit["trend"][:, None], paths, axis=1)
+    residuals = fit["residuals"]
+    draws = rng.integers(0, residuals.shape[1], (count, paths, horizon))
+    shocks = residuals[np.arange(count)[:, None, None], draws]
+    simulated = np.empty((count, paths, horizon))
+    for h in range(horizon):
+        predicted = level + trend
+        simulated[:, :, h] = predicted + shocks[:, :, h]
+        new_level = predicted + alpha * shocks[:, :, h]
+        trend = trend + beta * (new_level - level - trend)
+        level = new_level
+    return simulated
+
+
+def _round(values) -> List[float]:
+    return [float(f"{value:.6g}") for value in np.asarray(values).ravel()]
+
+
+def forecast_series(
+    series: Dict, parameters: Optional[Dict] = None, seed: int = 0
+) -> Dict:
+    """
+    Forecast every usable series with the heuristic's parameters.
+    Returns the per-series forecasts with lower and upper interval bounds, plus the
+    series that were skipped and why. Same inputs and seed, same numbers.
+    """
+    started = time.perf_counter()
+    settings = {**DEFAULT_PARAMETERS, **(parameters or {})}
+    horizon = max(1, int(settings["forecast_horizon"]))
+    confidence = float(settings["confidence_interval"])
+    period = int(settings["seasonality_period"])
+    rng = np.random.default_rng(seed)
+
+    ready, skipped = prepare_series(
+        series, settings["max_lookback"], settings["min_data_points"]
+    )
+    forecasts = {}
+    # Equal-length series share one array
+    by_length: Dict[int, List[str]] = {}
+    for name, values in ready.items():
+        by_length.setdefault(values.size, []).append(name)
+
+    for length, names in by_length.items():
+        values = np.stack([ready[name] for name in names])
+        seasonal = decompose(values, period)
+        has_season = bool(np.any(seasonal))
+        width = seasonal.shape[1]
+        adjusted = values - seasonal[:, np.arange(length) % width]
+
+        fit = fit_holt(adjusted)
+        paths = bootstrap_paths(fit, horizon, BOOTSTRAP_PATHS, rng)
+        future_season = seasonal[:, np.arange(length, length + horizon) % width]
+        steps = np.arange(1, horizon + 1)
+        point = fit["level"][:, None] + fit["trend"][:, None] * steps + future_season
+        tail = (1 - confidence) / 2
+        lower, upper = np.quantile(paths, [tail, 1 - tail], axis=1)
+        lower, upper = lower + future_season, upper + future_season
+        rmse = np.sqrt((fit["residuals"] ** 2).mean(axis=1))
+
+        for row, name in enumerate(names):
+            forecasts[name] = {
+                "points_used": length,
+                "last_value": _round(values[row, -1])[0],
+                "seasonal": has_season,
+                "seasonal_indices": _round(seasonal[row]) if has_season else [],
+                "alpha": round(float(fit["alpha"][row]), 2),
+                "beta": round(float(fit["beta"][row]), 2),
+                "trend_per_step": _round(fit["trend"][row])[0],
+                "one_step_rmse": _round(rmse[row])[0],
+                "forecast": _round(point[row]),
+                "lower": _round(lower[row]),
+                "upper": _round(upper[row]),
+            }
+
+    return {
+        "horizon": horizon,
+        "confidence_interval": confidence,
+        "seasonality_period": period,
+        "seed": seed,
+        "forecasts": forecasts,
+        "skipped": skipped,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def run_forecast(world_state: Dict, parameters: Dict, seed: int) -> Optional[Dict]:
+    """
+    Local engine entry point: forecast the series supplied with the request, or those
+    found in the prompt. Returns None when there is no data to forecast.
+    """
+    series = world_state.get("series") or extract_series(
+        world_state.get("original_prompt", "")
+    )
+    if not series:
+        return None
+    results = forecast_series(series, parameters, seed)
+    logger.info(
+        f"Forecast {len(results['forecasts'])} series "
+        f"({len(results['skipped'])} skipped) in {results['elapsed_ms']}ms"
+    )
+    return {"engine": "time_series_forecast", **results}
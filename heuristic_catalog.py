@@ -0,0 +1,370 @@
+# heuristic_catalog.py
+# Loads heuristics.json once, validates it and precomputes everything the routing and prompts need:
+# the characteristics listing, a prompt fragment per heuristic and a shortcode/alias index.
+# The registry can reload the file at runtime; each reload is a new immutable catalog version.
+
+import os
+import re
+import json
+import hashlib
+import logging
+import time
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+HEURISTICS_PATH = os.environ.get(
+    "HEURISTICS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "heuristics.json"),
+)
+# Old versions are kept so sessions started before a reload stay on their catalog
+RETAINED_VERSIONS = int(os.environ.get("HEURISTICS_RETAINED_VERSIONS", 10))
+
+
+def _digest(value) -> str:
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class HeuristicCatalog:
+    """
+    Immutable, validated view of the heuristics catalog.
+    The version is a hash of the source file, so anything derived from the catalog can be keyed by it.
+    """
+
+    def __init__(self, data: Dict, version: str):
+        self.version = version
+        heuristics = self._validate(data)
+        self.heuristics = MappingProxyType(heuristics)
+        self.names = MappingProxyType(
+            {
+                heuristic_id: details["name"]
+                for heuristic_id, details in heuristics.items()
+            }
+        )
+        self.names_text = "Available heuristics:\n" + "\n".join(
+            f"- {details['name']} (ID: {heuristic_id})"
+            for heuristic_id, details in heuristics.items()
+        )
+        self.characteristics_text = (
+            "Available heuristics and characteristics:\n"
+            + "\n".join(
+                f"- {details['name']} (ID: {heuristic_id})"
+                f"  Description: {details['description']}"
+                for heuristic_id, details in heuristics.items()
+            )
+            + "\n"
+        )
+        # Per-heuristic fingerprints tell a reload exactly which heuristics changed
+        self.fingerprints = MappingProxyType(
+            {
+                heuristic_id: _digest(details)
+                for heuristic_id, details in heuristics.items()
+            }
+        )
+        # Covers only what the routing and parsing prompts see, so editing a rule
+        # or parameter does not invalidate routing results for other heuristics
+        self.routing_version = _digest(
+            [
+                [heuristic_id, details["name"], details["description"]]
+                + sorted(details.get("aliases", []))
+                + sorted(details.get("keywords", []))
+                for heuristic_id, details in heuristics.items()
+            ]
+        )
+        self._fragments = {
+            heuristic_id: self._build_fragment(heuristic_id, details)
+            for heuristic_id, details in heuristics.items()
+        }
+        self._shortcodes = self._build_shortcode_index(heuristics)
+        # One alternation of every shortcode, longest first, matched as a whole word
+        self._shortcode_pattern = re.compile(
+            r"(?<!\S)/("
+            + "|".join(
+                re.escape(code)
+                for code in sorted(self._shortcodes, key=len, reverse=True)
+            )
+            + r")(?=$|[\s.,;:!?])",
+            re.IGNORECASE,
+        )
+
+    @classmethod
+    def from_file(cls, path: str = HEURISTICS_PATH) -> "HeuristicCatalog":
+        with open(path, "rb") as f:
+            raw = f.read()
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format in {path}: {e}")
+        return cls(data, hashlib.sha256(raw).hexdigest()[:16])
+
+    def changed_since(self, previous: "HeuristicCatalog") -> Set[str]:
+        """
+        Ids of heuristics that were added, removed or edited relative to an older catalog.
+        """
+        ids = set(self.fingerprints) | set(previous.fingerprints)
+        return {
+            heuristic_id
+            for heuristic_id in ids
+            if self.fingerprints.get(heuristic_id)
+            != previous.fingerprints.get(heuristic_id)
+        }
+
+    def __contains__(self, heuristic_id: str) -> bool:
+        return heuristic_id in self.heuristics
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self.heuristics)
+
+    def get(self, heuristic_id: str) -> Optional[Dict]:
+        return self.heuristics.get(heuristic_id)
+
+    def name(self, heuristic_id: str) -> str:
+        return self.names[heuristic_id]
+
+    def parameters(self, heuristic_id: str) -> Dict:
+        """
+        Numeric parameters for a heuristic, or an empty dict where they are inherited from the query.
+        """
+        details = self.heuristics.get(heuristic_id)
+        if not details or not isinstance(details.get("parameters"), dict):
+            return {}
+        return dict(details["parameters"])
+
+    def history_budget(self, heuristic_id: str) -> Dict:
+        """
+        Conversation history limits for a heuristic, from the history_* parameters.
+        Missing values are left to the history manager's defaults.
+        """
+        parameters = self.parameters(heuristic_id)
+        budget = {}
+        if "history_turns" in parameters:
+            budget["max_turns"] = parameters["history_turns"]
+        if "history_summary_tokens" in parameters:
+            budget["summary_max_tokens"] = parameters["history_summary_tokens"]
+        return budget
+
+    def execution_budget(self, heuristic_id: Optional[str]) -> Dict:
+        """
+        Time and retry limits for work done under a heuristic, from its timeout_seconds
+        and max_retries parameters. Missing values are left to the deadline defaults.
+        """
+        parameters = self.parameters(heuristic_id) if heuristic_id else {}
+        return {
+            key: parameters[key]
+            for key in ("max_retries", "timeout_seconds")
+            if key in parameters
+        }
+
+    def prompt_fragment(self, heuristic_id: str) -> str:
+        return self._fragments.get(heuristic_id, "")
+
+    def find_shortcode(self, message: str) -> Optional[str]:
+        """
+        Return the heuristic id for the first /shortcode or /alias in the message.
+        """
+        if not message:
+            return None
+        match = self._shortcode_pattern.search(message)
+        if match is None:
+            return None
+        return self._shortcodes[match.group(1).lower()]
+
+    def resolve(self, code: str) -> Optional[str]:
+        """
+        Return the heuristic id for a single id or alias, with or without its slash.
+        """
+        return self._shortcodes.get(code.lstrip("/").lower())
+
+    @staticmethod
+    def _validate(data: Dict) -> Dict:
+        if not isinstance(data, dict) or not isinstance(data.get("heuristics"), dict):
+            raise ValueError("Heuristics catalog must contain a 'heuristics' object")
+
+        heuristics = {}
+        for heuristic_id, details in data["heuristics"].items():
+            if not re.fullmatch(r"[a-z0-9_]+", heuristic_id):
+                raise ValueError(f"Invalid heuristic id: {heuristic_id}")
+            if not isinstance(details, dict):
+                raise ValueError(f"Heuristic {heuristic_id} must be an object")
+            for field in ("name", "description"):
+                if not isinstance(details.get(field), str):
+                    raise ValueError(f"Heuristic {heuristic_id} is missing '{field}'")
+            rules = details.get("rules")
+            if isinstance(rules, dict):
+                for field in ("must_do", "must_not_do"):
+                    if not isinstance(rules.get(field, []), list):
+                        raise ValueError(
+                            f"Heuristic {heuristic_id} rules.{field} must be a list"
+                        )
+            for field in ("aliases", "keywords"):
+                if not isinstance(details.get(field, []), list):
+                    raise ValueError(f"Heuristic {heuristic_id} {field} must be a list")
+            heuristics[heuristic_id] = details
+        return heuristics
+
+    @staticmethod
+    def _build_shortcode_index(heuristics: Dict) -> Dict[str, str]:
+        index = {}
+        for heuristic_id, details in heuristics.items():
+            for code in [heuristic_id, *details.get("aliases", [])]:
+                code = code.lower()
+                if index.get(code, heuristic_id) != heuristic_id:
+                    raise ValueError(
+                        f"Shortcode '{code}' is used by both {index[code]} and {heuristic_id}"
+                    )
+                index[code] = heuristic_id
+        return index
+
+    @staticmethod
+    def _build_fragment(heuristic_id: str, details: Dict) -> str:
+        lines = [
+            f"Heuristic: {details['name']} (ID: {heuristic_id})",
+            f"Description: {details['description']}",
+        ]
+
+        parameters = details.get("parameters")
+        if isinstance(parameters, dict):
+            lines.append("Parameters:")
+            # history_* parameters configure the app, not the model
+            lines.extend(
+                f"- {key}: {value}"
+                for key, value in parameters.items()
+                if not key.startswith("history_")
+            )
+        elif parameters:
+            lines.append(f"Parameters: {parameters}")
+
+        rules = details.get("rules")
+        if isinstance(rules, dict):
+            lines.append("Must do:")
+            lines.extend(f"- {rule}" for rule in rules.get("must_do", []))
+            lines.append("Must not do:")
+            lines.extend(f"- {rule}" for rule in rules.get("must_not_do", []))
+        elif rules:
+            lines.append(f"Rules: {rules}")
+
+        return "\n".join(lines)
+
+
+class CatalogRegistry:
+    """
+    Holds the current catalog plus recent versions.
+    A reload builds a complete new catalog before swapping the reference, so readers
+    always see either the old or the new version and never a partial one.
+    """
+
+    def __init__(self, path: str = HEURISTICS_PATH, retained: int = RETAINED_VERSIONS):
+        self.path = path
+        self.retained = retained
+        self._current: Optional[HeuristicCatalog] = None
+        self._versions: "OrderedDict[str, HeuristicCatalog]" = OrderedDict()
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+        self._mtime = None
+
+    def current(self) -> HeuristicCatalog:
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._install(self._load())
+        return self._current
+
+    def get(self, version: Optional[str] = None) -> HeuristicCatalog:
+        """
+        Return a pinned catalog version, falling back to the current one
+        if that version is unknown (for example after a restart).
+        """
+        if version is not None:
+            catalog = self._versions.get(version)
+            if catalog is not None:
+                return catalog
+            logger.debug(f"Catalog version {version} not retained, using current")
+        return self.current()
+
+    def on_reload(self, listener: Callable) -> None:
+        """
+        Register listener(new_catalog, previous_catalog, changed_ids), called after each swap.
+        """
+        self._listeners.append(listener)
+
+    def reload(self) -> Dict:
+        """
+        Re-read the catalog file and swap it in if it changed.
+        Raises ValueError and keeps the current catalog if the file is invalid.
+        """
+        catalog = self._load()
+        with self._lock:
+            previous = self._current
+            if previous is not None and previous.version == catalog.version:
+                return {"version": catalog.version, "changed": []}
+            self._install(catalog)
+
+        changed = catalog.changed_since(previous) if previous else set(catalog.ids)
+        logger.info(
+            f"Heuristics catalog reloaded: version {catalog.version}, changed {sorted(changed)}"
+        )
+        for listener in self._listeners:
+            try:
+                listener(catalog, previous, changed)
+            except Exception as e:
+                logger.error(f"Catalog reload listener failed: {e}")
+        return {"version": catalog.version, "changed": sorted(changed)}
+
+    def reload_if_modified(self) -> Optional[Dict]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.error(f"Cannot stat heuristics catalog: {e}")
+            return None
+        if self._mtime is not None and mtime == self._mtime:
+            return None
+        try:
+            return self.reload()
+        except ValueError as e:
+            logger.error(f"Heuristics catalog reload failed, keeping current: {e}")
+            self._mtime = mtime
+            return None
+
+    def watch(self, interval: float, sleep: Callable = time.sleep) -> None:
+        """
+        Poll the catalog file for changes forever. Meant to run as a background task.
+        """
+        self.current()
+        while True:
+            sleep(interval)
+            # Nothing in one poll may stop hot reload for the rest of the process
+            try:
+                self.reload_if_modified()
+            except Exception as e:
+                logger.error(f"Heuristics catalog watch failed, retrying: {e}")
+
+    def _load(self) -> HeuristicCatalog:
+        mtime = os.path.getmtime(self.path)
+        catalog = HeuristicCatalog.from_file(self.path)
+        self._mtime = mtime
+        return catalog
+
+    def _install(self, catalog: HeuristicCatalog) -> None:
+        self._versions[catalog.version] = catalog
+        self._versions.move_to_end(catalog.version)
+        while len(self._versions) > self.retained:
+            self._versions.popitem(last=False)
+        self._current = catalog
+        logger.info(
+            f"Loaded {len(catalog.heuristics)} heuristics (version {catalog.version})"
+        )
+
+
+registry = CatalogRegistry()
+
+
+def get_catalog(version: Optional[str] = None) -> HeuristicCatalog:
+    """
+    Return the current catalog, or a specific retained version for pinned sessions.
+    """
+    return registry.get(version)
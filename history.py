@@ -0,0 +1,177 @@
+# history.py
+# Keeps simulation conversation history bounded: the opening scenario exchange and the last N turns
+# are sent verbatim, and older turns are folded into a running summary generated in the background.
+
+import os
+import logging
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from deadlines import current_deadline, deadline_scope
+from llm_gateway import create_message
+from model_tiers import model_for, timed_call
+from prompts import conversation_messages
+from rate_limiter import current_call_context, llm_call_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", 10))
+DEFAULT_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", 600))
+
+SUMMARY_PREFIX = "Summary of earlier simulation turns (condensed to save context):"
+SUMMARY_ACK = "Understood. Continuing the simulation from that state."
+
+# Summaries are produced off the request path on a small dedicated pool
+summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+def summarize_turns(summary: str, turns: List[Dict], max_tokens: int) -> str:
+    """
+    Fold a block of turns into the existing running summary with a small, fast model.
+    """
+    transcript = "\n\n".join(
+        f"{message['role'].upper()}: {message['content']}" for message in turns
+    )
+    with timed_call("summary", "fast"):
+        response = create_message(
+            model=model_for("summary", "fast"),
+            max_tokens=max_tokens,
+            system=(
+                "You maintain the running state summary of a WorldSIM simulation. "
+                "Merge the new turns into the existing summary. Keep every decision, "
+                "state change, number, actor and open question the simulation depends on. "
+                "Drop formatting and repetition. Respond with the updated summary only."
+            ),
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"Existing summary:\n{summary or 'None yet.'}\n\nNew turns:\n{transcript}",
+                }
+            ],
+        )
+    return response.content[0].text.strip()
+
+
+class ConversationHistory:
+    """
+    Conversation history with a fixed verbatim window.
+    The opening exchange (the scenario and first response) is always kept; once more than
+    max_turns later exchanges accumulate, the oldest ones are summarized in the background
+    and dropped when the summary is ready. Until then they are simply sent verbatim.
+    """
+
+    def __init__(
+        self,
+        messages: Optional[List[Dict]] = None,
+        summary: str = "",
+        summarized: int = 0,
+        max_turns: int = DEFAULT_HISTORY_TURNS,
+        summary_max_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        summarize: Callable = summarize_turns,
+        executor=summary_executor,
+    ):
+        messages = list(messages or [])
+        self.opening = messages[:2]
+        self.recent = messages[2:]
+        self.summary = summary or ""
+        # Number of messages after the opening exchange that the summary covers
+        self.summarized = int(summarized or 0)
+        self.max_turns = max(1, int(max_turns))
+        self.summary_max_tokens = int(summary_max_tokens)
+        self._summarize = summarize
+        self._executor = executor
+        self._pending: Optional[Future] = None
+        self._pending_count = 0
+        self._lock = threading.Lock()
+
+    def messages(self) -> List[Dict]:
+        """
+        Every message still held verbatim, oldest first.
+        """
+        return self.opening + self.recent
+
+    def __len__(self) -> int:
+        return len(self.opening) + len(self.recent)
+
+    @property
+    def message_count(self) -> int:
+        """
+        Messages in the whole conversation, including those folded into the summary.
+        This is also the sequence number the next message will get.
+        """
+        return len(self.opening) + self.summarized + len(self.recent)
+
+    def append(self, user_message: Dict, assistant_message: Dict) -> None:
+        if len(self.opening) < 2:
+            self.opening.extend([user_message, assistant_message])
+        else:
+            self.recent.extend([user_message, assistant_message])
+        self._maybe_fold()
+
+    def request_messages(self, new_message: Dict) -> List[Dict]:
+        """
+        Messages to send for the next turn: opening exchange, running summary, recent turns.
+        """
+        self._apply_summary()
+        history = list(self.opening)
+        if self.summary:
+            history += [
+                {"role": "user", "content": f"{SUMMARY_PREFIX}\n{self.summary}"},
+                {"role": "assistant", "content": SUMMARY_ACK},
+            ]
+        return conversation_messages(history + self.recent, new_message)
+
+    def _maybe_fold(self) -> None:
+        with self._lock:
+            if self._pending is not None:
+                return
+            overflow = len(self.recent) - 2 * self.max_turns
+            if overflow <= 0:
+                return
+            # Fold whole exchanges only, so the verbatim window always starts with a user turn
+            count = overflow + overflow % 2
+            turns = self.recent[:count]
+            self._pending_count = count
+            self._pending = self._submit(self.summary, turns, self.summary_max_tokens)
+            logger.debug(f"Summarizing {count // 2} older turns in the background")
+
+    def _submit(self, *args) -> Future:
+        """
+        Run the summary charged to the caller's user in the rate limiter, under the
+        budget of the turn that triggered it. The summary outlives the turn, so it gets
+        a fresh deadline rather than the turn's remaining time, and it reports no queue
+        positions since nobody is waiting on it.
+        """
+        call = current_call_context()
+        deadline = current_deadline()
+        budget = (
+            {"timeout_seconds": deadline.seconds, "max_retries": deadline.max_retries}
+            if deadline is not None
+            else None
+        )
+
+        def run():
+            with (
+                llm_call_context(user=call["user"], weight=call["weight"]),
+                deadline_scope(label="history summary", budget=budget),
+            ):
+                return self._summarize(*args)
+
+        return self._executor.submit(contextvars.Context().run, run)
+
+    def _apply_summary(self) -> None:
+        with self._lock:
+            if self._pending is None or not self._pending.done():
+                return
+            future, count = self._pending, self._pending_count
+            self._pending = None
+            try:
+                self.summary = future.result()
+                del self.recent[:count]
+                self.summarized += count
+            except Exception as e:
+                # Keep the turns verbatim and try again after the next turn
+                logger.error(f"History summarization failed: {e}")
+        self._maybe_fold()
@@ -0,0 +1,297 @@
+# llm_gateway.py
+# Shared entry point for every LLM call made by the app.
+# Calls run on a bounded worker pool so a slow completion never stalls the Socket.IO worker,
+# and the client comes from the provider registry, built on first use instead of at import.
+# Every call first waits for capacity in the shared rate limiter, and 429s are retried with backoff.
+# Calls made under a deadline (see deadlines.py) get the remaining time as their timeout.
+
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from prompts import cache_report
+from rate_limiter import RateLimiter, current_call_context, limiter as shared_limiter
+from deadlines import DEFAULT_MAX_RETRIES, Deadline, current_deadline
+from providers import get_client
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", 16))
+RATE_LIMIT_RETRIES = int(os.environ.get("LLM_RATE_LIMIT_RETRIES", 4))
+BACKOFF_SECONDS = float(os.environ.get("LLM_BACKOFF_SECONDS", 1.0))
+MAX_BACKOFF_SECONDS = 60.0
+# How long a caller waits past its deadline for the pool call to give up on its own
+RESULT_GRACE_SECONDS = 1.0
+
+
+def retry_delay(error, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a rate-limited call: the provider's retry-after
+    header when present, otherwise exponential backoff with jitter.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None:
+        return min(retry_after, MAX_BACKOFF_SECONDS)
+    delay = BACKOFF_SECONDS * 2**attempt
+    return min(delay * random.uniform(0.5, 1.5), MAX_BACKOFF_SECONDS)
+
+
+class LLMGateway:
+    """
+    Runs Anthropic message calls on a bounded pool of workers.
+    Under the eventlet worker the pool threads are green threads, so waiting
+    on a result yields to the other sockets instead of blocking them.
+    Calls wait for rate limiter capacity in the caller, before taking a pool worker,
+    so one user's backlog never occupies the pool ahead of other users.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = LLM_MAX_WORKERS,
+        limiter: Optional[RateLimiter] = shared_limiter,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self._sleep = sleep
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llm"
+        )
+        self._client = None
+        self._stats_lock = threading.Lock()
+        self.prompt_stats = {
+            "calls": 0,
+            "estimated_cached_tokens": 0,
+            "estimated_uncached_tokens": 0,
+            "input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client("anthropic")
+        return self._client
+
+    def submit(self, **kwargs) -> Future:
+        """
+        Wait for rate limiter capacity, then queue a messages.create call and
+        return a future for the response.
+        """
+        deadline = current_deadline()
+        grant = self._acquire(kwargs, deadline)
+        return self._executor.submit(self._create, kwargs, grant, deadline)
+
+    def create(self, **kwargs):
+        """
+        Run a messages.create call on the pool and wait for the response.
+        """
+        deadline = current_deadline()
+        grant = self._acquire(kwargs, deadline)
+        future = self._executor.submit(self._create, kwargs, grant, deadline)
+        return self._result(future, deadline)
+
+    def stream(self, on_text, **kwargs):
+        """
+        Stream a messages call on the pool, passing each text delta to on_text,
+        and return the final message once the stream completes.
+        """
+        deadline = current_deadline()
+        grant = self._acquire(kwargs, deadline)
+        future = self._executor.submit(self._stream, on_text, kwargs, grant, deadline)
+        return self._result(future, deadline)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self.prompt_stats)
+
+    def _result(self, future: Future, deadline: Optional[Deadline]):
+        """
+        Wait for a pool call, but never past the caller's deadline. The call itself
+        carries the same timeout, so its worker is released shortly after.
+        """
+        if deadline is None:
+            return future.result()
+        try:
+            return future.result(timeout=deadline.remaining() + RESULT_GRACE_SECONDS)
+        except FutureTimeoutError:
+            future.cancel()
+            raise deadline.exceeded()
+
+    def _acquire(self, kwargs, deadline: Optional[Deadline] = None):
+        """
+        Wait in the rate limiter's fair queue on behalf of the current call context.
+        The call is charged its estimated input plus max_tokens and settled on completion.
+        """
+        if deadline is not None:
+            deadline.check()
+        report = self._record_estimate(kwargs)
+        if self.limiter is None:
+            return None
+        context = current_call_context()
+        try:
+            return self.limiter.acquire(
+                report["input_tokens"] + int(kwargs.get("max_tokens") or 0),
+                user=context["user"],
+                weight=context["weight"],
+                on_position=context["on_position"],
+                timeout=deadline.remaining() if deadline is not None else None,
+            )
+        except TimeoutError:
+            if deadline is None:
+                raise
+            raise deadline.exceeded()
+
+    def _with_retries(
+        self,
+        call,
+        kwargs,
+        grant,
+        deadline: Optional[Deadline],
+        can_retry: Callable[[], bool] = lambda: True,
+    ):
+        """
+        Run call(kwargs) with the time left before the deadline as its timeout.
+        429s are retried up to LLM_RATE_LIMIT_RETRIES times and pause the shared limiter,
+        so other queued calls back off too; connection errors, timeouts and server errors
+        are retried up to the deadline's max_retries. No retry outlives the deadline,
+        and nothing is retried once can_retry() is false.
+        """
+        # Only needed once a call is made; importing the SDK is slow
+        import anthropic
+
+        max_retries = (
+            deadline.max_retries if deadline is not None else DEFAULT_MAX_RETRIES
+        )
+        rate_limited = failed = 0
+        while True:
+            request = dict(kwargs)
+            if deadline is not None:
+                deadline.check()
+                request["timeout"] = min(
+                    deadline.remaining(), kwargs.get("timeout") or float("inf")
+                )
+            try:
+                response = call(request)
+                break
+            except anthropic.RateLimitError as e:
+                if rate_limited >= RATE_LIMIT_RETRIES or not can_retry():
+                    raise
+                delay = retry_delay(e, rate_limited)
+                rate_limited += 1
+                logger.warning(
+                    f"Rate limited by the provider, retry {rate_limited} in {delay:.1f}s"
+                )
+                if self.limiter is not None:
+                    self.limiter.pause(delay)
+            except (anthropic.APIConnectionError, anthropic.InternalServerError) as e:
+                if deadline is not None and deadline.expired:
+                    raise deadline.exceeded()
+                if failed >= max_retries or not can_retry():
+                    raise
+                delay = retry_delay(e, failed)
+                failed += 1
+                logger.warning(f"LLM call failed ({e}), retry {failed} in {delay:.1f}s")
+            if deadline is not None and delay >= deadline.remaining():
+                raise deadline.exceeded()
+            self._sleep(delay)
+        self._record_usage(response, grant)
+        return response
+
+    def _create(self, kwargs, grant=None, deadline=None):
+        logger.debug(f"LLM call to {kwargs.get('model')}")
+        return self._with_retries(
+            lambda request: self.client.messages.create(**request),
+            kwargs,
+            grant,
+            deadline,
+        )
+
+    def _stream(self, on_text, kwargs, grant=None, deadline=None):
+        logger.debug(f"Streaming LLM call to {kwargs.get('model')}")
+
+        sent = False
+
+        def call(request):
+            nonlocal sent
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    # The request timeout bounds each read, not the whole stream
+                    if deadline is not None and deadline.expired:
+                        raise deadline.exceeded()
+                    on_text(text)
+                    sent = True
+                return stream.get_final_message()
+
+        # Text the caller has already forwarded cannot be taken back, so a stream that
+        # fails part way is raised rather than replayed from the start
+        return self._with_retries(
+            call, kwargs, grant, deadline, can_retry=lambda: not sent
+        )
+
+    def _record_estimate(self, kwargs):
+        report = cache_report(
+            kwargs.get("system"), kwargs.get("messages", []), kwargs.get("tools")
+        )
+        logger.debug(
+            f"Prompt estimate: {report['cached_tokens']} cached / "
+            f"{report['uncached_tokens']} uncached tokens "
+            f"({report['cached_share']:.0%} cacheable)"
+        )
+        with self._stats_lock:
+            self.prompt_stats["calls"] += 1
+            self.prompt_stats["estimated_cached_tokens"] += report["cached_tokens"]
+            self.prompt_stats["estimated_uncached_tokens"] += report["uncached_tokens"]
+        return report
+
+    def _record_usage(self, response, grant=None):
+        # Actual figures reported by the provider, when available
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        if grant is not None and self.limiter is not None:
+            used = sum(
+                getattr(usage, field, None) or 0
+                for field in (
+                    "input_tokens",
+                    "output_tokens",
+                    "cache_read_input_tokens",
+                    "cache_creation_input_tokens",
+                )
+            )
+            self.limiter.settle(grant, used)
+        with self._stats_lock:
+            for field in (
+                "input_tokens",
+                "cache_read_input_tokens",
+                "cache_creation_input_tokens",
+            ):
+                self.prompt_stats[field] += getattr(usage, field, None) or 0
+
+
+gateway = LLMGateway()
+
+
+def create_message(**kwargs):
+    """
+    Drop-in replacement for client.messages.create that goes through the shared gateway.
+    """
+    return gateway.create(**kwargs)
+
+
+def stream_message(on_text, **kwargs):
+    """
+    Streaming counterpart of create_message. Returns the final message.
+    """
+    return gateway.stream(on_text, **kwargs)
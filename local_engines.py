@@ -0,0 +1,72 @@
+# local_engines.py
+# Numeric work the server does itself before a simulation starts. Heuristics with a local
+# engine get their numbers computed here, deterministically, and stored in the session's
+# world_state; the simulator is then asked to interpret those numbers rather than invent them.
+
+import logging
+from typing import Callable, Dict, Optional
+
+from heuristic_catalog import HeuristicCatalog
+from deadlines import DeadlineExceeded
+from agent_engine import run_agent_simulation
+from forecasting import run_forecast
+from backtester import run_backtest
+
+logger = logging.getLogger(__name__)
+
+# engine(world_state, heuristic parameters, seed) -> JSON-serializable results,
+# or None when the request holds nothing for the engine to compute
+ENGINES: Dict[str, Callable[[Dict, Dict, int], Optional[Dict]]] = {
+    "multi_agent_forecast": run_agent_simulation,
+    "standard_forecast": run_forecast,
+    "trading_strategy": run_backtest,
+}
+
+# Raw inputs the engines read; the simulator only sees their results
+RAW_INPUTS = ("series", "market_data")
+
+NARRATION_NOTE = (
+    "local_results were computed by the application's deterministic engine. "
+    "Narrate and interpret these results; do not re-simulate them or change the numbers."
+)
+
+
+def run_local_engine(
+    world_state: Dict, catalog: HeuristicCatalog, seed: int
+) -> Optional[Dict]:
+    """
+    Run the local engine for the world state's heuristic and return the world state with
+    the results and narration note added, or None if the heuristic has no engine.
+    An engine failure is logged and leaves the simulation to the LLM alone.
+    """
+    world_state = world_state or {}
+    parsed_scenario = world_state.get("parsed_scenario", {})
+    heuristic = parsed_scenario.get("parameters", {}).get("heuristic")
+    engine = ENGINES.get(heuristic)
+    if engine is None or "local_results" in world_state:
+        return None
+    try:
+        results = engine(world_state, catalog.parameters(heuristic), seed)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Local engine for {heuristic} failed: {e}")
+        return None
+    if results is None:
+        return None
+    return {
+        **world_state,
+        "local_results": results,
+        "local_results_note": NARRATION_NOTE,
+    }
+
+
+def simulation_payload(world_state: Dict) -> Dict:
+    """
+    The world state as sent to the simulator, without the raw engine inputs.
+    """
+    return {
+        key: value
+        for key, value in (world_state or {}).items()
+        if key not in RAW_INPUTS
+    }
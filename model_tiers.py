@@ -0,0 +1,178 @@
+# model_tiers.py
+# Which model each pipeline stage runs on. Classification and extraction stages use a fast tier
+# and escalate to the large tier only when the fast answer is not good enough; the simulation
+# itself always runs on the large tier. Every tiered call is timed so the tiers can be compared.
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+FAST_MODEL = os.environ.get("FAST_MODEL", "claude-3-5-haiku-20241022")
+LARGE_MODEL = os.environ.get("LARGE_MODEL", "claude-3-opus-20240229")
+
+# Per-stage overrides, e.g. MODEL_ROUTING_FAST or MODEL_SIMULATION_LARGE
+STAGE_TIERS = {
+    "routing": ("fast", "large"),
+    "parsing": ("fast", "large"),
+    "agents": ("fast", "large"),
+    "strategies": ("fast",),
+    "summary": ("fast",),
+    "simulation": ("large",),
+}
+
+# Confidence the router needs when a heuristic does not set min_confidence
+DEFAULT_MIN_CONFIDENCE = float(os.environ.get("ROUTING_MIN_CONFIDENCE", 0.7))
+
+# Latency samples kept per stage and tier for the percentiles in tier_stats()
+LATENCY_WINDOW = 500
+
+
+def model_for(stage: str, tier: str = "fast") -> str:
+    """
+    Model id for a pipeline stage and tier. Stages without the requested tier use their
+    largest one.
+    """
+    tiers = STAGE_TIERS.get(stage, ("large",))
+    if tier not in tiers:
+        tier = tiers[-1]
+    default = FAST_MODEL if tier == "fast" else LARGE_MODEL
+    return os.environ.get(f"MODEL_{stage.upper()}_{tier.upper()}", default)
+
+
+class TierStats:
+    """
+    Call counts, failures, escalations and latency per (stage, tier), plus hooks that
+    receive every record, e.g. to export them to a benchmark log.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Dict] = {}
+        self._hooks: List[Callable[[Dict], None]] = []
+
+    def add_hook(self, hook: Callable[[Dict], None]) -> None:
+        self._hooks.append(hook)
+
+    def record(self, record: Dict) -> None:
+        with self._lock:
+            entry = self._entries.setdefault(
+                (record["stage"], record["tier"]),
+                {
+                    "model": record["model"],
+                    "calls": 0,
+                    "failures": 0,
+                    "escalations": 0,
+                    "latencies": deque(maxlen=LATENCY_WINDOW),
+                },
+            )
+            entry["calls"] += 1
+            entry["failures"] += 0 if record["ok"] else 1
+            entry["escalations"] += 1 if record.get("escalated") else 0
+            entry["latencies"].append(record["latency"])
+        for hook in self._hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                logger.error(f"Model tier hook failed: {e}")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            result = {}
+            for (stage, tier), entry in self._entries.items():
+                latencies = sorted(entry["latencies"])
+                result[f"{stage}.{tier}"] = {
+                    "model": entry["model"],
+                    "calls": entry["calls"],
+                    "failures": entry["failures"],
+                    "escalations": entry["escalations"],
+                    "p50_latency": _percentile(latencies, 0.5),
+                    "p95_latency": _percentile(latencies, 0.95),
+                }
+            return result
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(fraction * len(values)))
+    return round(values[index], 3)
+
+
+stats = TierStats()
+
+
+def add_benchmark_hook(hook: Callable[[Dict], None]) -> None:
+    """
+    Register hook(record) to receive every tiered call: stage, tier, model,
+    latency in seconds, ok, and escalated (whether the answer sent the stage up a tier).
+    """
+    stats.add_hook(hook)
+
+
+def tier_stats() -> Dict:
+    return stats.snapshot()
+
+
+@contextmanager
+def timed_call(stage: str, tier: str):
+    """
+    Time a tiered call. Yields the record; set record["escalated"] if the result
+    was not good enough and the stage moves up a tier. Failures are recorded too.
+    """
+    record = {
+        "stage": stage,
+        "tier": tier,
+        "model": model_for(stage, tier),
+        "ok": False,
+        "escalated": False,
+    }
+    started = time.monotonic()
+    try:
+        yield record
+        record["ok"] = True
+    finally:
+        record["latency"] = time.monotonic() - started
+        stats.record(record)
+
+
+def benchmark(
+    stage: str,
+    run: Callable[[object, str], object],
+    cases: Iterable[Tuple[object, object]],
+    tiers: Iterable[str] = ("fast", "large"),
+) -> Dict:
+    """
+    Compare tiers on labelled cases. run(case_input, model) returns the stage's answer,
+    which is scored against the expected one; failures count as wrong answers.
+    Returns accuracy and latency per tier.
+    """
+    cases = list(cases)
+    report = {}
+    for tier in tiers:
+        model = model_for(stage, tier)
+        correct = 0
+        latencies = []
+        for case_input, expected in cases:
+            started = time.monotonic()
+            try:
+                answer = run(case_input, model)
+            except Exception as e:
+                logger.error(f"Benchmark case failed on {model}: {e}")
+                answer = None
+            latencies.append(time.monotonic() - started)
+            correct += answer == expected
+        latencies.sort()
+        report[tier] = {
+            "model": model,
+            "cases": len(cases),
+            "accuracy": correct / len(cases) if cases else 0.0,
+            "mean_latency": round(sum(latencies) / len(latencies), 3) if cases else 0.0,
+            "p95_latency": _percentile(latencies, 0.95),
+        }
+    return report
@@ -3,6 +3,7 @@
 # should be remaned to session settings and config
 
 from app import db
+from sqlalchemy.dialects.postgresql import JSONB
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
@@ -38,10 +39,99 @@ class SimulationSession(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_interaction = db.Column(db.DateTime, default=datetime.utcnow)
-    world_state = db.Column(db.Text)
+    # Parsed scenario, heuristic settings and catalog version, stored as native JSON
+    world_state = db.Column(db.JSON().with_variant(JSONB, "postgresql"))
     session_settings = db.Column(db.JSON, default=lambda: {})
+    # Running summary of the turns folded out of the verbatim history window
+    history_summary = db.Column(db.Text)
+    summarized_turns = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index("ix_simulation_session_user_started", "user_id", "started_at"),
+    )
 
     def initialize_session_settings(self, user):
-        self.session_settings = user.user_settings.copy()
+        # The caller commits, so the session and its settings are written together
+        self.session_settings = dict(user.user_settings or {})
         self.session_settings["first_message"] = False
-        db.session.commit()
+
+
+class SimulationTurn(db.Model):
+    """
+    One message of a simulation conversation. Rows are append-only and ordered by seq
+    within a session, so any window of the conversation is a single indexed range read.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(
+        db.Integer, db.ForeignKey("simulation_session.id"), nullable=False
+    )
+    seq = db.Column(db.Integer, nullable=False)
+    role = db.Column(db.String(16), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_simulation_turn_session_seq", "session_id", "seq", unique=True),
+    )
+
+    def to_message(self):
+        return {"role": self.role, "content": self.content}
+
+    @classmethod
+    def append(cls, session_id, messages, start_seq):
+        """
+        Add messages to a session starting at start_seq. The caller commits.
+        """
+        for offset, message in enumerate(messages):
+            db.session.add(
+                cls(
+                    session_id=session_id,
+                    seq=start_seq + offset,
+                    role=message["role"],
+                    content=message["content"],
+                )
+            )
+
+    @classmethod
+    def next_seq(cls, session_id):
+        """
+        Sequence number the next message of the session will get, from the seq index.
+        """
+        last = (
+            db.session.query(db.func.max(cls.seq))
+            .filter(cls.session_id == session_id)
+            .scalar()
+        )
+        return 0 if last is None else last + 1
+
+    @classmethod
+    def load_page(cls, session_id, after_seq=-1, before_seq=None, limit=50):
+        """
+        Load up to limit turns with after_seq < seq < before_seq, in seq order.
+        """
+        query = cls.query.filter(cls.session_id == session_id, cls.seq > after_seq)
+        if before_seq is not None:
+            query = query.filter(cls.seq < before_seq)
+        return query.order_by(cls.seq).limit(limit).all()
+
+    @classmethod
+    def load_range(cls, session_id, after_seq=-1, page_size=200):
+        """
+        Load every turn after after_seq, one page at a time.
+        """
+        turns = []
+        while True:
+            page = cls.load_page(session_id, after_seq=after_seq, limit=page_size)
+            turns.extend(page)
+            if len(page) < page_size:
+                return turns
+            after_seq = page[-1].seq
+
+
+class ScenarioCacheEntry(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    heuristic = db.Column(db.String(64), index=True)
+    value = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,259 @@
+# pre_router.py
+# Routes clear-cut scenarios to a heuristic locally, without an LLM call.
+# Each heuristic's name, description, aliases, keywords and rules are turned into a TF-IDF vector
+# of hashed word, word-pair and character n-grams; a prompt is scored against all of them with one
+# NumPy product, and only a clear winner short-circuits the LLM matcher.
+
+import os
+import re
+import zlib
+import logging
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from heuristic_catalog import HeuristicCatalog
+
+logger = logging.getLogger(__name__)
+
+# Set PRE_ROUTER_ENABLED=0 to send every prompt without a shortcode to the LLM matcher
+PRE_ROUTER_ENABLED = os.environ.get("PRE_ROUTER_ENABLED", "1") != "0"
+# The best heuristic must score at least this (cosine similarity)...
+MIN_SCORE = float(os.environ.get("PRE_ROUTER_MIN_SCORE", 0.1))
+# ...and beat the runner-up by this fraction of its own score
+MIN_MARGIN = float(os.environ.get("PRE_ROUTER_MIN_MARGIN", 0.35))
+
+# Size of the hashed feature space; collisions only blur scores slightly
+N_FEATURES = 2**15
+CHAR_NGRAM = 4
+
+# Weight of each part of a heuristic when building its vector
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "aliases": 3.0,
+    "keywords": 3.0,
+    "description": 2.0,
+    "rules": 1.0,
+}
+
+STOP_WORDS = frozenset("""
+    a about after all also an and any are as at be been before being between both but by
+    can could did do does doing for from had has have having he her here him his how i if
+    in into is it its itself just me more most my no nor not now of off on once only or
+    other our out over own same she should so some such than that the their them then there
+    these they this those through to too under until up very was we were what when where
+    which while who whom why will with would you your
+    """.split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def features(text: str) -> Counter:
+    """
+    Feature counts for a piece of text: words, adjacent word pairs and the character
+    n-grams of each word, so "negotiating" still overlaps with "negotiation".
+    """
+    words = [
+        word
+        for word in _WORD.findall(text.lower())
+        if word not in STOP_WORDS and len(word) > 1
+    ]
+    counts = Counter()
+    for word in words:
+        counts["w:" + word] += 1
+        padded = f"<{word}>"
+        for i in range(len(padded) - CHAR_NGRAM + 1):
+            counts["c:" + padded[i : i + CHAR_NGRAM]] += 1
+    for first, second in zip(words, words[1:]):
+        counts[f"b:{first} {second}"] += 1
+    return counts
+
+
+def _hashed(counts: Counter) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sparse (indices, sublinear term frequencies) for feature counts.
+    """
+    buckets: Dict[int, float] = {}
+    for feature, count in counts.items():
+        index = zlib.crc32(feature.encode("utf-8")) % N_FEATURES
+        buckets[index] = buckets.get(index, 0.0) + count
+    indices = np.fromiter(buckets.keys(), dtype=np.int64, count=len(buckets))
+    values = np.fromiter(buckets.values(), dtype=np.float32, count=len(buckets))
+    return indices, 1.0 + np.log(values)
+
+
+def heuristic_text(details: Dict) -> List[Tuple[str, float]]:
+    """
+    The (text, weight) pieces of a heuristic that describe what it is for.
+    """
+    rules = details.get("rules")
+    rule_text = ""
+    if isinstance(rules, dict):
+        rule_text = " ".join(rules.get("must_do", []) + rules.get("must_not_do", []))
+    return [
+        (details["name"], FIELD_WEIGHTS["name"]),
+        (" ".join(details.get("aliases", [])), FIELD_WEIGHTS["aliases"]),
+        (" ".join(details.get("keywords", [])), FIELD_WEIGHTS["keywords"]),
+        (details["description"], FIELD_WEIGHTS["description"]),
+        (rule_text, FIELD_WEIGHTS["rules"]),
+    ]
+
+
+def keyword_pattern(keywords: List[str]) -> Optional[re.Pattern]:
+    """
+    One pattern matching any of the keywords at the start of a word, so "nation"
+    also matches "nations"; None when there are no keywords.
+    """
+    keywords = [keyword.lower() for keyword in keywords if keyword]
+    if not keywords:
+        return None
+    alternatives = "|".join(re.escape(keyword) for keyword in keywords)
+    return re.compile(rf"\b(?:{alternatives})")
+
+
+class PreRouter:
+    """
+    Hashed TF-IDF vectors for every heuristic in one catalog version.
+    Every heuristic is scored, but only heuristics with keywords can win outright:
+    catch-all heuristics like the default agent only make a prompt look ambiguous.
+    A prompt that uses keywords of two heuristics ("negotiate a peace treaty between
+    nations") is left to the LLM matcher whatever the scores say.
+    """
+
+    def __init__(self, catalog: HeuristicCatalog):
+        self.ids = catalog.ids
+        self.routable = np.array(
+            [bool(catalog.get(h).get("keywords")) for h in self.ids], dtype=bool
+        )
+        self.keyword_patterns = [
+            keyword_pattern(catalog.get(h).get("keywords", [])) for h in self.ids
+        ]
+
+        documents = []
+        for heuristic_id in self.ids:
+            counts = Counter()
+            for text, weight in heuristic_text(catalog.get(heuristic_id)):
+                for feature, count in features(text).items():
+                    counts[feature] += count * weight
+            documents.append(_hashed(counts))
+
+        document_frequency = np.zeros(N_FEATURES, dtype=np.float32)
+        for indices, _ in documents:
+            document_frequency[indices] += 1
+        # Features no heuristic uses get the highest weight: they dilute the match
+        self.idf = (
+            np.log((1 + len(documents)) / (1 + document_frequency)) + 1.0
+        ).astype(np.float32)
+
+        self.matrix = np.zeros((len(documents), N_FEATURES), dtype=np.float32)
+        for row, (indices, values) in enumerate(documents):
+            self.matrix[row, indices] = values * self.idf[indices]
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.where(norms > 0, norms, 1.0)
+
+    def scores(self, message: str) -> np.ndarray:
+        """
+        Cosine similarity of the message to each heuristic, in catalog order.
+        """
+        indices, values = _hashed(features(message))
+        if not len(indices):
+            return np.zeros(len(self.ids), dtype=np.float32)
+        weights = values * self.idf[indices]
+        norm = float(np.linalg.norm(weights))
+        return self.matrix[:, indices] @ (weights / norm)
+
+    def keyword_matches(self, message: str) -> List[str]:
+        """
+        The heuristics whose keywords appear in the message.
+        """
+        text = message.lower()
+        return [
+            heuristic_id
+            for heuristic_id, pattern in zip(self.ids, self.keyword_patterns)
+            if pattern is not None and pattern.search(text)
+        ]
+
+    def route(
+        self,
+        message: str,
+        min_score: float = MIN_SCORE,
+        min_margin: float = MIN_MARGIN,
+    ) -> Tuple[Optional[str], float, float]:
+        """
+        Returns (heuristic id, or None if the prompt is ambiguous, best score, margin).
+        The margin is how far the best score is ahead of the runner-up, relative to the best.
+        """
+        scores = self.scores(message)
+        if len(scores) == 0:
+            return None, 0.0, 0.0
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else 0.0
+        margin = (best - runner_up) / best if best > 0 else 0.0
+        if best < min_score or margin < min_margin or not self.routable[order[0]]:
+            return None, best, margin
+        if len(self.keyword_matches(message)) > 1:
+            return None, best, margin
+        return self.ids[order[0]], best, margin
+
+
+@lru_cache(maxsize=4)
+def router_for(catalog: HeuristicCatalog) -> PreRouter:
+    """
+    The pre-router for a catalog version, built once.
+    """
+    return PreRouter(catalog)
+
+
+class PreRouterStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.fallbacks
+            return {
+                "enabled": PRE_ROUTER_ENABLED,
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+stats = PreRouterStats()
+
+
+def pre_route(message: str, catalog: HeuristicCatalog) -> Optional[str]:
+    """
+    Return the heuristic id when the message clearly matches one, or None to
+    leave the decision to the LLM matcher.
+    """
+    if not PRE_ROUTER_ENABLED or not message:
+        return None
+    heuristic, score, margin = router_for(catalog).route(message)
+    stats.record(heuristic is not None)
+    if heuristic:
+        logger.debug(
+            f"Pre-routed to {heuristic} (score {score:.3f}, margin {margin:.2f})"
+        )
+    else:
+        logger.debug(
+            f"Pre-router undecided (best score {score:.3f}, margin {margin:.2f})"
+        )
+    return heuristic
+
+
+def pre_router_stats() -> Dict:
+    return stats.snapshot()
@@ -0,0 +1,122 @@
+# prompts.py
+# Helpers for assembling prompts as stable, cacheable prefix blocks followed by volatile suffixes.
+# Stable blocks carry a cache_control marker so the provider can reuse them across calls,
+# and a rough local token estimate reports how much of each request is served from the cache.
+
+import json
+import math
+from typing import Dict, List, Optional, Union
+
+# Prompt prefixes shorter than this are not cached by the provider
+MIN_CACHEABLE_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def cached_block(text: str) -> Dict:
+    """
+    A text block that ends a cacheable prefix.
+    """
+    return {"type": "text", "text": text, "cache_control": dict(CACHE_CONTROL)}
+
+
+def text_block(text: str) -> Dict:
+    """
+    A volatile text block that is never cached.
+    """
+    return {"type": "text", "text": text}
+
+
+def with_cache_breakpoint(message: Dict) -> Dict:
+    """
+    Copy a chat message with its content marked as the end of a cacheable prefix.
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        blocks = [cached_block(content)]
+    else:
+        blocks = [dict(block) for block in content]
+        blocks[-1]["cache_control"] = dict(CACHE_CONTROL)
+    return {"role": message["role"], "content": blocks}
+
+
+def conversation_messages(history: List[Dict], new_message: Dict) -> List[Dict]:
+    """
+    Build the request messages for a conversation turn.
+    The opening scenario and the end of the existing history are marked as cache
+    breakpoints, so each turn only pays full price for the newest exchange.
+    """
+    messages = list(history)
+    if messages:
+        messages[0] = with_cache_breakpoint(messages[0])
+    if len(messages) > 1:
+        messages[-1] = with_cache_breakpoint(messages[-1])
+    messages.append(new_message)
+    return messages
+
+
+def estimate_tokens(content: Union[str, List, Dict, None]) -> int:
+    """
+    Rough token count for text or content blocks, about four characters per token.
+    """
+    if not content:
+        return 0
+    if isinstance(content, str):
+        return math.ceil(len(content) / CHARS_PER_TOKEN)
+    if isinstance(content, dict):
+        return estimate_tokens(content.get("text") or content.get("content"))
+    return sum(estimate_tokens(block) for block in content)
+
+
+def _is_breakpoint(content) -> bool:
+    if isinstance(content, dict):
+        return "cache_control" in content
+    if isinstance(content, list):
+        return any(_is_breakpoint(block) for block in content)
+    return False
+
+
+def _tool_tokens(tool: Dict) -> int:
+    """
+    Rough token count for a tool definition, which is sent as its JSON schema.
+    """
+    definition = {key: value for key, value in tool.items() if key != "cache_control"}
+    return estimate_tokens(json.dumps(definition))
+
+
+def cache_report(
+    system, messages: List[Dict], tools: Optional[List[Dict]] = None
+) -> Dict:
+    """
+    Estimate how many input tokens fall inside the cacheable prefix of a request.
+    The provider caches everything up to the last cache_control marker, in the
+    order tools, system, then messages, as long as that prefix is long enough.
+    """
+    parts = [(_tool_tokens(tool), _is_breakpoint(tool)) for tool in tools or []]
+    if isinstance(system, list):
+        parts.extend(
+            (estimate_tokens(block), _is_breakpoint(block)) for block in system
+        )
+    else:
+        parts.append((estimate_tokens(system), False))
+    for message in messages:
+        content = message.get("content")
+        parts.append((estimate_tokens(content), _is_breakpoint(content)))
+
+    total = sum(tokens for tokens, _ in parts)
+    cached = 0
+    running = 0
+    for tokens, breakpoint in parts:
+        running += tokens
+        if breakpoint:
+            cached = running
+    if cached < MIN_CACHEABLE_TOKENS:
+        cached = 0
+
+    return {
+        "input_tokens": total,
+        "cached_tokens": cached,
+        "uncached_tokens": total - cached,
+        "cached_share": cached / total if total else 0.0,
+    }
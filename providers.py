@@ -0,0 +1,84 @@
+# providers.py
+# Lazily built LLM provider clients. Importing the app must not import the provider SDKs
+# or need API keys: worker boot, migrations and the tests all import it. Each client is
+# created on first use, once per process, and a missing key is only reported then.
+
+import os
+import logging
+import threading
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def _require_key(variable: str) -> str:
+    api_key = os.environ.get(variable)
+    if not api_key:
+        raise ValueError(f"{variable} environment variable is not set")
+    return api_key
+
+
+def anthropic_client():
+    import anthropic
+
+    # Retries are handled by the gateway, within the caller's deadline
+    return anthropic.Client(api_key=_require_key("ANTHROPIC_API_KEY"), max_retries=0)
+
+
+def groq_client():
+    import groq
+
+    return groq.Client(api_key=_require_key("GROQ_API_KEY"))
+
+
+class ProviderRegistry:
+    """
+    Client factories by provider name. get() builds a client on first use and
+    returns the same instance afterwards; reset() drops it, e.g. after rotating a key.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable] = {}
+        self._clients: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._clients.pop(name, None)
+
+    def get(self, name: str):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                if name not in self._factories:
+                    raise KeyError(f"Unknown LLM provider: {name}")
+                client = self._factories[name]()
+                self._clients[name] = client
+                logger.info(f"Created {name} client")
+        return client
+
+    def reset(self, name: str = None) -> None:
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+    def created(self):
+        return sorted(self._clients)
+
+
+providers = ProviderRegistry()
+providers.register("anthropic", anthropic_client)
+providers.register("groq", groq_client)
+
+
+def get_client(name: str):
+    """
+    The shared client for a provider, created on first use.
+    """
+    return providers.get(name)
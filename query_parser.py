@@ -2,26 +2,221 @@
 # Parses the user input into a structured scenario format to send a standard format to the LLM
 # Would benefit from moving some of the logic back into the simulation.py or routing and logic file
 
+import re
 import json
 import logging
-from typing import Dict, Optional
-import os
-import anthropic
-import groq
-from utilities import list_all_heuristic_names_and_characteristics
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from llm_gateway import create_message
+from heuristic_catalog import HeuristicCatalog, get_catalog
+from prompts import cached_block, text_block
+from deadlines import DeadlineExceeded, deadline_scope
+from model_tiers import model_for, timed_call
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
-anthropic_api_key = os.environ.get("ANTHROPIC_API_KEY")
-groq_api_key = os.environ.get("GROQ_API_KEY")
-if not anthropic_api_key:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-if not groq_api_key:
-    raise ValueError("GROQ_API_KEY environment variable is not set")
 
-anthropic_client = anthropic.Client(api_key=anthropic_api_key)
-groq_client = groq.Client(api_key=groq_api_key)
-available_heuristics = list_all_heuristic_names_and_characteristics()
+SCENARIO_PARSER_INSTRUCTIONS = """
+You are a sophisticated query orchestrator that analyzes user requests and routes them to the most appropriate heuristic or analysis framework.
+
+Your primary responsibilities are:
+1. Analyze the query's domain and requirements
+2. Match it to the most appropriate heuristic from the available list
+3. Select the default reasoning agent if no clear heuristic match (confidence < 0.7)
+4. Extract and structure all relevant information
+5. Set appropriate parameters for the selected heuristic
+6. Determine the required response format and analysis depth
+
+For each query, you MUST extract:
+1. Main goal/objective
+2. Time span or time constraints
+3. Specific conditions or rules
+4. Key parameters or variables
+5. Data to include and/or exclude
+6. Assumptions specified in the query
+7. Format of response (e.g., true/false, text, confidence score, numerical range, etc.)
+
+For geopolitical scenarios, ALWAYS identify:
+- Current state of relationships
+- Intent or motivation of all concerned parties
+- Economic factors
+- Strategic implications
+- Current global context
+- Query context or assumption differing from the current global context
+
+For corporate scenarios, ALWAYS identify:
+- Stakeholder interests and positions
+- Value creation opportunities
+- Risk factors and mitigation strategies
+- Legal and regulatory considerations
+- Market dynamics and competition
+
+For financial analysis, ALWAYS identify:
+- Risk/reward ratios
+- Market conditions and trends
+- Key performance indicators
+- Regulatory requirements
+- Historical context and precedents
+
+Make educated guesses for any fields that are not explicitly stated annoting these as (*estimated*) or (*assumption*)
+Be conservative with your assumptions and estimations.
+
+Respond in JSON format with these fields. If any field cannot be determined, use "none specified" to ensure valid JSON.
+{
+    "goal": "clear statement of the main objective",
+    "constraints": ["list of time or resource constraints"],
+    "conditions": ["list of specific rules or conditions"],
+    "heuristic": "selected_heuristic_id",
+    "response_format": "specified format (e.g., true/false, text, confidence score)",
+    "parameters": {
+        "entities": ["list of involved entities"],
+        "timeline": "relevant timeframe",
+        "analysis_depth": "quick|standard|deep",
+        "data_requirements": ["list of required data points"],
+        "assumptions": ["list of key assumptions"],
+        "risk_factors": ["list of key risk factors"],
+        "validation_criteria": ["list of criteria for validating the response"]
+    }
+}
+
+Critical Guidelines:
+1. If no clear heuristic match (confidence < 0.7), select the default reasoning agent ("default_agent")
+2. ALWAYS specify the response format - this is critical for proper handling
+3. For geopolitical queries, include current context and relationship dynamics of all parties
+4. For corporate scenarios, emphasize stakeholder interests and value creation objectives
+5. For financial analysis, focus on risk/reward ratios and market conditions
+6. For forecasting, specify confidence intervals and assumptions to use
+7. For any analysis, clearly state the validation criteria and success metrics to use
+"""
+
+
+def _string_list(description: str) -> Dict:
+    return {"type": "array", "items": {"type": "string"}, "description": description}
+
+
+# The model answers by calling this tool, so the scenario arrives as a parsed object
+SCENARIO_TOOL = {
+    "name": "record_scenario",
+    "description": "Record the structured scenario extracted from the user query.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "goal": {
+                "type": "string",
+                "description": "clear statement of the main objective",
+            },
+            "constraints": _string_list("time or resource constraints"),
+            "conditions": _string_list("specific rules or conditions"),
+            "heuristic": {"type": "string", "description": "selected heuristic id"},
+            "response_format": {
+                "type": "string",
+                "description": "specified format (e.g., true/false, text, confidence score)",
+            },
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "entities": _string_list("involved entities"),
+                    "timeline": {"type": "string"},
+                    "analysis_depth": {
+                        "type": "string",
+                        "enum": ["quick", "standard", "deep"],
+                    },
+                    "data_requirements": _string_list("required data points"),
+                    "assumptions": _string_list("key assumptions"),
+                    "risk_factors": _string_list("key risk factors"),
+                    "validation_criteria": _string_list(
+                        "criteria for validating the response"
+                    ),
+                },
+            },
+        },
+        "required": [
+            "goal",
+            "constraints",
+            "conditions",
+            "heuristic",
+            "response_format",
+        ],
+    },
+}
+
+
+SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"'})
+
+
+def _close_brackets(text: str) -> str:
+    """
+    Close any string, array or object left open by a truncated response.
+    """
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r"[,:]\s*$", "", text.rstrip())
+    if stack and stack[-1] == "}":
+        # Drop a key that was cut off before its value
+        text = re.sub(r'([{,])\s*"[^"]*"$', r"\1", text)
+        text = re.sub(r",\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Dict:
+    """
+    Recover a JSON object from near-valid model output without another LLM call:
+    code fences, prose around the object, smart quotes, trailing commas and
+    truncated endings are fixed locally. Raises ValueError if nothing parses.
+    """
+    candidate = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", candidate, re.DOTALL)
+    if fenced:
+        candidate = fenced.group(1).strip()
+    start = candidate.find("{")
+    if start == -1:
+        raise ValueError("Response contains no JSON object")
+    candidate = candidate[start:]
+
+    without_trailing_commas = re.sub(r",\s*([}\]])", r"\1", candidate)
+    variants = (
+        candidate,
+        without_trailing_commas,
+        without_trailing_commas.translate(SMART_QUOTES),
+    )
+    for variant in variants:
+        end = variant.rfind("}")
+        for attempt in (variant[: end + 1], _close_brackets(variant)):
+            try:
+                value = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value
+    raise ValueError("Response is not valid JSON and could not be repaired")
+
+
+@lru_cache(maxsize=4)
+def scenario_prefix_blocks(catalog: HeuristicCatalog) -> Tuple[Dict, ...]:
+    """
+    Cacheable system prompt prefix for scenario parsing, built once per catalog version.
+    The instructions never change; the heuristic list only changes on a catalog reload.
+    """
+    return (
+        cached_block(SCENARIO_PARSER_INSTRUCTIONS),
+        cached_block(f"Available Heuristics:\n{catalog.characteristics_text}"),
+    )
 
 
 class ScenarioParser:
@@ -34,137 +229,136 @@ class ScenarioParser:
             "response_format",
         ]
 
-    def retry_parse_scenario(self, response_error: Exception, user_input: str) -> Dict:
+    def extract_scenario(self, response) -> Dict:
         """
-        Retry parsing the scenario after a JSON decode error.
-        Includes the original error and query in the retry attempt.
+        Pull the scenario out of a response: the record_scenario tool input when the model
+        used the tool, otherwise JSON text repaired locally. Raises ValueError if it is unusable.
         """
-        try:
-            input_plus_error = (
-                f"There was an error in the previous response: {str(response_error)}. "
-                f"Here is the original user query: {user_input}. "
-                "Please retry parsing taking particular care to return a properly formatted JSON response."
+        parsed = None
+        for block in response.content:
+            if getattr(block, "type", None) == "tool_use":
+                parsed = dict(block.input)
+                break
+        if parsed is None:
+            text = "".join(
+                block.text
+                for block in response.content
+                if getattr(block, "type", None) == "text"
             )
-            return self.parse_scenario(input_plus_error)
-        except Exception as e:
-            logger.error(f"Failed to retry parsing scenario: {e}")
-            raise ValueError(f"Failed to parse scenario after retry: {str(e)}")
+            parsed = repair_json(text)
+
+        missing = [field for field in self.required_fields if field not in parsed]
+        if missing:
+            raise ValueError(f"Missing required fields: {', '.join(missing)}")
+        # The display code iterates these, so a lone string becomes a one-item list
+        for field in ("constraints", "conditions"):
+            if isinstance(parsed[field], str):
+                parsed[field] = [parsed[field]]
+        return parsed
+
+    @staticmethod
+    def correction_messages(response, error: Exception) -> List[Dict]:
+        """
+        Messages that replay a rejected response and say what was wrong with it,
+        so the retry fixes that output instead of starting over.
+        """
+        content = []
+        tool_use_id = None
+        for block in response.content:
+            if getattr(block, "type", None) == "tool_use":
+                tool_use_id = block.id
+                content.append(
+                    {
+                        "type": "tool_use",
+                        "id": block.id,
+                        "name": block.name,
+                        "input": block.input,
+                    }
+                )
+            elif getattr(block, "type", None) == "text" and block.text:
+                content.append({"type": "text", "text": block.text})
 
-    def parse_scenario(self, user_input: str, retry_count: int = 0) -> Dict:
+        problem = (
+            f"{error}. Call {SCENARIO_TOOL['name']} again with every required field."
+        )
+        if tool_use_id is not None:
+            reply = [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": tool_use_id,
+                    "is_error": True,
+                    "content": problem,
+                }
+            ]
+        else:
+            reply = f"Your previous response could not be used: {problem}"
+        return [
+            {"role": "assistant", "content": content or "(empty response)"},
+            {"role": "user", "content": reply},
+        ]
+
+    def parse_scenario(self, user_input: str, heuristic: Optional[str] = None) -> Dict:
         """
         Parse user input into a structured scenario format.
         Returns a dictionary containing the parsed scenario elements.
+        Retries are bounded by the heuristic's max_retries and timeout_seconds
+        (or the deadline defaults when the heuristic is not known yet), inside any
+        deadline the caller is already running under.
         """
-        if retry_count > 2:
-            raise ValueError("Maximum retry attempts exceeded")
+        catalog = get_catalog()
+        with deadline_scope(
+            budget=catalog.execution_budget(heuristic), label="scenario parsing"
+        ) as deadline:
+            return self._parse_within(user_input, catalog, deadline)
 
-        try:
-            system_prompt = f"""
-            You are a sophisticated query orchestrator that analyzes user requests and routes them to the most appropriate heuristic or analysis framework.
-            
-            Available Heuristics:
-            {available_heuristics}
-            
-            Current Date: {datetime.now().strftime("%A %Y-%m-%d")}
-            
-            Your primary responsibilities are:
-            1. Analyze the query's domain and requirements
-            2. Match it to the most appropriate heuristic from the available list
-            3. Select the default reasoning agent if no clear heuristic match (confidence < 0.7)
-            4. Extract and structure all relevant information
-            5. Set appropriate parameters for the selected heuristic
-            6. Determine the required response format and analysis depth
-            
-            For each query, you MUST extract:
-            1. Main goal/objective
-            2. Time span or time constraints
-            3. Specific conditions or rules
-            4. Key parameters or variables
-            5. Data to include and/or exclude
-            6. Assumptions specified in the query
-            7. Format of response (e.g., true/false, text, confidence score, numerical range, etc.)
-            
-            For geopolitical scenarios, ALWAYS identify:
-            - Current state of relationships
-            - Intent or motivation of all concerned parties
-            - Economic factors
-            - Strategic implications
-            - Current global context
-            - Query context or assumption differing from the current global context
-            
-            For corporate scenarios, ALWAYS identify:
-            - Stakeholder interests and positions
-            - Value creation opportunities
-            - Risk factors and mitigation strategies
-            - Legal and regulatory considerations
-            - Market dynamics and competition
-            
-            For financial analysis, ALWAYS identify:
-            - Risk/reward ratios
-            - Market conditions and trends
-            - Key performance indicators
-            - Regulatory requirements
-            - Historical context and precedents
-
-            Make educated guesses for any fields that are not explicitly stated annoting these as (*estimated*) or (*assumption*)
-            Be conservative with your assumptions and estimations.
-            
-            Respond in JSON format with these fields. If any field cannot be determined, use "none specified" to ensure valid JSON.
-            {{
-                "goal": "clear statement of the main objective",
-                "constraints": ["list of time or resource constraints"],
-                "conditions": ["list of specific rules or conditions"],
-                "heuristic": "selected_heuristic_id",
-                "response_format": "specified format (e.g., true/false, text, confidence score)",
-                "parameters": {{
-                    "entities": ["list of involved entities"],
-                    "timeline": "relevant timeframe",
-                    "analysis_depth": "quick|standard|deep",
-                    "data_requirements": ["list of required data points"],
-                    "assumptions": ["list of key assumptions"],
-                    "risk_factors": ["list of key risk factors"],
-                    "validation_criteria": ["list of criteria for validating the response"]
-                }}
-            }}
-            
-            Critical Guidelines:
-            1. If no clear heuristic match (confidence < 0.7), select the default reasoning agent ("default_agent")
-            2. ALWAYS specify the response format - this is critical for proper handling
-            3. For geopolitical queries, include current context and relationship dynamics of all parties
-            4. For corporate scenarios, emphasize stakeholder interests and value creation objectives
-            5. For financial analysis, focus on risk/reward ratios and market conditions
-            6. For forecasting, specify confidence intervals and assumptions to use
-            7. For any analysis, clearly state the validation criteria and success metrics to use
-            
-
-            """
-            user_query = f"Here is the user query: {user_input}"
-            response = anthropic_client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": user_query}],
-                system=system_prompt,
-            )
+    def _parse_within(self, user_input: str, catalog, deadline) -> Dict:
 
-            try:
-                parsed_json = json.loads(response.content[0].text)
-                logger.debug(f"Parsed scenario: {parsed_json}")
+        # Stable instructions and heuristic list first (cached), then today's date
+        system_prompt = [
+            *scenario_prefix_blocks(catalog),
+            text_block(f"Current Date: {datetime.now().strftime('%A %Y-%m-%d')}"),
+        ]
+        messages = [
+            {"role": "user", "content": f"Here is the user query: {user_input}"}
+        ]
 
-                for field in self.required_fields:
-                    if field not in parsed_json:
-                        raise ValueError(f"Missing required field: {field}")
+        last_error = None
+        for attempt in range(deadline.max_retries + 1):
+            # The gateway gives each call the time left before the deadline
+            deadline.check()
+            # The first attempt runs on the fast tier; a rejected output escalates
+            tier = "fast" if attempt == 0 else "large"
+            with timed_call("parsing", tier) as record:
+                try:
+                    response = create_message(
+                        model=model_for("parsing", tier),
+                        max_tokens=2000,
+                        messages=messages,
+                        system=system_prompt,
+                        tools=[SCENARIO_TOOL],
+                        tool_choice={"type": "tool", "name": SCENARIO_TOOL["name"]},
+                    )
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error in scenario parsing: {e}")
+                    raise ValueError(f"Failed to process scenario: {str(e)}")
 
-                return parsed_json
+                try:
+                    parsed_json = self.extract_scenario(response)
+                    logger.debug(f"Parsed scenario: {parsed_json}")
+                    return parsed_json
+                except ValueError as e:
+                    last_error = e
+                    record["escalated"] = tier == "fast"
+                    logger.warning(
+                        f"Scenario parse attempt {attempt + 1} ({tier} tier) rejected: {e}"
+                    )
+                    messages = messages + self.correction_messages(response, e)
 
-            except json.JSONDecodeError as je:
-                logger.error(f"Failed to parse scenario JSON: {je}")
-                return self.parse_scenario(
-                    f"Retry {retry_count + 1}: {user_input}", retry_count + 1
-                )
-
-        except Exception as e:
-            logger.error(f"Error in scenario parsing: {e}")
-            raise ValueError(f"Failed to process scenario: {str(e)}")
+        raise ValueError(
+            f"Failed to parse scenario after {deadline.max_retries + 1} attempts: {last_error}"
+        )
 
     def format_for_display(self, parsed_scenario: Dict) -> str:
         """
@@ -0,0 +1,317 @@
+# rate_limiter.py
+# Keeps LLM traffic inside the provider's limits and shares it fairly between users.
+# Every call waits in a weighted fair queue and is released once the global and the per-user
+# token buckets (requests and tokens per minute) have room; a 429 pauses everyone briefly.
+
+import os
+import time
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Each worker process (WEB_CONCURRENCY in the Procfile) runs its own limiter, so the
+# provider-wide limits below are split evenly between the workers. Per-user limits are not
+# split: a user's socket, and so every call made for it, lives on one worker.
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+GLOBAL_RPM = float(os.environ.get("LLM_RATE_LIMIT_RPM", 50)) / WORKERS
+GLOBAL_TPM = float(os.environ.get("LLM_RATE_LIMIT_TPM", 80000)) / WORKERS
+USER_RPM = float(os.environ.get("LLM_USER_RATE_LIMIT_RPM", 20))
+USER_TPM = float(os.environ.get("LLM_USER_RATE_LIMIT_TPM", 40000))
+
+# Waiters re-check at least this often, so a missed wakeup never stalls the queue
+MAX_WAIT_SLICE = 1.0
+# Per-user state is pruned of idle users once it holds more users than this
+MAX_TRACKED_USERS = 1024
+
+
+class TokenBucket:
+    """
+    A bucket refilled continuously at per_minute / 60 units per second, up to capacity.
+    Consuming more than is available leaves the bucket in debt, which later callers wait out.
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount can be consumed; 0 if it can be consumed now.
+        Requests larger than the bucket only wait for a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def full(self) -> bool:
+        """
+        True when the bucket is back at capacity, i.e. no different from a new one.
+        """
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """
+        Return unused units, or take more if amount is negative.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Waiter:
+    __slots__ = ("user", "tokens", "start", "finish", "seq")
+
+    def __init__(self, user, tokens, start, finish, seq):
+        self.user = user
+        self.tokens = tokens
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+
+
+class Grant:
+    """
+    Capacity handed out for one call. Settle it with the real usage once known.
+    """
+
+    def __init__(self, user, tokens: int, waited: float):
+        self.user = user
+        self.tokens = tokens
+        self.waited = waited
+
+
+class RateLimiter:
+    """
+    Weighted fair queue in front of global and per-user token buckets.
+    Each call gets a virtual finish tag of start + tokens / weight, where start is the later
+    of the queue's virtual time and the user's previous finish tag. Calls are released in tag
+    order, so a user with many queued calls only gets their share; a call whose user is over
+    their own limit is skipped so others can use the capacity.
+    """
+
+    def __init__(
+        self,
+        rpm: float = GLOBAL_RPM,
+        tpm: float = GLOBAL_TPM,
+        user_rpm: float = USER_RPM,
+        user_tpm: float = USER_TPM,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._requests = TokenBucket(rpm, clock=clock)
+        self._tokens = TokenBucket(tpm, clock=clock)
+        self.user_rpm = user_rpm
+        self.user_tpm = user_tpm
+        self._user_buckets: Dict[object, tuple] = {}
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[object, float] = {}
+        self._paused_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def acquire(
+        self,
+        tokens: int,
+        user=None,
+        weight: float = 1.0,
+        on_position: Optional[Callable[[int], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> Grant:
+        """
+        Block until the call may go ahead and return its grant.
+        on_position is called with the call's 1-based queue position whenever it changes
+        while the call is waiting. Raises TimeoutError if no capacity frees up within timeout.
+        """
+        started = self._clock()
+        give_up = started + timeout if timeout is not None else None
+        with self._cond:
+            start = max(self._virtual_time, self._last_finish.get(user, 0.0))
+            finish = start + tokens / max(weight, 1e-6)
+            self._last_finish[user] = finish
+            waiter = _Waiter(user, tokens, start, finish, next(self._seq))
+            self._queue.append(waiter)
+
+        reported = None
+        try:
+            while True:
+                with self._cond:
+                    delay, position = self._poll(waiter)
+                    if delay <= 0:
+                        self._grant(waiter)
+                        self._cond.notify_all()
+                        break
+                    if give_up is not None:
+                        left = give_up - self._clock()
+                        if left <= 0:
+                            raise TimeoutError("Timed out waiting for LLM capacity")
+                        delay = min(delay, left)
+                    if position == reported or on_position is None:
+                        self._cond.wait(min(delay, MAX_WAIT_SLICE))
+                        continue
+                # Report outside the lock, the callback usually emits to a socket
+                reported = position
+                on_position(position)
+        except BaseException:
+            with self._cond:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    self._cond.notify_all()
+            raise
+
+        waited = self._clock() - started
+        with self._cond:
+            self.wait_seconds += waited
+        if waited > 0.5:
+            logger.debug(f"LLM call for {user} waited {waited:.1f}s for capacity")
+        return Grant(user, tokens, waited)
+
+    def settle(self, grant: Grant, used_tokens: int) -> None:
+        """
+        Correct the buckets once the real token usage of a granted call is known.
+        """
+        difference = grant.tokens - used_tokens
+        if not difference:
+            return
+        with self._cond:
+            self._tokens.refund(difference)
+            self._buckets_for(grant.user)[1].refund(difference)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every queued call for a while, e.g. after the provider returned a 429.
+        """
+        with self._cond:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "paused_for": max(0.0, self._paused_until - self._clock()),
+            }
+
+    def _buckets_for(self, user) -> tuple:
+        buckets = self._user_buckets.get(user)
+        if buckets is None:
+            buckets = (
+                TokenBucket(self.user_rpm, clock=self._clock),
+                TokenBucket(self.user_tpm, clock=self._clock),
+            )
+            self._user_buckets[user] = buckets
+        return buckets
+
+    def _user_delay(self, waiter: _Waiter) -> float:
+        requests, tokens = self._buckets_for(waiter.user)
+        return max(requests.wait_time(1), tokens.wait_time(waiter.tokens))
+
+    def _poll(self, waiter: _Waiter):
+        """
+        Return (seconds to wait, queue position) for a waiter; 0 seconds means grant now.
+        """
+        ordered = sorted(self._queue, key=lambda w: (w.finish, w.seq))
+        position = ordered.index(waiter) + 1
+
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now, position
+
+        for candidate in ordered:
+            user_delay = self._user_delay(candidate)
+            if user_delay > 0:
+                if candidate is waiter:
+                    return user_delay, position
+                # Over their own limit - let the next user use the capacity
+                continue
+            if candidate is not waiter:
+                # An earlier call goes first; it notifies when it is granted
+                return MAX_WAIT_SLICE, position
+            return (
+                max(self._requests.wait_time(1), self._tokens.wait_time(waiter.tokens)),
+                position,
+            )
+        return MAX_WAIT_SLICE, position
+
+    def _grant(self, waiter: _Waiter) -> None:
+        self._queue.remove(waiter)
+        self._requests.consume(1)
+        self._tokens.consume(waiter.tokens)
+        requests, tokens = self._buckets_for(waiter.user)
+        requests.consume(1)
+        tokens.consume(waiter.tokens)
+        self._virtual_time = max(self._virtual_time, waiter.start)
+        self.granted += 1
+        # Users whose tags fell behind the virtual time start fresh anyway
+        if len(self._last_finish) > MAX_TRACKED_USERS:
+            self._last_finish = {
+                user: finish
+                for user, finish in self._last_finish.items()
+                if finish > self._virtual_time
+            }
+        # Full buckets are no different from the new ones an idle user would get
+        if len(self._user_buckets) > MAX_TRACKED_USERS:
+            queued = {queued.user for queued in self._queue}
+            self._user_buckets = {
+                user: buckets
+                for user, buckets in self._user_buckets.items()
+                if user in queued or not all(bucket.full() for bucket in buckets)
+            }
+
+
+# Who the current LLM call is made for. Set around each Socket.IO handler so
+# every call it makes, directly or on a helper thread, is queued under that user.
+_call_context = contextvars.ContextVar("llm_call_context", default=None)
+
+
+@contextmanager
+def llm_call_context(
+    user=None, weight: float = 1.0, on_position: Optional[Callable] = None
+):
+    token = _call_context.set(
+        {"user": user, "weight": weight, "on_position": on_position}
+    )
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> Dict:
+    return _call_context.get() or {"user": None, "weight": 1.0, "on_position": None}
+
+
+limiter = RateLimiter()
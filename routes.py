@@ -2,24 +2,177 @@
 # Handles the routes for the web app
 # Would benefit from moving some of the logic back into the simulation.py or routing and logic file
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import (
+    Blueprint,
+    current_app,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    jsonify,
+    abort,
+)
 from flask_login import login_user, logout_user, login_required, current_user
-from models import User, SimulationSession
+from flask_socketio import join_room
+from models import User, SimulationSession, SimulationTurn
 from flask import session as session_settings
-from app import db, socketio
+from app import MAX_MESSAGE_BYTES, db, socketio
 import routing_and_logic
+from heuristic_catalog import get_catalog, registry as catalog_registry
 from simulation import WorldSimulator
+from simulator_pool import SimulatorPool
+from rate_limiter import llm_call_context
+from deadlines import DeadlineExceeded, deadline_scope
+from model_tiers import tier_stats
+from pre_router import pre_router_stats
+from local_engines import run_local_engine, simulation_payload
+from backtester import parse_ohlcv
+from comparison import (
+    is_compare_command,
+    parse_compare_command,
+    parsed_response,
+    run_comparison,
+)
+from rule_checker import (
+    check_response,
+    compiled_rules,
+    correction_message,
+    metrics_instructions,
+)
+from datetime import datetime
 import logging
 import json
+import os
+import uuid
 
 main = Blueprint("main", __name__)
-world_simulator = WorldSimulator()
+
+
+def load_simulator(session_id):
+    """
+    Rebuild a WorldSimulator from the turns stored for its session: the opening exchange
+    plus every turn not yet folded into the history summary.
+    Used by the simulator pool on first use and after eviction.
+    """
+    session = db.session.get(SimulationSession, session_id)
+    if not session:
+        raise ValueError("No active simulation session found")
+
+    summarized = session.summarized_turns or 0
+    turns = SimulationTurn.load_page(session_id, limit=2)
+    turns += SimulationTurn.load_range(session_id, after_seq=1 + summarized)
+    history = [turn.to_message() for turn in turns]
+
+    if not history:
+        history = migrate_legacy_history(session)
+
+    return WorldSimulator(
+        conversation_history=history,
+        summary=session.history_summary or "",
+        summarized=summarized,
+        history_budget=session_history_budget(session),
+    )
+
+
+def session_started(session):
+    """
+    Whether a session's simulation has been confirmed and has stored turns,
+    in the turns table or in the session settings of older versions.
+    """
+    return SimulationTurn.next_seq(session.id) > 0 or bool(
+        (session.session_settings or {}).get("conversation_history")
+    )
+
+
+def migrate_legacy_history(session):
+    """
+    Move history saved in session_settings by older versions into the turns table.
+    """
+    settings = dict(session.session_settings or {})
+    history = settings.pop("conversation_history", [])
+    if history:
+        SimulationTurn.append(session.id, history, 0)
+        session.session_settings = settings
+        db.session.commit()
+    return history
+
+
+def session_heuristic(session):
+    """
+    The session's heuristic id and the catalog version it is pinned to.
+    """
+    world_state = session.world_state or {}
+    heuristic = (
+        world_state.get("parsed_scenario", {}).get("parameters", {}).get("heuristic")
+    )
+    return get_catalog(world_state.get("catalog_version")), heuristic
+
+
+def session_history_budget(session):
+    """
+    History limits for the session's heuristic, from the catalog version it is pinned to.
+    """
+    catalog, heuristic = session_heuristic(session)
+    return catalog.history_budget(heuristic)
+
+
+def session_deadline(session, label):
+    """
+    A deadline scope for one simulation turn, from the session heuristic's
+    timeout_seconds and max_retries.
+    """
+    catalog, heuristic = session_heuristic(session)
+    return deadline_scope(budget=catalog.execution_budget(heuristic), label=label)
+
+
+def emit_simulation_error(context, error):
+    """
+    Report a failed request to the user's sockets. Deadline overruns get their own
+    code so the client can tell a timeout from other failures.
+    """
+    payload = {"error": str(error)}
+    if isinstance(error, DeadlineExceeded):
+        payload["code"] = "deadline_exceeded"
+    socketio.emit("simulation_error", payload, to=context.user_room)
+
+
+def save_conversation_history(session_id, simulator):
+    """
+    Append the latest exchange to the session's turns and store the current summary,
+    so any worker can rehydrate the session.
+    """
+    session = db.session.get(SimulationSession, session_id)
+    if not session:
+        return
+    history = simulator.history
+    SimulationTurn.append(
+        session_id, simulator.conversation_history[-2:], history.message_count - 2
+    )
+    session.history_summary = history.summary
+    session.summarized_turns = history.summarized
+    session.last_interaction = datetime.utcnow()
+    db.session.commit()
+
+
+def simulator_is_current(session_id, simulator):
+    """
+    A pooled simulator is current if it holds every turn stored for its session.
+    Another worker may have advanced the conversation since it was loaded.
+    """
+    return SimulationTurn.next_seq(session_id) == simulator.history.message_count
+
+
+simulator_pool = SimulatorPool(load_simulator, validate=simulator_is_current)
+
+# Stream simulation text to the client as it is generated
+STREAM_RESPONSES = os.environ.get("SIMULATION_STREAMING", "true").lower() == "true"
 
 
 @main.route("/")
 @login_required
 def index():
-    return render_template("simulator.html")
+    return render_template("simulator.html", max_message_bytes=MAX_MESSAGE_BYTES)
 
 
 @main.route("/register", methods=["GET", "POST"])
@@ -122,38 +275,376 @@ def delete_user(user_id):
     return redirect(url_for("main.admin_users"))
 
 
+@main.route("/simulations/<int:session_id>/turns")
+@login_required
+def simulation_turns(session_id):
+    """
+    Page through a simulation's stored turns, oldest first, starting after ?after=<seq>.
+    """
+    session = SimulationSession.query.get_or_404(session_id)
+    if session.user_id != current_user.id and not current_user.is_admin:
+        abort(403)
+
+    after = request.args.get("after", -1, type=int)
+    limit = max(1, min(request.args.get("limit", 50, type=int), 200))
+    turns = SimulationTurn.load_page(session_id, after_seq=after, limit=limit)
+    return jsonify(
+        {
+            "turns": [
+                {"seq": turn.seq, "role": turn.role, "content": turn.content}
+                for turn in turns
+            ],
+            "next_after": turns[-1].seq if len(turns) == limit else None,
+        }
+    )
+
+
+@main.route("/admin/cache/stats")
+@login_required
+def cache_stats():
+    if not current_user.is_admin:
+        flash("Access denied")
+        return redirect(url_for("main.index"))
+
+    cache = routing_and_logic.scenario_cache
+    return jsonify(
+        {
+            "scenario_cache": cache.stats() if cache is not None else None,
+            "simulator_pool": simulator_pool.stats(),
+            "prompt_cache": routing_and_logic.gateway.stats(),
+            "rate_limiter": routing_and_logic.gateway.limiter.stats(),
+            "model_tiers": tier_stats(),
+            "pre_router": pre_router_stats(),
+        }
+    )
+
+
+@main.route("/admin/heuristics/reload", methods=["POST"])
+@login_required
+def reload_heuristics():
+    if not current_user.is_admin:
+        flash("Access denied")
+        return redirect(url_for("main.index"))
+
+    try:
+        result = catalog_registry.reload()
+    except ValueError as e:
+        logging.error(f"Heuristics reload error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def simulation_room(session_id):
+    return f"simulation:{session_id}"
+
+
+class SocketContext:
+    """
+    The parts of a Socket.IO request a background task needs once the handler has returned:
+    the app, the originating sid and namespace, the user and the per-connection session.
+    """
+
+    def __init__(self):
+        self.app = current_app._get_current_object()
+        self.sid = request.sid
+        self.namespace = request.namespace
+        self.user_id = current_user.id if hasattr(current_user, "id") else None
+        self.settings = session_settings._get_current_object()
+
+    @property
+    def user_room(self):
+        """
+        Where user-scoped events (errors, confirmations, comparisons, uploads) go: every
+        socket of the user, so each open tab stays in step, or just the originating
+        socket for an anonymous connection.
+        """
+        return user_room(self.user_id) if self.user_id is not None else self.sid
+
+    @property
+    def room(self):
+        """
+        Where simulation output is delivered: the room of the connection's active
+        simulation, or just the originating socket before there is one.
+        """
+        session_id = self.settings.get("simulation_session_id")
+        return simulation_room(session_id) if session_id else self.sid
+
+    def join_simulation(self, session_id):
+        """
+        Make session_id the connection's active simulation and move the socket into its room.
+        """
+        previous = self.settings.get("simulation_session_id")
+        if previous and previous != session_id:
+            socketio.server.leave_room(
+                self.sid, simulation_room(previous), namespace=self.namespace
+            )
+        socketio.server.enter_room(
+            self.sid, simulation_room(session_id), namespace=self.namespace
+        )
+        self.settings["simulation_session_id"] = session_id
+
+
+def dispatch(handler, *args):
+    """
+    Run a handler as a background task so the LLM calls it makes never block
+    other sockets on the worker. Results are emitted to the context's room.
+    LLM calls made by the handler are queued under the user in the rate limiter.
+    """
+    context = SocketContext()
+
+    def report_queue_position(position):
+        socketio.emit("queue_position", {"position": position}, to=context.sid)
+
+    def run():
+        with (
+            context.app.app_context(),
+            llm_call_context(
+                user=context.user_id if context.user_id is not None else context.sid,
+                on_position=report_queue_position,
+            ),
+        ):
+            handler(context, *args)
+
+    socketio.start_background_task(run)
+
+
+def chunk_emitter(context):
+    """
+    Return a callback that forwards streamed text deltas to the simulation's room,
+    or None when streaming is disabled.
+    """
+    if not STREAM_RESPONSES:
+        return None
+    room = context.room
+
+    def emit_chunk(delta):
+        socketio.emit("simulation_chunk", {"delta": delta}, to=room)
+
+    return emit_chunk
+
+
+def emit_simulation_result(context, response, compliance=None):
+    """
+    Send a finished simulation turn to the simulation's room. When streaming, the client already has the text,
+    so a simulation_complete event carries the final parsed response.
+    compliance is the turn's rule check report, if the heuristic has quantitative rules.
+    """
+    if not STREAM_RESPONSES:
+        socketio.emit(
+            "simulation_response",
+            {"response": response, "compliance": compliance},
+            to=context.room,
+        )
+        return
+
+    socketio.emit(
+        "simulation_complete",
+        {**parsed_response(response), "compliance": compliance},
+        to=context.room,
+    )
+
+
+def emit_simulation_violation(context, response, compliance):
+    """
+    Send a turn that broke a rule and is about to be corrected. It has its own event so
+    the client shows it but keeps waiting for the corrective turn.
+    """
+    socketio.emit(
+        "simulation_violation",
+        {**parsed_response(response), "compliance": compliance},
+        to=context.room,
+    )
+
+
+def finish_turn(context, session, simulator, response):
+    """
+    Check a finished turn against the heuristic's quantitative rules and send it.
+    Only a reported number that breaks a rule costs a corrective turn, and only one.
+    Call inside the turn's deadline scope.
+    """
+    catalog, heuristic = session_heuristic(session)
+    rules = compiled_rules(catalog, heuristic)
+    response, report = check_response(response, rules)
+    save_conversation_history(session.id, simulator)
+    if not report or not report["violations"]:
+        emit_simulation_result(context, response, report)
+        return
+
+    emit_simulation_violation(context, response, report)
+    corrected = simulator.handle_subsequent_messages(
+        correction_message(report), on_chunk=chunk_emitter(context)
+    )
+    corrected, report = check_response(corrected, rules)
+    save_conversation_history(session.id, simulator)
+    emit_simulation_result(context, corrected, report)
+
+
 @socketio.on("connect")
 @login_required
 def handle_connect():
+    # Every socket joins its user's room; simulation rooms are joined per session
+    join_room(user_room(current_user.id))
     logging.debug(f"Client connected: {current_user.username}")
 
 
+@socketio.on("join_simulation")
+@login_required
+def handle_join_simulation(data):
+    """
+    Rejoin a simulation's room, e.g. after a reconnect, if the user owns it.
+    """
+    context = SocketContext()
+    session_id = (data or {}).get("session_id")
+    session = find_user_session(context, session_id) if session_id else None
+    if not session:
+        emit_simulation_error(context, "Simulation session not found")
+        return
+    context.join_simulation(session.id)
+
+
+@socketio.on("upload_market_data")
+@login_required
+def market_data_upload(data):
+    dispatch(handle_market_data_upload, data)
+
+
+def handle_market_data_upload(context, data):
+    """
+    Attach an OHLCV CSV to one of the user's simulations before it is confirmed.
+    The backtester runs candidate strategies on it when the simulation starts, so
+    an upload for a simulation that has already started is rejected.
+    """
+    data = data or {}
+    session_id = data.get("session_id")
+    session = find_user_session(context, session_id) if session_id else None
+    if not session:
+        emit_simulation_error(context, "Simulation session not found")
+        return
+    try:
+        market_data = parse_ohlcv(data.get("csv", ""))
+    except ValueError as e:
+        emit_simulation_error(context, f"Could not read the CSV: {e}")
+        return
+
+    market_data["filename"] = str(data.get("filename") or "upload.csv")[:255]
+    # Held against a confirmation starting the simulation at the same time
+    with simulator_pool.turn(session.id):
+        db.session.refresh(session)
+        if session_started(session):
+            emit_simulation_error(
+                context,
+                "Market data can only be uploaded before the simulation is confirmed",
+            )
+            return
+        # A new upload replaces the previous one, and results computed on the old data
+        # are dropped so the backtester runs again on the new
+        world_state = dict(session.world_state or {})
+        world_state["market_data"] = market_data
+        world_state.pop("local_results", None)
+        world_state.pop("local_results_note", None)
+        session.world_state = world_state
+        db.session.commit()
+    socketio.emit(
+        "market_data_uploaded",
+        {
+            "session_id": session.id,
+            "filename": market_data["filename"],
+            "bars": len(market_data["close"]),
+            "start": market_data["dates"][0],
+            "end": market_data["dates"][-1],
+        },
+        to=context.user_room,
+    )
+
+
 @socketio.on("route_message")
 def routed_message(message):
-    if session_settings.get(
-        "first_message", True
-    ):  # True means it is the first message
-        handle_simulation(message)
-        session_settings["first_message"] = (
-            False  # Mark that we've handled the first message
-        )
+    # A comparison starts new sessions, whatever simulation is running
+    if is_compare_command(message):
+        dispatch(handle_comparison, message)
+        return
+    # Messages in a running simulation carry its id, so any worker can route them.
+    # Without one the client has no confirmed simulation, so the message is a new
+    # or edited scenario.
+    session_id = message.get("session_id") if isinstance(message, dict) else None
+    if session_id is None:
+        dispatch(handle_simulation, message)
     else:
-        handle_subsequent_message(message)  # Fixed typo in function name
-
-
-def handle_simulation(message):
+        dispatch(handle_subsequent_message, message)  # Fixed typo in function name
+
+
+def new_world_state(parsed_scenario, heuristic_settings, catalog_version, message):
+    """
+    The world state a new simulation session starts from.
+    """
+    # Store both scenario and heuristic settings in world_state
+    world_state = {
+        "parsed_scenario": parsed_scenario,
+        "heuristic_settings": heuristic_settings,
+        # Pin the session to the catalog it was routed against
+        "catalog_version": catalog_version,
+        # Local engines read numbers from the prompt or the supplied series
+        "original_prompt": message["input"],
+    }
+    if isinstance(message.get("series"), dict):
+        world_state["series"] = message["series"]
+    return world_state
+
+
+def create_session(context, world_state):
+    """
+    Store a new simulation session for the context's user and return its id,
+    or None when the user is not authenticated.
+    """
+    if context.user_id is None:
+        return None
+    user = db.session.get(User, context.user_id)
+    session = SimulationSession()
+    session.user_id = context.user_id
+    session.world_state = world_state
+    session.initialize_session_settings(user)
+    # Session and settings are written in a single transaction
+    db.session.add(session)
+    db.session.commit()
+    return session.id
+
+
+def handle_simulation(context, message):
     try:
         logging.debug(f'Processing simulation request: {message["input"]}')
-        # First, process the scenario
-        scenario_data = routing_and_logic.process_scenario(message["input"])
+        # First, process the scenario. No heuristic is known yet, so routing
+        # runs under the default budget.
+        with deadline_scope(label="scenario routing"):
+            scenario_data = routing_and_logic.process_scenario(message["input"])
 
-        # Get the heuristic settings from the HEURISTIC_LIST
+        # Get the precomputed heuristic prompt from the catalog
         heuristic_name = scenario_data["heuristic"]
+        catalog_version = scenario_data["catalog_version"]
         heuristic_settings = {
-            "heuristic_prompt": routing_and_logic.HEURISTIC_LIST.get(heuristic_name, "")
+            "heuristic_prompt": get_catalog(catalog_version).prompt_fragment(
+                heuristic_name
+            )
         }
 
-        # Emit the formatted scenario for confirmation
+        # Only create session if user is authenticated
+        session_id = create_session(
+            context,
+            new_world_state(
+                scenario_data["parsed_scenario"],
+                heuristic_settings,
+                catalog_version,
+                message,
+            ),
+        )
+        if session_id is not None:
+            context.join_simulation(session_id)
+
+        # Emit the formatted scenario for confirmation. The client sends the
+        # session id back with confirm_simulation.
         socketio.emit(
             "simulation_confirmation",
             {
@@ -163,70 +654,225 @@ def handle_simulation(message):
                 "original_prompt": message[
                     "input"
                 ],  # Include original prompt for editing
+                "session_id": session_id,
             },
+            to=context.user_room,
         )
 
-        # Only create session if user is authenticated
-        if hasattr(current_user, "id"):
-            session = SimulationSession()
-            session.user_id = current_user.id
-            # Store both scenario and heuristic settings in world_state
-            session.world_state = json.dumps(
+    except Exception as e:
+        logging.error(f"Scenario processing error: {str(e)}")
+        emit_simulation_error(context, e)
+
+
+def handle_comparison(context, message):
+    """
+    Run one scenario under several heuristics at once. Each heuristic gets its own
+    session, so any column can be continued as a normal simulation afterwards.
+    Streamed text and results are tagged with the heuristic for side-by-side display.
+    """
+    try:
+        heuristics, scenario = parse_compare_command(message, get_catalog())
+        with deadline_scope(label="scenario parsing"):
+            comparison = routing_and_logic.process_comparison(scenario, heuristics)
+        catalog_version = comparison["catalog_version"]
+        catalog = get_catalog(catalog_version)
+        comparison_id = uuid.uuid4().hex
+
+        branches = []
+        for index, heuristic in enumerate(heuristics):
+            world_state = new_world_state(
+                comparison["parsed_scenarios"][heuristic],
+                {"heuristic_prompt": catalog.prompt_fragment(heuristic)},
+                catalog_version,
+                {**message, "input": scenario},
+            )
+            session_id = create_session(context, world_state)
+            branches.append(
                 {
-                    "parsed_scenario": scenario_data["parsed_scenario"],
-                    "heuristic_settings": heuristic_settings,
+                    "heuristic": heuristic,
+                    "world_state": world_state,
+                    "session_id": session_id,
+                    # Seeded like a single run, so a column reproduces on its own
+                    "seed": session_id if session_id is not None else index,
                 }
             )
-            db.session.add(session)
-            db.session.commit()
-            if hasattr(session, "initialize_session_settings"):
-                session.initialize_session_settings(current_user)
 
+        socketio.emit(
+            "comparison_started",
+            {
+                "comparison_id": comparison_id,
+                "scenario": comparison["display_format"],
+                "branches": [
+                    {
+                        "heuristic": branch["heuristic"],
+                        "name": catalog.name(branch["heuristic"]),
+                        "session_id": branch["session_id"],
+                    }
+                    for branch in branches
+                ],
+            },
+            to=context.user_room,
+        )
+
+        def chunk_handler(heuristic):
+            if not STREAM_RESPONSES:
+                return None
+
+            def emit_chunk(delta):
+                socketio.emit(
+                    "comparison_chunk",
+                    {
+                        "comparison_id": comparison_id,
+                        "heuristic": heuristic,
+                        "delta": delta,
+                    },
+                    to=context.user_room,
+                )
+
+            return emit_chunk
+
+        def store_result(result):
+            session_id = result["session_id"]
+            if session_id is not None and "error" not in result:
+                session = db.session.get(SimulationSession, session_id)
+                session.world_state = result["world_state"]
+                db.session.commit()
+                with simulator_pool.turn(session_id):
+                    save_conversation_history(session_id, result["simulator"])
+                    simulator_pool.put(session_id, result["simulator"])
+            payload = {
+                "comparison_id": comparison_id,
+                "heuristic": result["heuristic"],
+                "session_id": session_id,
+                "elapsed_ms": result["elapsed_ms"],
+            }
+            if "error" in result:
+                payload["error"] = result["error"]
+                payload["code"] = result.get("code")
+            else:
+                payload["result"] = parsed_response(result["response"])
+                payload["compliance"] = result["compliance"]
+            socketio.emit("comparison_result", payload, to=context.user_room)
+
+        summary = run_comparison(branches, catalog, chunk_handler, store_result)
+        logging.info(
+            f"Comparison of {len(branches)} heuristics took {summary['elapsed_ms']}ms "
+            f"(slowest branch {summary['slowest_branch_ms']}ms)"
+        )
+        socketio.emit(
+            "comparison_summary",
+            {"comparison_id": comparison_id, **summary},
+            to=context.user_room,
+        )
     except Exception as e:
-        logging.error(f"Scenario processing error: {str(e)}")
-        socketio.emit("simulation_error", {"error": str(e)})
+        logging.error(f"Comparison error: {str(e)}")
+        emit_simulation_error(context, e)
 
 
 @socketio.on("confirm_simulation")
 def handle_simulation_confirmation(confirmed):
+    dispatch(run_simulation_confirmation, confirmed)
+
+
+def find_user_session(context, session_id):
+    """
+    Fetch one of the user's sessions by primary key.
+    Clients that do not send a session id fall back to the user's latest session.
+    """
+    if session_id is not None:
+        try:
+            session_id = int(session_id)
+        except (TypeError, ValueError):
+            return None
+        session = db.session.get(SimulationSession, session_id)
+        if session and session.user_id == context.user_id:
+            return session
+        return None
+
+    return (
+        SimulationSession.query.filter_by(user_id=context.user_id)
+        .order_by(SimulationSession.started_at.desc())
+        .first()
+    )
+
+
+def run_simulation_confirmation(context, confirmation):
     try:
+        # Accept {"confirmed": bool, "session_id": int} or a bare boolean
+        if isinstance(confirmation, dict):
+            confirmed = confirmation.get("confirmed")
+            session_id = confirmation.get("session_id")
+        else:
+            confirmed, session_id = confirmation, None
+
         if confirmed:
-            # Get the latest session for the user
-            session = (
-                SimulationSession.query.filter_by(user_id=current_user.id)
-                .order_by(SimulationSession.started_at.desc())
-                .first()
-            )
+            session = find_user_session(context, session_id)
 
             if not session:
                 raise ValueError("No active simulation session found")
 
-            # Initaize the world simulator with the base scenario
-            scenario_with_heuristics = json.loads(session.world_state)
-            print(
-                f"=====Logging=====\nScenario and heuristic payload:\n{scenario_with_heuristics}"
-            )
-            response = world_simulator.initialize_simulation(
-                json.dumps(scenario_with_heuristics)
-            )
-            socketio.emit("simulation_response", {"response": response})
+            context.join_simulation(session.id)
+
+            with (
+                simulator_pool.turn(session.id) as simulator,
+                session_deadline(session, "simulation start"),
+            ):
+                # Heuristics with a local engine get their numbers computed here once,
+                # seeded by the session so a rerun reproduces them
+                catalog, heuristic = session_heuristic(session)
+                world_state = run_local_engine(session.world_state, catalog, session.id)
+                if world_state is not None:
+                    session.world_state = world_state
+                    db.session.commit()
+
+                # Initaize the world simulator with the base scenario
+                scenario_with_heuristics = simulation_payload(session.world_state)
+                instructions = metrics_instructions(compiled_rules(catalog, heuristic))
+                if instructions:
+                    scenario_with_heuristics["compliance_metrics"] = instructions
+                logging.debug(
+                    f"Scenario and heuristic payload:\n{scenario_with_heuristics}"
+                )
+                response = simulator.initialize_simulation(
+                    scenario_with_heuristics, on_chunk=chunk_emitter(context)
+                )
+                finish_turn(context, session, simulator, response)
         else:
             socketio.emit(
-                "simulation_cancelled", {"message": "Simulation cancelled by user"}
+                "simulation_cancelled",
+                {"message": "Simulation cancelled by user"},
+                to=context.user_room,
             )
 
     except Exception as e:
         logging.error(f"Simulation error: {str(e)}")
-        socketio.emit("simulation_error", {"error": str(e)})
+        emit_simulation_error(context, e)
 
 
-def handle_subsequent_message(message):  # Fixed typo in function name
+def handle_subsequent_message(context, message):  # Fixed typo in function name
     try:
         logging.debug(f"Handling subsequent message: {message}")
-        response = world_simulator.handle_subsequent_messages(message)
-        socketio.emit(
-            "simulation_response", {"response": response}
-        )  # Changed to simulation_response to match client expectations
+        session_id = message.get("session_id") if isinstance(message, dict) else None
+        if session_id is None:
+            session_id = context.settings.get("simulation_session_id")
+        # Look the session up in the database rather than trusting this worker's state
+        session = find_user_session(context, session_id) if session_id else None
+        if not session:
+            raise ValueError("No active simulation session found")
+        if not session_started(session):
+            # Not confirmed yet: the message is the scenario, edited and resubmitted
+            handle_simulation(context, message)
+            return
+        session_id = session.id
+        context.join_simulation(session_id)
+        with (
+            simulator_pool.turn(session_id) as simulator,
+            session_deadline(session, "simulation turn"),
+        ):
+            response = simulator.handle_subsequent_messages(
+                message, on_chunk=chunk_emitter(context)
+            )
+            finish_turn(context, session, simulator, response)
     except Exception as e:
         logging.error(f"Subsequent message handling error: {str(e)}")
-        socketio.emit("simulation_error", {"error": str(e)})
+        emit_simulation_error(context, e)
@@ -2,113 +2,200 @@
 # Handles the query routing - needs to be consilidated with other message routing and logging vs app logic
 # Need simplification into a single routes / routing / logic module
 
-import anthropic
 import os
+import copy
 import json
 import logging
-from typing import Tuple, Optional, Dict
+import contextvars
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, Dict, List
 from query_parser import ScenarioParser
-from utilities import list_all_heuristic_names_and_characteristics
+from llm_gateway import create_message, gateway
+from prompts import cached_block
+from heuristic_catalog import HeuristicCatalog, get_catalog, registry
+from scenario_cache import build_cache_from_env
+from deadlines import DeadlineExceeded
+from pre_router import pre_route
+from model_tiers import (
+    DEFAULT_MIN_CONFIDENCE,
+    STAGE_TIERS,
+    benchmark,
+    model_for,
+    timed_call,
+)
 
 # from rules_DEMO import negotiations_rules, HEURISTIC_LIST
 
 ## the rules_demo.py file holds the prompts and specific rules / heuristics for each domain.
-
-# Load heuristics from JSON file
-with open("heuristics.json", "r") as f:
-    heuristics_data = json.load(f)
-    HEURISTIC_LIST = {k: v["name"] for k, v in heuristics_data["heuristics"].items()}
+## Heuristics are loaded once from heuristics.json by the shared catalog in heuristic_catalog.py
 
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Initialize Anthropic client
-api_key = os.environ.get("ANTHROPIC_API_KEY")
-if not api_key:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-
-client = anthropic.Client(api_key=api_key)
 query_parser = ScenarioParser()
+scenario_cache = build_cache_from_env()
 
-def check_shortcode(message: str) -> Optional[str]:
+
+def invalidate_changed_heuristics(catalog, previous, changed):
     """
-    Check if message contains a valid heuristic shortcode.
-    Returns the heuristic name if found, None otherwise.
+    On a catalog reload, drop only the cached scenarios routed to heuristics that changed.
+    Entries for other heuristics stay valid unless the routing prompt itself changed,
+    in which case the new routing version already gives them new keys.
     """
-    if not message:
-        return None
-
-    words = message.lower().split()
-    for word in words:
-        if word.startswith("/"):
-            # Remove the '/' and check if it's a valid heuristic
-            potential_heuristic = word[1:]
-            if potential_heuristic in HEURISTIC_LIST:
-                logger.debug(f"Found valid shortcode: {potential_heuristic}")
-                return potential_heuristic
+    if scenario_cache is not None and changed:
+        scenario_cache.invalidate_heuristics(changed)
 
-    logger.debug("No valid shortcode found")
-    return None
 
+registry.on_reload(invalidate_changed_heuristics)
 
-## Adapt this section to handle and route the specific domains defined in the HEURISTICS_LIST in rules_demo.py
-## The lines "For geopolitical analysis..." should use a term that matches the heuristic name and give
-## some general parameters to help the LLM match the inout to a heuristic
-available_heuristics = list_all_heuristic_names_and_characteristics
+# Runs the heuristic match and the scenario parse side by side; the LLM calls
+# themselves are still bounded by the gateway's worker pool
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PIPELINE_MAX_WORKERS", 8)),
+    thread_name_prefix="pipeline",
+)
 
 
-def match_heuristic_with_llm(message: str) -> Tuple[str, str]:
+def check_shortcode(
+    message: str, catalog: Optional[HeuristicCatalog] = None
+) -> Optional[str]:
     """
-    Use Claude to match message content with appropriate heuristic.
-    Returns tuple of (heuristic_name, settings).
+    Check if message contains a valid heuristic shortcode or alias.
+    Returns the heuristic id if found, None otherwise.
     """
-    logger.debug("Attempting to match message with heuristic using Claude")
+    heuristic = (catalog or get_catalog()).find_shortcode(message)
+    if heuristic:
+        logger.debug(f"Found valid shortcode: {heuristic}")
+    else:
+        logger.debug("No valid shortcode found")
+    return heuristic
+
 
-    system_prompt = """
+@lru_cache(maxsize=4)
+def match_system_prompt(catalog: HeuristicCatalog) -> str:
+    """
+    System prompt for the heuristic matcher, built once per catalog.
+    """
+    return f"""
     Analyze the following scenario and determine which heuristic best matches its content.
-    {available_heuristics}
+    {catalog.characteristics_text}
 
-    For geopolitical analysis involving international relations, trade, or political dynamics, use the 'geopolitics' heuristic.
-    For negotiation scenarios involving corporate discussions or conflict resolution, use the 'negotiation' heuristic.
+    For geopolitical analysis involving international relations, trade, or political dynamics, use the 'geopolitical_strategy' heuristic.
+    For negotiation scenarios involving corporate discussions or conflict resolution, use the 'corporate_negotiation' heuristic.
 
     Respond in JSON format only:
-    {
-        "heuristic": <heuristic_name>,
+    {{
+        "heuristic": <heuristic_id>,
         "confidence": <float between 0 and 1>,
         "reasoning": "<brief explanation>"
-    }
+    }}
     """
 
-    try:
-        response = client.messages.create(
-            model="claude-3-opus-20240229",
-            max_tokens=2000,
-            messages=[{"role": "user", "content": message}],
-            system=system_prompt,
-        )
 
-        try:
-            result = json.loads(response.content[0].text)
-            heuristic = result.get("heuristic", "none")
-            confidence = result.get("confidence", 0.0)
+def classify_heuristic(
+    message: str, catalog: HeuristicCatalog, model: str
+) -> Tuple[str, float]:
+    """
+    Ask one model which heuristic fits the message.
+    Returns (heuristic id, or "none" if it named no known heuristic, confidence).
+    """
+    response = create_message(
+        model=model,
+        max_tokens=500,
+        messages=[{"role": "user", "content": message}],
+        system=[cached_block(match_system_prompt(catalog))],
+    )
+    result = json.loads(response.content[0].text)
+    heuristic = result.get("heuristic", "none")
+    if heuristic not in catalog:
+        heuristic = "none"
+    return heuristic, float(result.get("confidence", 0.0))
+
+
+def min_confidence(catalog: HeuristicCatalog, heuristic: str) -> float:
+    """
+    Confidence a match needs, from the heuristic's min_confidence parameter.
+    """
+    return float(
+        catalog.parameters(heuristic).get("min_confidence", DEFAULT_MIN_CONFIDENCE)
+    )
 
-            logger.debug(
-                f"LLM matched heuristic: {heuristic} with confidence: {confidence}"
-            )
 
-            if heuristic != "none" and confidence > 0.7:
-                return heuristic, HEURISTIC_LIST[heuristic]
-            return "none", "No matching heuristic found"
+def match_heuristic_with_llm(
+    message: str, catalog: Optional[HeuristicCatalog] = None
+) -> Tuple[str, str]:
+    """
+    Match message content with the appropriate heuristic.
+    The fast tier answers first; the large model is only asked when the fast answer
+    is below the heuristic's min_confidence or unusable.
+    Returns tuple of (heuristic_name, settings).
+    """
+    logger.debug("Attempting to match message with heuristic using the routing tiers")
+    catalog = catalog or get_catalog()
 
+    for tier in STAGE_TIERS["routing"]:
+        try:
+            with timed_call("routing", tier) as record:
+                heuristic, confidence = classify_heuristic(
+                    message, catalog, model_for("routing", tier)
+                )
+                confident = heuristic != "none" and confidence >= min_confidence(
+                    catalog, heuristic
+                )
+                record["escalated"] = not confident and tier != "large"
+        except DeadlineExceeded:
+            raise
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM response: {e}")
-            return "none", "Error parsing response"
+            logger.error(f"Failed to parse {tier} tier routing response: {e}")
+            continue
+        except Exception as e:
+            logger.error(f"Error in LLM matching on the {tier} tier: {e}")
+            continue
+
+        logger.debug(
+            f"{tier} tier matched heuristic: {heuristic} with confidence: {confidence}"
+        )
+        if confident:
+            return heuristic, catalog.name(heuristic)
 
-    except Exception as e:
-        logger.error(f"Error in LLM matching: {e}")
-        return "none", "Error in processing"
+    return "none", "No matching heuristic found"
+
+
+def benchmark_routing(cases, catalog: Optional[HeuristicCatalog] = None) -> Dict:
+    """
+    Compare routing accuracy and latency of each tier on (message, expected heuristic) cases.
+    """
+    catalog = catalog or get_catalog()
+    return benchmark(
+        "routing",
+        lambda message, model: classify_heuristic(message, catalog, model)[0],
+        cases,
+        STAGE_TIERS["routing"],
+    )
+
+
+def resolve_heuristic(
+    heuristic: str,
+    heuristic_desc: str,
+    parsed_scenario: Dict,
+    catalog: HeuristicCatalog,
+) -> Tuple[str, str]:
+    """
+    Combine the dedicated matcher's answer with the heuristic the parser picked.
+    The matcher takes precedence; the parser's choice is only used when the matcher found nothing.
+    """
+    if heuristic != "none":
+        return heuristic, heuristic_desc
+
+    parsed_heuristic = parsed_scenario.get("heuristic")
+    if parsed_heuristic in catalog:
+        logger.debug(f"Using heuristic selected by the parser: {parsed_heuristic}")
+        return parsed_heuristic, catalog.name(parsed_heuristic)
+
+    raise ValueError("Could not match scenario to any available heuristic")
 
 
 def process_scenario(message: str) -> Dict:
@@ -123,22 +210,47 @@ def process_scenario(message: str) -> Dict:
     - parsed_scenario: structured scenario details
     - display_format: human-readable format for confirmation
     - original_prompt: the original user input for editing
+    - catalog_version: the heuristics catalog version the scenario is pinned to
     """
     logger.info("Processing new scenario request")
 
-    # Step 1: Route to appropriate heuristic
-    shortcode_match = check_shortcode(message)
-    if shortcode_match:
-        heuristic = shortcode_match
-        heuristic_desc = HEURISTIC_LIST[shortcode_match]
-    else:
-        heuristic, heuristic_desc = match_heuristic_with_llm(message)
-        if heuristic == "none":
-            raise ValueError("Could not match scenario to any available heuristic")
+    # Use one catalog snapshot for the whole request, even if a reload happens meanwhile
+    catalog = get_catalog()
+
+    if scenario_cache is not None:
+        cached = scenario_cache.get(message, catalog.routing_version)
+        if cached is not None:
+            cached["original_prompt"] = message
+            cached["catalog_version"] = catalog.version
+            return cached
 
-    # Step 2: Parse scenario details
+    # Step 1 and 2: Route to a heuristic and parse the scenario details.
+    # A shortcode or a clear local match needs no routing call; otherwise both
+    # need an LLM round trip, so run them concurrently.
+    local_match = check_shortcode(message, catalog) or pre_route(message, catalog)
     try:
-        parsed_scenario = query_parser.parse_scenario(message)
+        if local_match:
+            heuristic = local_match
+            heuristic_desc = catalog.name(local_match)
+            parsed_scenario = query_parser.parse_scenario(message, local_match)
+        else:
+            # Each task runs in a copy of the caller's context, so its LLM call
+            # is queued under the same user in the rate limiter
+            match_future = pipeline_executor.submit(
+                contextvars.copy_context().run,
+                match_heuristic_with_llm,
+                message,
+                catalog,
+            )
+            parse_future = pipeline_executor.submit(
+                contextvars.copy_context().run, query_parser.parse_scenario, message
+            )
+            heuristic, heuristic_desc = match_future.result()
+            parsed_scenario = parse_future.result()
+            heuristic, heuristic_desc = resolve_heuristic(
+                heuristic, heuristic_desc, parsed_scenario, catalog
+            )
+
         # Add the matched heuristic to the scenario parameters
         parsed_scenario["parameters"] = parsed_scenario.get("parameters", {})
         parsed_scenario["parameters"]["heuristic"] = heuristic
@@ -146,18 +258,53 @@ def process_scenario(message: str) -> Dict:
         # Step 3: Format for display
         display_format = query_parser.format_for_display(parsed_scenario)
 
-        return {
+        result = {
             "heuristic": heuristic,
             "heuristic_description": heuristic_desc,
             "parsed_scenario": parsed_scenario,
             "display_format": display_format,
-            "original_prompt": message,  # Include original prompt for editing
         }
+        if scenario_cache is not None:
+            scenario_cache.set(message, catalog.routing_version, result)
+
+        result["original_prompt"] = message  # Include original prompt for editing
+        result["catalog_version"] = catalog.version
+        return result
     except Exception as e:
         logger.error(f"Error processing scenario: {e}")
         raise
 
 
+def process_comparison(message: str, heuristics: List[str]) -> Dict:
+    """
+    Parse a scenario once for a side-by-side comparison under several heuristics.
+    The heuristics are already chosen, so there is no routing step.
+
+    Returns a dictionary containing:
+    - parsed_scenarios: one copy of the parsed scenario per heuristic, bound to it
+    - display_format: human-readable format of the shared scenario
+    - original_prompt: the scenario text
+    - catalog_version: the heuristics catalog version the comparison is pinned to
+    """
+    logger.info(f"Processing comparison request for {', '.join(heuristics)}")
+    catalog = get_catalog()
+    parsed_scenario = query_parser.parse_scenario(message)
+
+    parsed_scenarios = {}
+    for heuristic in heuristics:
+        scenario = copy.deepcopy(parsed_scenario)
+        scenario["parameters"] = scenario.get("parameters", {})
+        scenario["parameters"]["heuristic"] = heuristic
+        parsed_scenarios[heuristic] = scenario
+
+    return {
+        "parsed_scenarios": parsed_scenarios,
+        "display_format": query_parser.format_for_display(parsed_scenario),
+        "original_prompt": message,
+        "catalog_version": catalog.version,
+    }
+
+
 def initial_routing(message: str) -> Dict:
     """
     Main routing function that checks for shortcodes.
@@ -170,10 +317,16 @@ def initial_routing(message: str) -> Dict:
     shortcode_match = check_shortcode(message)
     if shortcode_match:
         logger.info(f"Routing via shortcode to heuristic: {shortcode_match}")
-        return HEURISTIC_LIST[shortcode_match]
+        return get_catalog().name(shortcode_match)
+
+    catalog = get_catalog()
+    local_match = pre_route(message, catalog)
+    if local_match:
+        logger.info(f"Routing via pre-router to heuristic: {local_match}")
+        return catalog.name(local_match)
 
-    logger.debug("No shortcode found, attempting LLM matching")
-    heuristic, settings = match_heuristic_with_llm(message)
+    logger.debug("No shortcode or clear match found, attempting LLM matching")
+    heuristic, settings = match_heuristic_with_llm(message, catalog)
 
     if heuristic == "none":
         logger.info("No matching heuristic found")
@@ -0,0 +1,336 @@
+# rule_checker.py
+# Deterministic checks for the quantitative rules of a heuristic.
+# Threshold-style rules ("Commit >30% resources to single strategy", "Maintain 3+ independent
+# paths") are compiled into predicates on a named metric. The simulator is asked to report those
+# metrics in a fenced block at the end of its answer; the block is parsed and checked here, so a
+# corrective turn is only needed when a reported number actually breaks a rule.
+
+import re
+import json
+import logging
+import operator
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from heuristic_catalog import HeuristicCatalog
+from query_parser import repair_json
+
+logger = logging.getLogger(__name__)
+
+# A concession is disproportionate when we give this many times what we get back
+DISPROPORTION_RATIO = 1.5
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+# The condition a compliant value must meet, for each kind of threshold.
+# must_not_do thresholds describe the violation, so they are inverted.
+INVERTED = {">": "<=", ">=": "<", "<": ">=", "<=": ">"}
+
+_NUMBER = r"(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>%|:\s*1\b|x\b)?"
+# Explicit comparatives and the operator each one states, longest phrases first.
+# A rule needs one of these (or a "3+" / "50%+" floor) to be compiled: a bare number
+# says nothing about which side of it is allowed.
+COMPARATIVES = [
+    (
+        "no more than|not more than|no greater than|at most|up to|maximum of|maximum|max",
+        "<=",
+    ),
+    ("no less than|no fewer than|at least|minimum of|minimum|min", ">="),
+    (">|more than|greater than|over|above|exceeds|exceeding|exceed|beyond", ">"),
+    ("<|less than|fewer than|under|below", "<"),
+]
+COMPARATIVE_PATTERN = re.compile(
+    r"(?<![\w])(?P<comparative>"
+    + "|".join(phrases for phrases, _ in COMPARATIVES)
+    + r")\s*"
+    + _NUMBER
+)
+STATED = {
+    phrase: stated for phrases, stated in COMPARATIVES for phrase in phrases.split("|")
+}
+# "3+" and "50%+" are floors
+FLOOR_PATTERN = re.compile(r"(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>%)?\s*\+")
+# A multiple stated as a target ("3:1 advantage", "2x any requested concession") is a floor
+MULTIPLE_PATTERN = re.compile(r"(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>:\s*1\b|x\b)")
+# "Never exceed 3 escalation steps" states the opposite of its comparative
+NEGATION = re.compile(r"\b(?:never|not|don't|do not|avoid)\b")
+
+# Rules without a number that still have a measurable meaning, as
+# (metric, operator of the stated condition, threshold, unit)
+QUALITATIVE_RULES = [
+    (
+        re.compile(r"\bdisproportionate concessions?\b"),
+        ("concession_ratio", ">", DISPROPORTION_RATIO, "ratio"),
+    ),
+    (
+        re.compile(r"\bproportional concessions?\b"),
+        ("concession_ratio", "<=", DISPROPORTION_RATIO, "ratio"),
+    ),
+]
+
+FILLER_WORDS = {
+    "a",
+    "an",
+    "the",
+    "of",
+    "to",
+    "any",
+    "if",
+    "at",
+    "least",
+    "more",
+    "than",
+    "never",
+    "not",
+    "don",
+    "do",
+    "avoid",
+}
+
+# Rules open with what to do about a quantity ("Maintain 3+ paths", "Let an adversary
+# control >40% of supply"); the metric is the quantity, so these are dropped from its name
+LEADING_VERBS = {
+    "accept",
+    "allow",
+    "commit",
+    "ensure",
+    "have",
+    "hold",
+    "keep",
+    "let",
+    "maintain",
+    "make",
+    "plan",
+    "take",
+}
+
+UNIT_HINTS = {
+    "fraction": "a fraction between 0 and 1",
+    "ratio": "a ratio",
+    "count": "a count",
+}
+
+METRICS_FENCE = re.compile(r"```metrics\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+class CompiledRule:
+    """
+    One quantitative rule as a predicate on a metric: compliant when
+    value <condition> threshold.
+    """
+
+    def __init__(
+        self, text: str, kind: str, metric: str, condition: str, threshold, unit
+    ):
+        self.text = text
+        self.kind = kind
+        self.metric = metric
+        self.condition = condition
+        self.threshold = float(threshold)
+        self.unit = unit
+
+    def complies(self, value: float) -> bool:
+        return OPERATORS[self.condition](value, self.threshold)
+
+    @property
+    def requirement(self) -> str:
+        return f"{self.condition} {self.threshold:g}"
+
+
+def _metric_name(text: str, matched: str) -> str:
+    words = re.findall(r"[a-z]+", text.lower().replace(matched, " "))
+    words = [word for word in words if word not in FILLER_WORDS]
+    if len(words) > 1 and words[0] in LEADING_VERBS:
+        words = words[1:]
+    return "_".join(words)
+
+
+def compile_rule(text: str, kind: str) -> Optional[CompiledRule]:
+    """
+    Compile a threshold-style rule, or return None if it has no explicit threshold.
+    kind is "must_do" or "must_not_do"; a must_not_do threshold describes the violation.
+    """
+    lowered = text.lower()
+    for pattern, (metric, stated, threshold, unit) in QUALITATIVE_RULES:
+        if pattern.search(lowered):
+            condition = INVERTED[stated] if kind == "must_not_do" else stated
+            return CompiledRule(text, kind, metric, condition, threshold, unit)
+
+    match = COMPARATIVE_PATTERN.search(lowered)
+    if match is not None:
+        stated = STATED[match.group("comparative")]
+    else:
+        match = FLOOR_PATTERN.search(lowered) or MULTIPLE_PATTERN.search(lowered)
+        if match is None:
+            return None
+        stated = ">="
+    if NEGATION.search(lowered[: match.start()]):
+        stated = INVERTED[stated]
+
+    unit = {None: "count", "%": "fraction"}.get(match.group("unit"), "ratio")
+    number = float(match.group("number"))
+    threshold = number / 100 if unit == "fraction" else number
+    condition = INVERTED[stated] if kind == "must_not_do" else stated
+    metric = _metric_name(lowered, match.group(0))
+    if not metric:
+        return None
+    return CompiledRule(text, kind, metric, condition, threshold, unit)
+
+
+@lru_cache(maxsize=64)
+def compiled_rules(
+    catalog: HeuristicCatalog, heuristic: Optional[str]
+) -> Tuple[CompiledRule, ...]:
+    """
+    The quantitative rules of a heuristic, compiled once per catalog version.
+    Rules that state the same condition, e.g. a must_do and its must_not_do mirror,
+    are kept once so a single bad number is reported once.
+    """
+    details = catalog.get(heuristic) if heuristic else None
+    rules = details.get("rules") if details else None
+    if not isinstance(rules, dict):
+        return ()
+    compiled = {}
+    for kind in ("must_do", "must_not_do"):
+        for text in rules.get(kind, []):
+            rule = compile_rule(text, kind)
+            if rule is not None:
+                compiled.setdefault((rule.metric, rule.condition, rule.threshold), rule)
+    return tuple(compiled.values())
+
+
+def metrics_instructions(rules: Tuple[CompiledRule, ...]) -> Optional[str]:
+    """
+    Instructions asking the simulator to report the metrics the rules are checked on.
+    """
+    if not rules:
+        return None
+    metrics = {}
+    for rule in rules:
+        metrics.setdefault(rule.metric, (rule.unit, []))[1].append(rule.text)
+    lines = [
+        f"- {metric}: {UNIT_HINTS[unit]} (rule: {'; '.join(texts)})"
+        for metric, (unit, texts) in metrics.items()
+    ]
+    return (
+        "End every response with a fenced ```metrics block holding one JSON object "
+        "with your best numeric estimate for each of these metrics of the recommended plan:\n"
+        + "\n".join(lines)
+    )
+
+
+def extract_metrics(text: str) -> Tuple[str, Optional[Dict]]:
+    """
+    Split the last ```metrics block off a response.
+    Returns (text without the block, metrics or None if there was no usable block).
+    """
+    matches = list(METRICS_FENCE.finditer(text or ""))
+    if not matches:
+        return text, None
+    last = matches[-1]
+    stripped = (text[: last.start()] + text[last.end() :]).rstrip()
+    try:
+        metrics = repair_json(last.group(1))
+    except ValueError:
+        return stripped, None
+    return stripped, metrics if isinstance(metrics, dict) else None
+
+
+def _as_number(value, unit: str) -> Optional[float]:
+    if isinstance(value, str):
+        value = value.strip()
+        percent = value.endswith("%")
+        try:
+            number = float(value.rstrip("%").replace(",", ""))
+        except ValueError:
+            return None
+        return number / 100 if percent else _scaled(number, unit)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _scaled(float(value), unit)
+    return None
+
+
+def _scaled(number: float, unit: str) -> float:
+    # Fractions reported as whole percentages, e.g. 35 for 35%
+    if unit == "fraction" and 1 < number <= 100:
+        return number / 100
+    return number
+
+
+def check_metrics(metrics: Optional[Dict], rules: Tuple[CompiledRule, ...]) -> Dict:
+    """
+    Evaluate every rule against the reported metrics.
+    status is "compliant", "violations", or "unreported" when none of the metrics was reported.
+    """
+    report = {"status": "unreported", "violations": [], "passed": [], "missing": []}
+    if metrics is None:
+        report["missing"] = sorted({rule.metric for rule in rules})
+        return report
+    for rule in rules:
+        value = _as_number(metrics.get(rule.metric), rule.unit)
+        if value is None:
+            if rule.metric not in report["missing"]:
+                report["missing"].append(rule.metric)
+            continue
+        entry = {
+            "rule": rule.text,
+            "kind": rule.kind,
+            "metric": rule.metric,
+            "value": value,
+            "requirement": rule.requirement,
+        }
+        (report["passed"] if rule.complies(value) else report["violations"]).append(
+            entry
+        )
+    if report["violations"]:
+        report["status"] = "violations"
+    elif report["passed"]:
+        report["status"] = "compliant"
+    return report
+
+
+def check_response(
+    response: str, rules: Tuple[CompiledRule, ...]
+) -> Tuple[str, Optional[Dict]]:
+    """
+    Check a simulation response, either the JSON payload of an opening turn or the plain
+    text of a later one. Returns the response without its metrics block, and the
+    compliance report (None when the heuristic has no quantitative rules).
+    """
+    if not rules:
+        return response, None
+    try:
+        parsed = json.loads(response)
+    except (TypeError, ValueError):
+        parsed = None
+    if isinstance(parsed, dict) and isinstance(parsed.get("response"), str):
+        parsed["response"], metrics = extract_metrics(parsed["response"])
+        response = json.dumps(parsed)
+    else:
+        response, metrics = extract_metrics(response)
+    report = check_metrics(metrics, rules)
+    if report["violations"]:
+        logger.info(
+            f"Rule check found {len(report['violations'])} violation(s): "
+            + ", ".join(v["metric"] for v in report["violations"])
+        )
+    return response, report
+
+
+def correction_message(report: Dict) -> str:
+    """
+    The user turn that asks the simulator to fix the plan's violations.
+    """
+    lines = [
+        f"- \"{v['rule']}\": {v['metric']} is {v['value']:g}, it must be {v['requirement']}"
+        for v in report["violations"]
+    ]
+    return (
+        "Compliance check: the recommended plan breaks these rules:\n"
+        + "\n".join(lines)
+        + "\nRevise the plan so every rule is met, and report the updated metrics block."
+    )
@@ -0,0 +1,260 @@
+# scenario_cache.py
+# Caches the heuristic match and parsed scenario for a prompt so resubmitted scenarios skip the LLM round trips.
+# Keys are a hash of the normalized prompt plus the catalog's routing version; backends are pluggable.
+# Entries remember the heuristic they resolved to so a catalog reload can drop only the affected ones.
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = int(os.environ.get("SCENARIO_CACHE_TTL", 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SCENARIO_CACHE_MAX_ENTRIES", 1000))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Reduce a prompt to the form used for cache keys: case-folded with collapsed whitespace.
+    """
+    return re.sub(r"\s+", " ", (prompt or "").strip().casefold())
+
+
+def cache_key(prompt: str, catalog_version: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(catalog_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU backend. Values are stored serialized so callers never share mutable state.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: int, heuristic: str = None):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl_seconds, heuristic, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_heuristics(self, heuristics) -> int:
+        with self._lock:
+            stale = [
+                key
+                for key, (_, heuristic, _) in self._entries.items()
+                if heuristic in heuristics
+            ]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class DatabaseCacheBackend:
+    """
+    Backend stored in the scenario_cache_entry table through the app's SQLAlchemy db,
+    so cached scenarios survive restarts and are shared between workers.
+    Must be used inside an application context.
+    """
+
+    @staticmethod
+    @contextmanager
+    def _transaction():
+        """
+        Run the block in a database session of its own, committed on success and rolled
+        back if anything fails, e.g. two requests racing to insert the same key.
+        The request's db.session is never used, so a cache lookup cannot commit or
+        discard the handler's pending work, and a failed write cannot break it.
+        """
+        from sqlalchemy.orm import Session
+        from app import db
+
+        with Session(db.engine) as session, session.begin():
+            yield session
+
+    def get(self, key: str) -> Optional[str]:
+        from models import ScenarioCacheEntry
+
+        with self._transaction() as session:
+            entry = session.get(ScenarioCacheEntry, key)
+            if entry is None:
+                return None
+            if entry.expires_at <= datetime.utcnow():
+                session.delete(entry)
+                return None
+            return entry.value
+
+    def set(self, key: str, value: str, ttl_seconds: int, heuristic: str = None):
+        from models import ScenarioCacheEntry
+
+        now = datetime.utcnow()
+        with self._transaction() as session:
+            session.merge(
+                ScenarioCacheEntry(
+                    key=key,
+                    heuristic=heuristic,
+                    value=value,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=ttl_seconds),
+                )
+            )
+
+    def delete(self, key: str) -> None:
+        from models import ScenarioCacheEntry
+
+        with self._transaction() as session:
+            session.query(ScenarioCacheEntry).filter_by(key=key).delete()
+
+    def delete_heuristics(self, heuristics) -> int:
+        from models import ScenarioCacheEntry
+
+        with self._transaction() as session:
+            return (
+                session.query(ScenarioCacheEntry)
+                .filter(ScenarioCacheEntry.heuristic.in_(list(heuristics)))
+                .delete(synchronize_session=False)
+            )
+
+    def clear(self) -> None:
+        from models import ScenarioCacheEntry
+
+        with self._transaction() as session:
+            session.query(ScenarioCacheEntry).delete()
+
+    def purge_expired(self) -> int:
+        from models import ScenarioCacheEntry
+
+        with self._transaction() as session:
+            return (
+                session.query(ScenarioCacheEntry)
+                .filter(ScenarioCacheEntry.expires_at <= datetime.utcnow())
+                .delete()
+            )
+
+
+class ScenarioCache:
+    """
+    Front end over a cache backend that handles keys, serialization and hit/miss counters.
+    Backend failures are logged and treated as misses so the cache can never break routing.
+    """
+
+    def __init__(self, backend, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def get(self, prompt: str, catalog_version: str) -> Optional[Dict]:
+        try:
+            value = self.backend.get(cache_key(prompt, catalog_version))
+        except Exception as e:
+            logger.error(f"Scenario cache read failed: {e}")
+            value = None
+            self._count("errors")
+
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        logger.debug("Scenario cache hit")
+        return json.loads(value)
+
+    def set(self, prompt: str, catalog_version: str, scenario: Dict) -> None:
+        try:
+            self.backend.set(
+                cache_key(prompt, catalog_version),
+                json.dumps(scenario),
+                self.ttl_seconds,
+                heuristic=scenario.get("heuristic"),
+            )
+        except Exception as e:
+            logger.error(f"Scenario cache write failed: {e}")
+            self._count("errors")
+
+    def invalidate_heuristics(self, heuristics) -> int:
+        """
+        Drop every entry that resolved to one of the given heuristics.
+        """
+        try:
+            removed = self.backend.delete_heuristics(set(heuristics))
+        except Exception as e:
+            logger.error(f"Scenario cache invalidation failed: {e}")
+            self._count("errors")
+            return 0
+        logger.info(f"Invalidated {removed} cached scenarios for {sorted(heuristics)}")
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def build_cache_from_env() -> Optional[ScenarioCache]:
+    """
+    Build the scenario cache configured by SCENARIO_CACHE_BACKEND (memory, database or none).
+    """
+    backend_name = os.environ.get("SCENARIO_CACHE_BACKEND", "memory").lower()
+    if backend_name == "none":
+        return None
+    if backend_name == "database":
+        return ScenarioCache(DatabaseCacheBackend())
+    if backend_name != "memory":
+        logger.warning(f"Unknown SCENARIO_CACHE_BACKEND '{backend_name}', using memory")
+    return ScenarioCache(MemoryCacheBackend())
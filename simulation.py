@@ -1,22 +1,30 @@
 # simulation.py
 # Initlaizes the simulation and handles the conversation with the LLM with routing for follow up messages
-import anthropic
 import os
+import re
 import json
 import logging
 from datetime import datetime
+from llm_gateway import create_message, stream_message
+from prompts import cached_block, with_cache_breakpoint
+from history import ConversationHistory
+from model_tiers import model_for
 
 
 class WorldSimulator:
 
-    def __init__(self):
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-
-        self.client = anthropic.Client(api_key=api_key)
-        self.conversation_history = []  # Initialize empty conversation history
-        self.session_settings = {"first_message_processed": False}
+    def __init__(
+        self, conversation_history=None, summary="", summarized=0, history_budget=None
+    ):
+        # Initialize conversation history, optionally restored from a stored session.
+        # Older turns are folded into a running summary within the heuristic's budget.
+        self.history = ConversationHistory(
+            conversation_history,
+            summary=summary,
+            summarized=summarized,
+            **(history_budget or {}),
+        )
+        self.session_settings = {"first_message_processed": len(self.history) > 0}
         self.system_prompt = """
         <sys>
         Assistant is operating in WorldSIM CLI mode. Format all responses with:
@@ -63,88 +71,100 @@ class WorldSimulator:
         </sys>
         """
 
-    def initialize_simulation(self, user_input):
+    @property
+    def conversation_history(self):
+        """
+        Messages still held verbatim; older turns live in the history summary.
+        """
+        return self.history.messages()
+
+    @staticmethod
+    def parse_response(text):
+        """
+        Split a raw simulation response into the display text plus the state update
+        and available actions the client renders separately.
+        """
+        # Add separators between sections if they're not present. Fenced blocks (such as
+        # the metrics block the rule checker reads) are kept exactly as the model wrote them.
+        content = "".join(
+            part if part.startswith("```") else part.replace("\n\n", "\n---\n")
+            for part in re.split(r"(```.*?```)", text, flags=re.DOTALL)
+        )
+        return {
+            "response": content,
+            "state_update": (
+                text.split("State Update:")[-1].split("\n")[0].strip()
+                if "State Update:" in text
+                else None
+            ),
+            "available_actions": (
+                [
+                    action.strip()
+                    for action in text.split("Available actions:")[-1]
+                    .split("\n")[0]
+                    .split(",")
+                ]
+                if "Available actions:" in text
+                else []
+            ),
+        }
+
+    def _send(self, messages, on_chunk=None):
+        """
+        Send the messages to the LLM and return the response text.
+        When on_chunk is given the response is streamed and each text delta is passed to it.
+        """
+        request = dict(
+            model=model_for("simulation", "large"),
+            max_tokens=2000,
+            messages=messages,
+            # The WorldSIM system prompt never changes, so it is a cached prefix
+            system=[cached_block(self.system_prompt)],
+        )
+        if on_chunk is not None:
+            response = stream_message(on_chunk, **request)
+        else:
+            response = create_message(**request)
+        return response.content[0].text
+
+    def initialize_simulation(self, scenario, on_chunk=None):
+        """
+        Start the simulation from a scenario payload. A structured payload (as stored in
+        the session's world_state) is serialized once here; text is sent as is.
+        """
         try:
+            user_input = scenario if isinstance(scenario, str) else json.dumps(scenario)
             # Log the input for debugging
             logging.debug(f"Processing user input: {user_input}")
 
             if not self.session_settings.get("first_message_processed"):
                 # Handle first message
-                response = self.client.messages.create(
-                    model="claude-3-opus-20240229",
-                    max_tokens=2000,
-                    messages=[{"role": "user", "content": user_input}],
-                    system=self.system_prompt,
+                # The opening scenario is resent on every later turn, so cache it too
+                text = self._send(
+                    [with_cache_breakpoint({"role": "user", "content": user_input})],
+                    on_chunk=on_chunk,
                 )
 
                 # Log the raw response for debugging
-                logging.debug(f"Raw API response: {response.content[0].text}")
-
-                try:
-                    # Try to format the response content nicely
-                    content = response.content[0].text
-
-                    # Add separators between sections if they're not present
-                    content = content.replace("\n\n", "\n---\n")
-
-                    # Parse as JSON if possible for structured output
-                    try:
-                        parsed_response = {
-                            "response": content,
-                            "state_update": (
-                                response.content[0]
-                                .text.split("State Update:")[-1]
-                                .split("\n")[0]
-                                .strip()
-                                if "State Update:" in response.content[0].text
-                                else None
-                            ),
-                            "available_actions": (
-                                [
-                                    action.strip()
-                                    for action in response.content[0]
-                                    .text.split("Available actions:")[-1]
-                                    .split("\n")[0]
-                                    .split(",")
-                                ]
-                                if "Available actions:" in response.content[0].text
-                                else []
-                            ),
-                        }
-
-                        # Add user message and assistant response to conversation history
-                        self.conversation_history.append(
-                            {"role": "user", "content": user_input}
-                        )
-                        self.conversation_history.append(
-                            {"role": "assistant", "content": content}
-                        )
-                        self.session_settings["first_message_processed"] = True
-                        return json.dumps(parsed_response)
-                    except:
-                        # If not JSON, return formatted text
-                        return json.dumps(
-                            {
-                                "response": content,
-                            }
-                        )
-
-                except json.JSONDecodeError as je:
-                    logging.error(f"JSON parsing error: {je}")
-                    # Return a formatted error response
-                    return json.dumps(
-                        {
-                            "response": response.content[0].text,
-                        }
-                    )
+                logging.debug(f"Raw API response: {text}")
+
+                parsed_response = self.parse_response(text)
+
+                # Add user message and assistant response to conversation history
+                self.history.append(
+                    {"role": "user", "content": user_input},
+                    {"role": "assistant", "content": parsed_response["response"]},
+                )
+                self.session_settings["first_message_processed"] = True
+                return json.dumps(parsed_response)
             else:
-                return self.handle_subsequent_messages(user_input)
+                return self.handle_subsequent_messages(user_input, on_chunk=on_chunk)
 
         except Exception as e:
             logging.error(f"Error in simulation processing: {str(e)}")
             raise
 
-    def handle_subsequent_messages(self, user_message):
+    def handle_subsequent_messages(self, user_message, on_chunk=None):
         try:
             # Log the incoming message and conversation history
             logging.debug(f"Received user message: {user_message}")
@@ -158,30 +178,23 @@ class WorldSimulator:
             )
 
             # Construct the conversation history for the LLM
-            messages = self.conversation_history + [
+            messages = self.history.request_messages(
                 {"role": "user", "content": message_content}
-            ]
+            )
 
             # Send to the LLM
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=2000,
-                messages=messages,
-                system=self.system_prompt,
-            )
+            text = self._send(messages, on_chunk=on_chunk)
 
             # Log the response
-            logging.debug(f"Response from LLM: {response.content[0].text}")
+            logging.debug(f"Response from LLM: {text}")
 
             # Append the new user message and response to the conversation history
-            self.conversation_history.extend(
-                [
-                    {"role": "user", "content": message_content},
-                    {"role": "assistant", "content": response.content[0].text},
-                ]
+            self.history.append(
+                {"role": "user", "content": message_content},
+                {"role": "assistant", "content": text},
             )
 
-            return response.content[0].text
+            return text
 
         except Exception as e:
             logging.error(f"Error in handling subsequent messages: {str(e)}")
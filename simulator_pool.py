@@ -0,0 +1,188 @@
+# simulator_pool.py
+# Keeps one WorldSimulator per SimulationSession so each LLM call only carries that session's history.
+# Entries are evicted on idle time, session count and total history size, and rebuilt lazily via the factory.
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = int(os.environ.get("SIMULATOR_POOL_MAX_SESSIONS", 200))
+DEFAULT_IDLE_SECONDS = int(os.environ.get("SIMULATOR_POOL_IDLE_SECONDS", 1800))
+DEFAULT_MAX_HISTORY_CHARS = int(
+    os.environ.get("SIMULATOR_POOL_MAX_HISTORY_CHARS", 20_000_000)
+)
+
+
+def history_size(simulator) -> int:
+    """
+    Approximate memory footprint of a simulator, measured in characters of conversation history.
+    """
+    return sum(
+        len(str(message.get("content", "")))
+        for message in getattr(simulator, "conversation_history", [])
+    )
+
+
+class SimulatorPool:
+    """
+    LRU registry of simulators keyed by SimulationSession.id.
+    The factory is called with the session id whenever a simulator is missing
+    (first use or after eviction) and should rebuild it from the database.
+    When several workers serve the same session, validate(session_id, simulator) can
+    check a cached simulator against the database; stale ones are rebuilt.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[int], object],
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_seconds: int = DEFAULT_IDLE_SECONDS,
+        max_history_chars: int = DEFAULT_MAX_HISTORY_CHARS,
+        clock: Callable[[], float] = time.monotonic,
+        validate: Optional[Callable[[int, object], bool]] = None,
+    ):
+        self._factory = factory
+        self._validate = validate
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_history_chars = max_history_chars
+        self._clock = clock
+        self._entries: "OrderedDict[int, list]" = OrderedDict()
+        self._lock = threading.RLock()
+        # session id -> [lock, holders and waiters]; dropped when nobody uses it
+        self._turn_locks: Dict[int, list] = {}
+        self.evictions = 0
+        self.rehydrations = 0
+        self.stale = 0
+
+    def get(self, session_id: int):
+        """
+        Return the simulator for a session, rebuilding it through the factory if needed.
+        """
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry[1] = self._clock()
+                self._entries.move_to_end(session_id)
+                simulator = entry[0]
+
+        if entry is not None:
+            # Validate outside the lock, it usually means a database read
+            if self._validate is None or self._validate(session_id, simulator):
+                return simulator
+            with self._lock:
+                if self._entries.get(session_id) is entry:
+                    del self._entries[session_id]
+                self.stale += 1
+            logger.debug(f"Simulator for session {session_id} is stale, reloading")
+
+        # Build outside the lock so a slow database read does not block other sessions
+        simulator = self._factory(session_id)
+        with self._lock:
+            self.rehydrations += 1
+            existing = self._entries.get(session_id)
+            if existing is not None:
+                # Another request rebuilt it first - keep that one
+                existing[1] = self._clock()
+                self._entries.move_to_end(session_id)
+                return existing[0]
+            self._entries[session_id] = [simulator, self._clock()]
+            self._enforce_limits(keep=session_id)
+        logger.debug(f"Simulator for session {session_id} loaded into pool")
+        return simulator
+
+    @contextmanager
+    def turn(self, session_id: int):
+        """
+        Hold a session's simulator for one turn, from fetching it until the turn is saved.
+        Turns on the same session run one at a time, so two messages never append to the
+        same history and then race to store the same turn numbers.
+        """
+        with self._lock:
+            entry = self._turn_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield self.get(session_id)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._turn_locks[session_id]
+
+    def put(self, session_id: int, simulator) -> None:
+        """
+        Register a freshly created simulator for a session.
+        """
+        with self._lock:
+            self._entries[session_id] = [simulator, self._clock()]
+            self._entries.move_to_end(session_id)
+            self._enforce_limits(keep=session_id)
+
+    def discard(self, session_id: int) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def __contains__(self, session_id: int) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "history_chars": sum(
+                    history_size(entry[0]) for entry in self._entries.values()
+                ),
+                "evictions": self.evictions,
+                "rehydrations": self.rehydrations,
+                "stale": self.stale,
+            }
+
+    def _evict_idle(self) -> None:
+        cutoff = self._clock() - self.idle_seconds
+        # Entries are kept in LRU order, so idle ones are always at the front
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if entry[1] > cutoff:
+                break
+            self._evict(session_id, "idle")
+
+    def _enforce_limits(self, keep: Optional[int] = None) -> None:
+        while len(self._entries) > self.max_sessions:
+            if not self._evict_oldest(keep):
+                break
+
+        total = sum(history_size(entry[0]) for entry in self._entries.values())
+        while total > self.max_history_chars:
+            oldest = next(
+                (sid for sid in self._entries if sid != keep),
+                None,
+            )
+            if oldest is None:
+                break
+            total -= history_size(self._entries[oldest][0])
+            self._evict(oldest, "memory cap")
+
+    def _evict_oldest(self, keep: Optional[int]) -> bool:
+        for session_id in self._entries:
+            if session_id != keep:
+                self._evict(session_id, "session cap")
+                return True
+        return False
+
+    def _evict(self, session_id: int, reason: str) -> None:
+        self._entries.pop(session_id, None)
+        self.evictions += 1
+        logger.debug(f"Evicted simulator for session {session_id} ({reason})")
@@ -29,6 +29,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     function setLoading(isLoading) {
         loadingIndicator.style.visibility = isLoading ? 'visible' : 'hidden';
+        loadingIndicator.querySelector('.loading-text').textContent = 'Thinking';
         sendButton.disabled = isLoading;
         messageInput.disabled = isLoading;
         if (isLoading) {
@@ -41,7 +42,10 @@ document.addEventListener('DOMContentLoaded', function() {
         if (message) {
             addMessage(message, true);
             if (typeof socket !== 'undefined' && socket.emit) {
-                socket.emit('route_message', { input: message });
+                socket.emit('route_message', {
+                    input: message,
+                    session_id: typeof activeSessionId !== 'undefined' ? activeSessionId : null
+                });
             } else {
                 console.error('Socket is not defined or does not support emit.');
             }
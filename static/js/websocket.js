@@ -1,47 +1,118 @@
-let socket = io();
+// Websocket only: without long-polling a client never needs a sticky worker
+let socket = io({ transports: ['websocket'] });
 let currentScenario = null; // Store the current scenario for editing
+let streamingMessage = null; // Message element receiving streamed simulation text
+let activeSessionId = null; // Simulation whose room this socket listens to
 
 socket.on('connect', () => {
     console.log('Connected to server');
+    // A reconnect gets a new socket, so rejoin the running simulation's room
+    if (activeSessionId !== null) {
+        socket.emit('join_simulation', { session_id: activeSessionId });
+    }
 });
 
+// Append the parsed parts of a simulation response to a message element
+function renderSimulationResponse(messageElement, response) {
+    const content = document.createElement('p');
+    content.textContent = response.response;
+    messageElement.appendChild(content);
+
+    if (response.state_update) {
+        const stateUpdate = document.createElement('div');
+        stateUpdate.classList.add('state-update');
+        stateUpdate.textContent = `State Update: ${response.state_update}`;
+        messageElement.appendChild(stateUpdate);
+    }
+
+    if (response.available_actions && response.available_actions.length > 0) {
+        const actions = document.createElement('div');
+        actions.classList.add('available-actions');
+        actions.textContent = 'Available actions: ' + response.available_actions.join(', ');
+        messageElement.appendChild(actions);
+    }
+
+    renderCompliance(messageElement, response.compliance);
+}
+
+// Append the rule check report of a simulation turn, if the heuristic has quantitative rules
+function renderCompliance(messageElement, compliance) {
+    if (!compliance || compliance.status === 'unreported') {
+        return;
+    }
+    const report = document.createElement('div');
+    report.classList.add('compliance-report', `compliance-${compliance.status}`);
+    if (compliance.violations.length > 0) {
+        report.textContent = 'Rule check: ' + compliance.violations
+            .map((v) => `${v.rule} (${v.metric} = ${v.value}, needs ${v.requirement})`)
+            .join('; ');
+    } else {
+        report.textContent = `Rule check: ${compliance.passed.length} quantitative rules met`;
+    }
+    messageElement.appendChild(report);
+}
+
+function scrollChatToBottom() {
+    document.getElementById('chat-window').scrollTop = document.getElementById('chat-window').scrollHeight;
+}
+
 socket.on('simulation_response', (data) => {
     const messageElement = document.createElement('div');
     messageElement.classList.add('message', 'system-message');
 
     try {
-        const response = JSON.parse(data.response);
-        const content = document.createElement('p');
-        content.textContent = response.response;
-        messageElement.appendChild(content);
-
-        if (response.state_update) {
-            const stateUpdate = document.createElement('div');
-            stateUpdate.classList.add('state-update');
-            stateUpdate.textContent = `State Update: ${response.state_update}`;
-            messageElement.appendChild(stateUpdate);
-        }
-
-        if (response.available_actions && response.available_actions.length > 0) {
-            const actions = document.createElement('div');
-            actions.classList.add('available-actions');
-            actions.textContent = 'Available actions: ' + response.available_actions.join(', ');
-            messageElement.appendChild(actions);
-        }
+        renderSimulationResponse(messageElement, { ...JSON.parse(data.response), compliance: data.compliance });
     } catch (error) {
         console.error('Error parsing response:', error);
         const content = document.createElement('p');
         content.textContent = data.response;
         messageElement.appendChild(content);
+        renderCompliance(messageElement, data.compliance);
     }
 
     document.getElementById('chat-window').appendChild(messageElement);
-    document.getElementById('chat-window').scrollTop = document.getElementById('chat-window').scrollHeight;
+    scrollChatToBottom();
 
     // Hide loading indicator when response is received
     window.setLoading(false);
 });
 
+// Render streamed text as it arrives
+socket.on('simulation_chunk', (data) => {
+    if (!streamingMessage) {
+        streamingMessage = document.createElement('div');
+        streamingMessage.classList.add('message', 'system-message', 'streaming');
+        streamingMessage.appendChild(document.createElement('p'));
+        document.getElementById('chat-window').appendChild(streamingMessage);
+    }
+    streamingMessage.querySelector('p').textContent += data.delta;
+    scrollChatToBottom();
+});
+
+// Replace the streamed text with the parsed response
+function finishStreamingMessage(data) {
+    const messageElement = streamingMessage || document.createElement('div');
+    if (!streamingMessage) {
+        messageElement.classList.add('message', 'system-message');
+        document.getElementById('chat-window').appendChild(messageElement);
+    }
+    messageElement.classList.remove('streaming');
+    messageElement.innerHTML = '';
+    renderSimulationResponse(messageElement, data);
+    streamingMessage = null;
+    scrollChatToBottom();
+}
+
+socket.on('simulation_complete', (data) => {
+    finishStreamingMessage(data);
+    window.setLoading(false);
+});
+
+// A turn that broke a rule: show it, and keep waiting for the corrective turn
+socket.on('simulation_violation', (data) => {
+    finishStreamingMessage(data);
+});
+
 socket.on('simulation_confirmation', (data) => {
     const messageElement = document.createElement('div');
     messageElement.classList.add('message', 'system-message');
@@ -79,10 +150,17 @@ socket.on('simulation_confirmation', (data) => {
                 }).join('')}
             </div>
         </div>
+        ${data.heuristic === 'trading_strategy' && data.session_id !== null ? `
+        <div class="market-data-upload">
+            <label>Backtest on price data (OHLCV CSV):
+                <input type="file" accept=".csv,text/csv" onchange="uploadMarketData(this, ${data.session_id})">
+            </label>
+            <span class="upload-status"></span>
+        </div>` : ''}
         <div class="confirmation-buttons">
-            <button onclick="confirmSimulation(true)" class="btn">✓ Confirm Scenario</button>
+            <button onclick="confirmSimulation(true, ${data.session_id})" class="btn">✓ Confirm Scenario</button>
             <button onclick="editScenario()" class="btn edit">✎ Edit</button>
-            <button onclick="confirmSimulation(false)" class="btn">✗ Cancel</button>
+            <button onclick="confirmSimulation(false, ${data.session_id})" class="btn">✗ Cancel</button>
         </div>
     `;
     messageElement.appendChild(content);
@@ -94,7 +172,105 @@ socket.on('simulation_confirmation', (data) => {
     window.setLoading(false);
 });
 
+// Side-by-side comparison of one scenario under several heuristics (/compare a b <scenario>)
+const comparisonColumns = {}; // comparison id -> heuristic -> column element
+
+socket.on('comparison_started', (data) => {
+    const messageElement = document.createElement('div');
+    messageElement.classList.add('message', 'system-message', 'comparison');
+
+    const grid = document.createElement('div');
+    grid.classList.add('comparison-grid');
+    comparisonColumns[data.comparison_id] = {};
+    data.branches.forEach((branch) => {
+        const column = document.createElement('div');
+        column.classList.add('comparison-column', 'streaming');
+        const title = document.createElement('h4');
+        title.textContent = branch.name;
+        column.appendChild(title);
+        const body = document.createElement('div');
+        body.classList.add('comparison-body');
+        body.appendChild(document.createElement('p'));
+        column.appendChild(body);
+        if (branch.session_id !== null) {
+            const resume = document.createElement('button');
+            resume.classList.add('btn');
+            resume.textContent = 'Continue this simulation';
+            resume.onclick = () => {
+                activeSessionId = branch.session_id;
+                socket.emit('join_simulation', { session_id: branch.session_id });
+            };
+            column.appendChild(resume);
+        }
+        grid.appendChild(column);
+        comparisonColumns[data.comparison_id][branch.heuristic] = column;
+    });
+    messageElement.appendChild(grid);
+    document.getElementById('chat-window').appendChild(messageElement);
+    scrollChatToBottom();
+});
+
+socket.on('comparison_chunk', (data) => {
+    const column = (comparisonColumns[data.comparison_id] || {})[data.heuristic];
+    if (column) {
+        column.querySelector('.comparison-body p').textContent += data.delta;
+    }
+});
+
+socket.on('comparison_result', (data) => {
+    const column = (comparisonColumns[data.comparison_id] || {})[data.heuristic];
+    if (!column) {
+        return;
+    }
+    const body = column.querySelector('.comparison-body');
+    body.innerHTML = '';
+    column.classList.remove('streaming');
+    if (data.error) {
+        column.classList.add('error-message');
+        body.textContent = 'Error: ' + data.error;
+        return;
+    }
+    renderSimulationResponse(body, { ...data.result, compliance: data.compliance });
+});
+
+socket.on('comparison_summary', (data) => {
+    const messageElement = document.createElement('div');
+    messageElement.classList.add('message', 'system-message', 'comparison-summary');
+    const lines = data.rows.map((row) => {
+        if (row.error) {
+            return `${row.name}: failed (${row.error})`;
+        }
+        const check = row.compliance ? `, rule check ${row.compliance}` : '';
+        return `${row.name}: ${row.state_update || 'no state update'}${check}`;
+    });
+    if (data.shared_actions.length > 0) {
+        lines.push('Actions all heuristics propose: ' + data.shared_actions.join(', '));
+    }
+    lines.push(`Finished in ${(data.elapsed_ms / 1000).toFixed(1)}s ` +
+        `(slowest run ${(data.slowest_branch_ms / 1000).toFixed(1)}s)`);
+    lines.forEach((line) => {
+        const content = document.createElement('p');
+        content.textContent = line;
+        messageElement.appendChild(content);
+    });
+    document.getElementById('chat-window').appendChild(messageElement);
+    delete comparisonColumns[data.comparison_id];
+    scrollChatToBottom();
+
+    window.setLoading(false);
+});
+
+// Show where the request is in the shared LLM queue while it waits
+socket.on('queue_position', (data) => {
+    const label = document.querySelector('#loading-indicator .loading-text');
+    if (label) {
+        label.textContent = data.position > 1 ? `Queued (position ${data.position})` : 'Thinking';
+    }
+});
+
 socket.on('simulation_error', (data) => {
+    streamingMessage = null;
+    failPendingUploads('Upload failed');
     const messageElement = document.createElement('div');
     messageElement.classList.add('message', 'error-message');
     messageElement.textContent = 'Error: ' + data.error;
@@ -106,18 +282,68 @@ socket.on('simulation_error', (data) => {
 
 socket.on('disconnect', () => {
     console.log('Disconnected from server');
+    failPendingUploads('Upload interrupted, please try again');
     // Hide loading indicator on disconnect
     window.setLoading(false);
 });
 
 // Add to global scope for button onclick handlers
-window.confirmSimulation = function(confirmed) {
-    socket.emit('confirm_simulation', confirmed);
+window.confirmSimulation = function(confirmed, sessionId) {
+    // Send back the session id issued with the confirmation so the server can fetch it directly
+    socket.emit('confirm_simulation', {
+        confirmed: confirmed,
+        session_id: sessionId !== undefined ? sessionId : null
+    });
     if (confirmed) {
+        activeSessionId = sessionId !== undefined ? sessionId : null;
         window.setLoading(true);
     }
+    // Market data is only read when the simulation starts
+    document.querySelectorAll('.market-data-upload input').forEach((input) => {
+        input.disabled = true;
+    });
 }
 
+// Mark uploads still waiting for an answer as failed
+function failPendingUploads(message) {
+    document.querySelectorAll('.market-data-upload .upload-status').forEach((status) => {
+        if (status.textContent === 'Uploading...') {
+            status.textContent = message;
+        }
+    });
+}
+
+// Send an OHLCV CSV for the backtester before the simulation is confirmed
+window.uploadMarketData = function(input, sessionId) {
+    const file = input.files[0];
+    if (!file) return;
+    const status = input.closest('.market-data-upload').querySelector('.upload-status');
+    const limit = `${(MAX_MESSAGE_BYTES / 1000000).toFixed(1)} MB`;
+    if (file.size > MAX_MESSAGE_BYTES) {
+        status.textContent = `${file.name} is too large (limit ${limit})`;
+        return;
+    }
+    status.textContent = 'Uploading...';
+    const reader = new FileReader();
+    reader.onload = () => {
+        const payload = { session_id: sessionId, filename: file.name, csv: reader.result };
+        // A message over the server's limit drops the connection, so measure it as sent,
+        // with some room for the packet framing
+        if (new Blob([JSON.stringify(payload)]).size + 1024 > MAX_MESSAGE_BYTES) {
+            status.textContent = `${file.name} is too large (limit ${limit})`;
+            return;
+        }
+        socket.emit('upload_market_data', payload);
+    };
+    reader.readAsText(file);
+}
+
+socket.on('market_data_uploaded', (data) => {
+    document.querySelectorAll('.market-data-upload .upload-status').forEach((status) => {
+        status.textContent = `${data.filename}: ${data.bars} bars (${data.start} to ${data.end})`;
+    });
+});
+
 // Add edit functionality with null check
 window.editScenario = function() {
     const messageInput = document.getElementById('message-input');
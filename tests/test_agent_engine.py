@@ -0,0 +1,157 @@
+# test_agent_engine.py
+# Tests the batched agent-based engine and the local engine dispatch
+
+import sys
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent_engine
+from agent_engine import AgentEngine, normalize_groups, run_agent_simulation
+from heuristic_catalog import HeuristicCatalog
+from local_engines import run_local_engine
+
+GROUPS = [
+    {"name": "early adopters", "share": 0.2, "initial_state": 0.8, "influence": 0.9},
+    {
+        "name": "mainstream",
+        "share": 0.6,
+        "initial_state": 0.3,
+        "stubbornness": 0.1,
+        "susceptibility": 0.6,
+    },
+    {"name": "holdouts", "share": 0.2, "initial_state": 0.05, "stubbornness": 0.8},
+]
+SPEC = {"state_label": "share of EV buyers", "groups": GROUPS}
+
+CATALOG = HeuristicCatalog(
+    {
+        "heuristics": {
+            "multi_agent_forecast": {
+                "name": "Multi-Agent Forecast",
+                "description": "Agents",
+                "parameters": {"num_agents": 50, "simulation_steps": 40},
+            },
+            "trading_strategy": {
+                "name": "Trading Strategy",
+                "description": "Trade",
+                "parameters": {},
+            },
+        }
+    },
+    version="test",
+)
+
+
+def world_state(heuristic):
+    return {"parsed_scenario": {"goal": "x", "parameters": {"heuristic": heuristic}}}
+
+
+class TestNormalizeGroups(unittest.TestCase):
+    def test_shares_and_ranges(self):
+        groups = normalize_groups(
+            [
+                {"name": "a", "share": 3, "initial_state": 2, "drift": 1},
+                {"name": "b", "share": 1, "initial_state": 0.5},
+                {"name": "broken", "share": "lots"},
+            ]
+        )
+        self.assertEqual([g["name"] for g in groups], ["a", "b"])
+        self.assertAlmostEqual(sum(g["share"] for g in groups), 1.0)
+        self.assertEqual(groups[0]["initial_state"], 1.0)
+        self.assertEqual(groups[0]["drift"], 0.05)
+
+    def test_no_usable_groups(self):
+        with self.assertRaises(ValueError):
+            normalize_groups([{"name": "empty", "share": 0, "initial_state": 0.5}])
+
+
+class TestAgentEngine(unittest.TestCase):
+    def test_same_seed_same_numbers(self):
+        first = AgentEngine(GROUPS, num_agents=100, seed=7).run()
+        second = AgentEngine(GROUPS, num_agents=100, seed=7).run()
+        other = AgentEngine(GROUPS, num_agents=100, seed=8).run()
+        first.pop("elapsed_ms"), second.pop("elapsed_ms"), other.pop("elapsed_ms")
+        self.assertEqual(first, second)
+        self.assertNotEqual(first["final"], other["final"])
+
+    def test_group_sizes_follow_shares(self):
+        engine = AgentEngine(GROUPS, num_agents=10)
+        self.assertEqual(list(engine.group_of), [0, 0, 1, 1, 1, 1, 1, 1, 2, 2])
+        # Nobody listens to themselves
+        agents = engine.group_of.size
+        self.assertTrue((engine.neighbours != np.arange(agents)[None, :, None]).all())
+
+    def test_stops_early_on_convergence(self):
+        quiet = [dict(group, noise=0.0, drift=0.0) for group in GROUPS]
+        results = AgentEngine(quiet, num_agents=200, seed=1).run(
+            simulation_steps=500, convergence_threshold=0.001
+        )
+        self.assertTrue(results["converged"])
+        self.assertLess(results["steps_run"], 500)
+        self.assertEqual(results["converged_at"], results["steps_run"])
+
+    def test_max_iterations_caps_the_horizon(self):
+        results = AgentEngine(GROUPS, seed=1).run(
+            simulation_steps=500, convergence_threshold=0.0, max_iterations=25
+        )
+        self.assertEqual(results["steps_run"], 25)
+        self.assertFalse(results["converged"])
+        self.assertEqual(results["trajectory"][-1]["step"], 25)
+
+    def test_many_agent_steps_are_cheap(self):
+        results = AgentEngine(GROUPS, num_agents=1000, runs=32, seed=3).run(
+            simulation_steps=100, convergence_threshold=0.0
+        )
+        self.assertEqual(results["agent_steps"], 3_200_000)
+        self.assertLess(results["elapsed_ms"], 5000)
+
+
+class TestLocalEngines(unittest.TestCase):
+    def test_multi_agent_forecast_gets_local_results(self):
+        with mock.patch.object(agent_engine, "parameterize_agents", return_value=SPEC):
+            state = run_local_engine(world_state("multi_agent_forecast"), CATALOG, 5)
+
+        results = state["local_results"]
+        self.assertEqual(results["engine"], "agent_based")
+        self.assertEqual(results["num_agents"], 50)
+        self.assertLessEqual(results["steps_run"], 40)
+        self.assertEqual(results["seed"], 5)
+        self.assertIn("local_results_note", state)
+        # Results are computed once per session
+        self.assertIsNone(run_local_engine(state, CATALOG, 5))
+
+    def test_other_heuristics_have_no_engine(self):
+        self.assertIsNone(run_local_engine(world_state("trading_strategy"), CATALOG, 1))
+        self.assertIsNone(run_local_engine(None, CATALOG, 1))
+
+    def test_engine_failure_leaves_the_llm_alone(self):
+        with mock.patch.object(
+            agent_engine, "parameterize_agents", side_effect=ValueError("bad")
+        ):
+            self.assertIsNone(
+                run_local_engine(world_state("multi_agent_forecast"), CATALOG, 1)
+            )
+
+    def test_parameterization_escalates_once(self):
+        unusable = SimpleNamespace(
+            content=[SimpleNamespace(type="tool_use", input={"groups": []})]
+        )
+        usable = SimpleNamespace(content=[SimpleNamespace(type="tool_use", input=SPEC)])
+        with mock.patch.object(
+            agent_engine, "create_message", side_effect=[unusable, usable]
+        ) as create:
+            results = run_agent_simulation(
+                world_state("multi_agent_forecast"), {"num_agents": 20}, seed=2
+            )
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(results["state_label"], "share of EV buyers")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+# test_backtester.py
+# Tests the OHLCV backtester and its enforcement of the trading_strategy risk limits
+
+import sys
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backtester
+from backtester import (
+    DEFAULT_LIMITS,
+    backtest,
+    evaluate,
+    expand_candidates,
+    limit_violations,
+    parse_ohlcv,
+)
+from heuristic_catalog import HeuristicCatalog
+from local_engines import run_local_engine, simulation_payload
+
+
+def price_csv(closes, newest_first=False):
+    rows = [
+        f"2024-01-{1 + i // 24:02d}T{i % 24:02d}:00,{c},{c * 1.01},{c * 0.99},{c},100"
+        for i, c in enumerate(closes)
+    ]
+    if newest_first:
+        rows.reverse()
+    return "Date,Open,High,Low,Close,Volume\n" + "\n".join(rows)
+
+
+def bars(closes, lows=None):
+    closes = np.asarray(closes, dtype=float)
+    return {
+        "open": closes,
+        "high": closes * 1.001,
+        "low": closes * 0.999 if lows is None else np.asarray(lows, dtype=float),
+        "close": closes,
+    }
+
+
+RISKY = {
+    "name": "risky",
+    "family": "breakout",
+    "lookback": 5,
+    "position_size": 0.5,
+    "stop_loss": 0.1,
+    "take_profit": 0.1,
+}
+SAFE = {
+    "name": "safe",
+    "family": "breakout",
+    "lookback": 5,
+    "position_size": 0.1,
+    "stop_loss": 0.02,
+    "take_profit": 0.04,
+}
+
+
+class TestParseOhlcv(unittest.TestCase):
+    def test_columns_and_order(self):
+        closes = list(range(100, 160))
+        data = parse_ohlcv(price_csv(closes, newest_first=True))
+        self.assertEqual(data["close"], [float(c) for c in closes])
+        self.assertTrue(data["dates"][0] < data["dates"][-1])
+
+    def test_bad_rows_are_dropped(self):
+        text = (
+            price_csv(range(100, 160)) + "\n2024-02-01,x,1,1,1,1\n2024-02-02,5,4,3,6,1"
+        )
+        self.assertEqual(len(parse_ohlcv(text)["close"]), 60)
+
+    def test_unusable_files(self):
+        with self.assertRaises(ValueError):
+            parse_ohlcv("date,open,close\n2024-01-01,1,1")
+        with self.assertRaises(ValueError):
+            parse_ohlcv(price_csv(range(100, 110)))
+
+    def test_row_cap_keeps_latest(self):
+        data = parse_ohlcv(price_csv(range(100, 200)), max_rows=60)
+        self.assertEqual(data["close"][-1], 199.0)
+        self.assertEqual(len(data["close"]), 60)
+
+
+class TestRiskLimits(unittest.TestCase):
+    def test_compliant(self):
+        self.assertEqual(limit_violations(SAFE, DEFAULT_LIMITS), [])
+
+    def test_every_broken_limit_is_reported(self):
+        reasons = limit_violations(RISKY, DEFAULT_LIMITS)
+        self.assertIn("position size above max_position_size", reasons)
+        self.assertIn("stop loss missing or wider than stop_loss", reasons)
+        self.assertIn("risks more than 2% per trade", reasons)
+
+    def test_reward_to_risk(self):
+        combination = dict(SAFE, take_profit=0.03)
+        self.assertEqual(
+            limit_violations(combination, DEFAULT_LIMITS),
+            ["take profit below risk_reward_ratio x stop loss"],
+        )
+
+    def test_grid_expansion(self):
+        candidates = [
+            dict(SAFE, lookback=[5, 10], position_size=[0.05, 0.1]),
+            {"family": "unknown", "position_size": [0.1]},
+        ]
+        self.assertEqual(len(expand_candidates(candidates)), 4)
+
+
+class TestBacktest(unittest.TestCase):
+    def test_stop_loss_caps_the_loss(self):
+        # Breaks out at bar 6, then falls through the 2% stop
+        closes = [100, 100, 100, 100, 100, 100, 105, 105, 90, 90]
+        lows = [c * 0.999 for c in closes]
+        lows[7] = 104
+        metrics = backtest([dict(SAFE, take_profit=0.5)], bars(closes, lows))
+        self.assertEqual(metrics["trades"][0], 1)
+        # Gapped through the stop at 102.9, so filled at the open of 90
+        self.assertAlmostEqual(metrics["total_return"][0], 0.1 * (90 / 105 - 1))
+
+    def test_combinations_are_independent(self):
+        closes = 100 + np.cumsum(np.random.default_rng(1).normal(0.1, 1, 300))
+        combinations = expand_candidates(
+            [dict(SAFE, lookback=[5, 10, 20], position_size=[0.05, 0.1])]
+        )
+        together = backtest(combinations, bars(closes))
+        for row, combination in enumerate(combinations):
+            alone = backtest([combination], bars(closes))
+            self.assertAlmostEqual(
+                together["total_return"][row], alone["total_return"][0]
+            )
+
+
+class TestEvaluate(unittest.TestCase):
+    def setUp(self):
+        closes = 100 * np.exp(np.cumsum(np.random.default_rng(2).normal(0, 0.01, 400)))
+        self.market_data = {
+            **{key: list(values) for key, values in bars(closes).items()},
+            "dates": [str(i) for i in range(400)],
+        }
+
+    def test_rejections_and_ranking(self):
+        results = evaluate(
+            [dict(SAFE, lookback=[10, 20]), RISKY], self.market_data, DEFAULT_LIMITS
+        )
+        self.assertEqual(results["evaluated"], 3)
+        self.assertEqual(results["accepted"], 2)
+        self.assertEqual(results["rejected"]["risks more than 2% per trade"], 1)
+        self.assertEqual(results["rejected_examples"][0]["name"], "risky")
+        sharpes = [best["sharpe"] for best in results["best"]]
+        self.assertEqual(sharpes, sorted(sharpes, reverse=True))
+
+    def test_drawdown_limit(self):
+        results = evaluate(
+            [SAFE], self.market_data, dict(DEFAULT_LIMITS, max_drawdown=0)
+        )
+        self.assertEqual(results["accepted"], 0)
+        self.assertEqual(results["rejected"], {"drawdown above max_drawdown": 1})
+
+
+class TestEngineEntry(unittest.TestCase):
+    def test_uploaded_data_is_backtested_but_not_sent_to_the_simulator(self):
+        catalog = HeuristicCatalog(
+            {
+                "heuristics": {
+                    "trading_strategy": {
+                        "name": "Trading Strategy",
+                        "description": "Trade",
+                        "parameters": {"max_position_size": 0.05},
+                    }
+                }
+            },
+            version="test",
+        )
+        world_state = {
+            "parsed_scenario": {"parameters": {"heuristic": "trading_strategy"}},
+            "market_data": parse_ohlcv(price_csv(range(100, 200))),
+        }
+        with mock.patch.object(
+            backtester, "propose_candidates", return_value=[SAFE]
+        ) as propose:
+            state = run_local_engine(world_state, catalog, seed=1)
+
+        self.assertEqual(propose.call_args[0][1]["max_position_size"], 0.05)
+        results = state["local_results"]
+        self.assertEqual(results["engine"], "backtest")
+        self.assertEqual(
+            results["rejected"], {"position size above max_position_size": 1}
+        )
+        payload = simulation_payload(state)
+        self.assertNotIn("market_data", payload)
+        self.assertIn("local_results", payload)
+
+    def test_without_upload_the_llm_works_alone(self):
+        self.assertIsNone(backtester.run_backtest({"parsed_scenario": {}}, {}, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+# test_comparison.py
+# Tests the /compare command parsing and the concurrent fan-out of one scenario to several heuristics
+
+import sys
+import os
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heuristic_catalog import HeuristicCatalog
+from simulation import WorldSimulator
+from comparison import parse_compare_command, run_comparison
+
+CATALOG = HeuristicCatalog(
+    {
+        "heuristics": {
+            "corporate_negotiation": {
+                "name": "Corporate Negotiation",
+                "description": "Negotiate",
+                "aliases": ["negotiation"],
+                "parameters": {"timeout_seconds": 5},
+            },
+            "geopolitical_strategy": {
+                "name": "Geopolitical Strategy",
+                "description": "Statecraft",
+                "aliases": ["geopolitics"],
+                "parameters": {"timeout_seconds": 5},
+                "rules": {"must_not_do": ["Commit >30% resources to single strategy"]},
+            },
+        }
+    },
+    version="test",
+)
+
+
+def branches(*heuristics):
+    return [
+        {
+            "heuristic": heuristic,
+            "world_state": {
+                "parsed_scenario": {"parameters": {"heuristic": heuristic}}
+            },
+            "session_id": None,
+            "seed": index,
+        }
+        for index, heuristic in enumerate(heuristics)
+    ]
+
+
+class TestParseCompareCommand(unittest.TestCase):
+    def test_aliases_and_ids_before_the_scenario(self):
+        heuristics, scenario = parse_compare_command(
+            {"input": "/compare negotiation geopolitical_strategy Two firms merge"},
+            CATALOG,
+        )
+        self.assertEqual(heuristics, ["corporate_negotiation", "geopolitical_strategy"])
+        self.assertEqual(scenario, "Two firms merge")
+
+    def test_comma_separated_and_explicit_lists(self):
+        heuristics, _ = parse_compare_command(
+            "/compare /negotiation,/geopolitics Talks", CATALOG
+        )
+        self.assertEqual(heuristics, ["corporate_negotiation", "geopolitical_strategy"])
+        self.assertEqual(
+            parse_compare_command(
+                {"input": "Talks", "heuristics": ["geopolitics", "negotiation"]},
+                CATALOG,
+            ),
+            (["geopolitical_strategy", "corporate_negotiation"], "Talks"),
+        )
+
+    def test_unusable_requests(self):
+        for message in (
+            "/compare negotiation Talks",
+            "/compare negotiation negotiation Talks",
+            "/compare negotiation geopolitics",
+            {"input": "Talks", "heuristics": ["negotiation", "astrology"]},
+        ):
+            with self.assertRaises(ValueError, msg=message):
+                parse_compare_command(message, CATALOG)
+
+
+class TestRunComparison(unittest.TestCase):
+    def test_branches_run_concurrently_and_stream_separately(self):
+        def send(simulator, messages, on_chunk=None):
+            time.sleep(0.3)
+            on_chunk("text")
+            return "Plan.\nState Update: stable\nAvailable actions: Wait, Talk"
+
+        chunks, finished = [], []
+        lock = threading.Lock()
+
+        def chunk_handler(heuristic):
+            def emit(delta):
+                with lock:
+                    chunks.append((heuristic, delta))
+
+            return emit
+
+        started = time.perf_counter()
+        with mock.patch.object(
+            WorldSimulator, "_send", autospec=True, side_effect=send
+        ):
+            summary = run_comparison(
+                branches("corporate_negotiation", "geopolitical_strategy"),
+                CATALOG,
+                chunk_handler,
+                finished.append,
+            )
+        elapsed = time.perf_counter() - started
+
+        # Close to one run, not the sum of both
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(len(finished), 2)
+        self.assertEqual(
+            sorted(chunks),
+            [("corporate_negotiation", "text"), ("geopolitical_strategy", "text")],
+        )
+        self.assertEqual(
+            summary["heuristics"], ["corporate_negotiation", "geopolitical_strategy"]
+        )
+        self.assertEqual(summary["shared_actions"], ["talk", "wait"])
+        self.assertEqual(summary["rows"][0]["state_update"], "stable")
+        # Only the heuristic with quantitative rules gets a rule check
+        self.assertIsNone(summary["rows"][0]["compliance"])
+        self.assertEqual(summary["rows"][1]["compliance"], "unreported")
+
+    def test_a_failed_branch_does_not_stop_the_others(self):
+        def send(simulator, messages, on_chunk=None):
+            if "geopolitical_strategy" in messages[0]["content"][0]["text"]:
+                raise RuntimeError("provider down")
+            return "Plan.\nAvailable actions: Wait"
+
+        finished = []
+        with mock.patch.object(
+            WorldSimulator, "_send", autospec=True, side_effect=send
+        ):
+            summary = run_comparison(
+                branches("corporate_negotiation", "geopolitical_strategy"),
+                CATALOG,
+                lambda heuristic: None,
+                finished.append,
+            )
+
+        errors = {result["heuristic"]: result.get("error") for result in finished}
+        self.assertIsNone(errors["corporate_negotiation"])
+        self.assertEqual(errors["geopolitical_strategy"], "provider down")
+        self.assertEqual(summary["rows"][1]["error"], "provider down")
+        self.assertEqual(summary["shared_actions"], ["wait"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+# test_deadlines.py
+# Tests deadline scopes and how the LLM gateway enforces them
+
+import sys
+import os
+import time
+import threading
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anthropic
+import httpx
+
+from deadlines import DeadlineExceeded, current_deadline, deadline_scope
+from llm_gateway import LLMGateway
+
+
+class FakeMessages:
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return self.behaviour(kwargs)
+
+    def stream(self, **kwargs):
+        self.requests.append(kwargs)
+        return FakeStream(self.behaviour(kwargs))
+
+
+class FakeStream:
+    """
+    A messages.stream() context whose text_stream yields the given items and raises
+    any exception among them.
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        for item in self.items:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def get_final_message(self):
+        return "".join(self.items)
+
+
+def gateway_with(behaviour):
+    gateway = LLMGateway(max_workers=2, limiter=None, sleep=lambda seconds: None)
+    messages = FakeMessages(behaviour)
+    gateway._client = type("Client", (), {"messages": messages})()
+    return gateway, messages
+
+
+class TestDeadlineScope(unittest.TestCase):
+    def test_budget_and_defaults(self):
+        """A heuristic budget sets the limits and missing values use the defaults"""
+        with deadline_scope(
+            budget={"timeout_seconds": 30, "max_retries": 1}
+        ) as deadline:
+            self.assertIs(current_deadline(), deadline)
+            self.assertEqual(deadline.max_retries, 1)
+            self.assertLessEqual(deadline.remaining(), 30)
+        self.assertIsNone(current_deadline())
+
+    def test_nested_scope_never_extends_outer(self):
+        """An inner budget cannot outlive the deadline it runs under"""
+        with deadline_scope(5, label="scenario routing"):
+            with deadline_scope(300, max_retries=4, label="scenario parsing") as inner:
+                self.assertLessEqual(inner.remaining(), 5)
+                self.assertEqual(inner.max_retries, 4)
+                self.assertIn("scenario routing", str(inner.exceeded()))
+
+
+class TestGatewayDeadlines(unittest.TestCase):
+    def test_remaining_time_is_the_request_timeout(self):
+        """Each call carries the time left as its timeout"""
+        gateway, messages = gateway_with(lambda kwargs: "ok")
+        with deadline_scope(20):
+            self.assertEqual(gateway.create(model="m", max_tokens=1, messages=[]), "ok")
+        self.assertLessEqual(messages.requests[0]["timeout"], 20)
+
+    def test_hung_call_is_abandoned_at_the_deadline(self):
+        """The caller gets DeadlineExceeded instead of waiting on a hung request"""
+        release = threading.Event()
+        gateway, _ = gateway_with(lambda kwargs: release.wait(5))
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            with deadline_scope(0.2, label="simulation turn"):
+                gateway.create(model="m", max_tokens=1, messages=[])
+        release.set()
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_transient_errors_follow_max_retries(self):
+        """Connection failures are retried up to the budget's max_retries"""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+        def fail(kwargs):
+            raise anthropic.APIConnectionError(request=request)
+
+        gateway, messages = gateway_with(fail)
+        with self.assertRaises(anthropic.APIConnectionError):
+            with deadline_scope(30, max_retries=2):
+                gateway.create(model="m", max_tokens=1, messages=[])
+        self.assertEqual(len(messages.requests), 3)
+
+    def test_expired_deadline_makes_no_call(self):
+        gateway, messages = gateway_with(lambda kwargs: "ok")
+        with deadline_scope(0):
+            with self.assertRaises(DeadlineExceeded):
+                gateway.create(model="m", max_tokens=1, messages=[])
+        self.assertEqual(messages.requests, [])
+
+
+class TestGatewayStreaming(unittest.TestCase):
+    def setUp(self):
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        self.error = anthropic.APIConnectionError(request=request)
+
+    def test_failure_before_any_text_is_retried(self):
+        attempts = iter([[self.error], ["Hel", "lo"]])
+        gateway, messages = gateway_with(lambda kwargs: next(attempts))
+        deltas = []
+        with deadline_scope(30, max_retries=2):
+            final = gateway.stream(deltas.append, model="m", max_tokens=1, messages=[])
+        self.assertEqual(final, "Hello")
+        self.assertEqual(deltas, ["Hel", "lo"])
+        self.assertEqual(len(messages.requests), 2)
+
+    def test_stream_is_not_replayed_after_text_was_sent(self):
+        """A retry would send the caller the same text twice"""
+        gateway, messages = gateway_with(lambda kwargs: ["Hel", self.error])
+        deltas = []
+        with self.assertRaises(anthropic.APIConnectionError):
+            with deadline_scope(30, max_retries=2):
+                gateway.stream(deltas.append, model="m", max_tokens=1, messages=[])
+        self.assertEqual(deltas, ["Hel"])
+        self.assertEqual(len(messages.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,136 @@
+# test_forecasting.py
+# Tests the local time-series forecasting engine behind standard_forecast
+
+import sys
+import os
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forecasting import (
+    decompose,
+    extract_series,
+    forecast_series,
+    prepare_series,
+    run_forecast,
+)
+from heuristic_catalog import HeuristicCatalog
+from local_engines import run_local_engine
+
+STEPS = np.arange(96)
+SEASONAL = 100 + 0.5 * STEPS + 10 * np.sin(2 * np.pi * STEPS / 12)
+NOISY = SEASONAL + np.random.default_rng(0).normal(0, 1, STEPS.size)
+
+CATALOG = HeuristicCatalog(
+    {
+        "heuristics": {
+            "standard_forecast": {
+                "name": "Standard Forecast",
+                "description": "Forecast",
+                "parameters": {"forecast_horizon": 6, "min_data_points": 5},
+            }
+        }
+    },
+    version="test",
+)
+
+
+class TestPrepareSeries(unittest.TestCase):
+    def test_lookback_and_minimum(self):
+        ready, skipped = prepare_series(
+            {"long": list(range(50)), "short": [1, 2, 3], "text": ["a", "b"]},
+            max_lookback=20,
+            min_data_points=10,
+        )
+        self.assertEqual(list(ready), ["long"])
+        self.assertEqual(ready["long"][0], 30)
+        self.assertEqual(ready["long"].size, 20)
+        self.assertIn("at least 10", skipped["short"])
+        self.assertIn("not numeric", skipped["text"])
+
+    def test_missing_values_are_dropped(self):
+        ready, _ = prepare_series({"s": [1, None, 3, float("nan"), 5]}, 10, 3)
+        self.assertEqual(list(ready["s"]), [1.0, 3.0, 5.0])
+
+
+class TestDecompose(unittest.TestCase):
+    def test_recovers_seasonal_pattern(self):
+        seasonal = decompose(SEASONAL[None, :], 12)[0]
+        expected = 10 * np.sin(2 * np.pi * np.arange(12) / 12)
+        self.assertLess(np.abs(seasonal - expected).max(), 0.5)
+
+    def test_too_short_for_two_seasons(self):
+        self.assertFalse(decompose(SEASONAL[None, :20], 12).any())
+
+
+class TestForecastSeries(unittest.TestCase):
+    def test_forecast_follows_trend_and_season(self):
+        results = forecast_series({"sales": NOISY}, {"forecast_horizon": 12}, seed=1)
+        forecast = results["forecasts"]["sales"]
+        future = np.arange(96, 108)
+        truth = 100 + 0.5 * future + 10 * np.sin(2 * np.pi * future / 12)
+        self.assertTrue(forecast["seasonal"])
+        self.assertEqual(len(forecast["forecast"]), 12)
+        self.assertLess(np.abs(np.array(forecast["forecast"]) - truth).mean(), 3)
+        lower, upper = np.array(forecast["lower"]), np.array(forecast["upper"])
+        self.assertTrue((lower < upper).all())
+        # Intervals widen with the horizon
+        self.assertGreater(upper[-1] - lower[-1], upper[0] - lower[0])
+
+    def test_wider_confidence_wider_interval(self):
+        narrow = forecast_series({"s": NOISY}, {"confidence_interval": 0.5}, seed=1)
+        wide = forecast_series({"s": NOISY}, {"confidence_interval": 0.99}, seed=1)
+        width = lambda r: np.subtract(
+            r["forecasts"]["s"]["upper"], r["forecasts"]["s"]["lower"]
+        ).mean()
+        self.assertGreater(width(wide), width(narrow))
+
+    def test_reproducible(self):
+        first = forecast_series({"s": NOISY}, seed=4)
+        second = forecast_series({"s": NOISY}, seed=4)
+        self.assertEqual(first["forecasts"], second["forecasts"])
+
+    def test_many_series_of_mixed_length(self):
+        series = {f"s{i}": NOISY[: 40 + i % 3] + i for i in range(60)}
+        results = forecast_series(series, {"min_data_points": 30}, seed=0)
+        self.assertEqual(len(results["forecasts"]), 60)
+        self.assertEqual(results["forecasts"]["s1"]["points_used"], 41)
+
+
+class TestEngineEntry(unittest.TestCase):
+    def test_series_from_prompt(self):
+        self.assertEqual(
+            extract_series("Sales were 120, 135, 150.5 and then 90; 80; 70 units"),
+            {"series 1": [120.0, 135.0, 150.5], "series 2": [90.0, 80.0, 70.0]},
+        )
+        self.assertEqual(extract_series("In 2024 we sold 3 cars"), {})
+
+    def test_thousands_separators_in_prompt(self):
+        self.assertEqual(
+            extract_series("Units: 1,200, 1,350, 1,500, 1,620"),
+            {"series 1": [1200.0, 1350.0, 1500.0, 1620.0]},
+        )
+        self.assertEqual(
+            extract_series("Revenue 12,500.5; 13,000; 990"),
+            {"series 1": [12500.5, 13000.0, 990.0]},
+        )
+
+    def test_no_data_leaves_forecast_to_llm(self):
+        self.assertIsNone(run_forecast({"original_prompt": "Forecast demand"}, {}, 0))
+
+    def test_supplied_series_through_local_engines(self):
+        world_state = {
+            "parsed_scenario": {"parameters": {"heuristic": "standard_forecast"}},
+            "original_prompt": "Forecast these",
+            "series": {"visits": list(NOISY[:30])},
+        }
+        state = run_local_engine(world_state, CATALOG, seed=3)
+        results = state["local_results"]
+        self.assertEqual(results["engine"], "time_series_forecast")
+        self.assertEqual(len(results["forecasts"]["visits"]["forecast"]), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
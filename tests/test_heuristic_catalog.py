@@ -0,0 +1,149 @@
+# test_heuristic_catalog.py
+# Tests loading, validation and lookups of the heuristic catalog
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heuristic_catalog import CatalogRegistry, HeuristicCatalog, HEURISTICS_PATH
+
+
+class TestHeuristicCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = HeuristicCatalog.from_file(HEURISTICS_PATH)
+
+    def test_loads_repository_catalog(self):
+        """The shipped heuristics.json loads and validates"""
+        self.assertIn("trading_strategy", self.catalog)
+        self.assertEqual(self.catalog.name("trading_strategy"), "Trading Strategy")
+        self.assertEqual(len(self.catalog.version), 16)
+        self.assertEqual(self.catalog.parameters("default_agent"), {})
+
+    def test_shortcodes_and_aliases(self):
+        """Ids and aliases resolve in a single scan, case-insensitively"""
+        self.assertEqual(
+            self.catalog.find_shortcode("Run /Negotiation now"), "corporate_negotiation"
+        )
+        self.assertEqual(
+            self.catalog.find_shortcode("use /multi_agent_forecast."),
+            "multi_agent_forecast",
+        )
+        self.assertIsNone(self.catalog.find_shortcode("a/negotiation"))
+        self.assertIsNone(self.catalog.find_shortcode("/negotiations"))
+        self.assertIsNone(self.catalog.find_shortcode(""))
+
+    def test_prompt_fragment(self):
+        """Prompt fragments include parameters and rules"""
+        fragment = self.catalog.prompt_fragment("trading_strategy")
+        self.assertIn("stop_loss: 0.02", fragment)
+        self.assertIn("- Risk more than 2% per trade", fragment)
+
+    def test_validation(self):
+        """Malformed catalogs and clashing aliases are rejected"""
+        with self.assertRaises(ValueError):
+            HeuristicCatalog({"heuristics": {"x": {"name": "X"}}}, "v")
+        with self.assertRaises(ValueError):
+            HeuristicCatalog(
+                {
+                    "heuristics": {
+                        "a": {"name": "A", "description": "", "aliases": ["b"]},
+                        "b": {"name": "B", "description": ""},
+                    }
+                },
+                "v",
+            )
+
+
+class TestCatalogReload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "heuristics.json")
+        shutil.copy(HEURISTICS_PATH, self.path)
+        self.registry = CatalogRegistry(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def edit(self, change):
+        with open(self.path) as f:
+            data = json.load(f)
+        change(data["heuristics"])
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+    def test_reload_reports_changed_heuristics(self):
+        """Editing one rule swaps the version and reports only that heuristic"""
+        original = self.registry.current()
+        events = []
+        self.registry.on_reload(lambda new, old, changed: events.append(changed))
+
+        self.edit(
+            lambda h: h["trading_strategy"]["rules"]["must_do"].append("Log trades")
+        )
+        result = self.registry.reload()
+
+        self.assertEqual(result["changed"], ["trading_strategy"])
+        self.assertEqual(events, [{"trading_strategy"}])
+        self.assertNotEqual(self.registry.current().version, original.version)
+        # Rule edits do not change what the routing prompts see
+        self.assertEqual(
+            self.registry.current().routing_version, original.routing_version
+        )
+
+    def test_pinned_versions_survive_reload(self):
+        """Sessions keep the catalog version they started with"""
+        original = self.registry.current()
+        self.edit(lambda h: h["trading_strategy"]["parameters"].update(stop_loss=0.01))
+        self.registry.reload()
+
+        self.assertIs(self.registry.get(original.version), original)
+        self.assertEqual(
+            self.registry.get().parameters("trading_strategy")["stop_loss"], 0.01
+        )
+        self.assertIs(self.registry.get("unknown"), self.registry.current())
+
+    def test_invalid_file_keeps_current_catalog(self):
+        """A broken edit is rejected and the current catalog stays in place"""
+        original = self.registry.current()
+        with open(self.path, "w") as f:
+            f.write("{not json")
+
+        with self.assertRaises(ValueError):
+            self.registry.reload()
+        self.assertIs(self.registry.current(), original)
+
+    def test_non_object_entry_is_rejected(self):
+        """A heuristic that is not an object is a ValueError, like any other bad edit"""
+        original = self.registry.current()
+        self.edit(lambda h: h.update(x="oops"))
+
+        with self.assertRaises(ValueError):
+            self.registry.reload()
+        self.assertIsNone(self.registry.reload_if_modified())
+        self.assertIs(self.registry.current(), original)
+
+    def test_watch_survives_a_failed_poll(self):
+        """An unexpected error in one poll does not end the watch loop"""
+        polls = []
+
+        def sleep(interval):
+            if len(polls) == 2:
+                raise KeyboardInterrupt
+            polls.append(interval)
+
+        with mock.patch.object(
+            self.registry, "reload_if_modified", side_effect=RuntimeError("boom")
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                self.registry.watch(1, sleep=sleep)
+        self.assertEqual(polls, [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
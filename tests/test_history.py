@@ -0,0 +1,134 @@
+# test_history.py
+# Tests the bounded conversation history and rolling summary
+
+import sys
+import os
+import unittest
+from concurrent.futures import Future
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadlines import current_deadline, deadline_scope
+from history import ConversationHistory, SUMMARY_PREFIX
+from rate_limiter import current_call_context, llm_call_context
+
+
+class DeferredExecutor:
+    """Runs submitted work only when asked, like a slow background summary."""
+
+    def __init__(self):
+        self.queue = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queue.append((future, fn, args))
+        return future
+
+    def run_all(self):
+        for future, fn, args in self.queue:
+            future.set_result(fn(*args))
+        self.queue = []
+
+
+def exchange(n):
+    return (
+        {"role": "user", "content": f"user {n}"},
+        {"role": "assistant", "content": f"assistant {n}"},
+    )
+
+
+def fake_summarize(summary, turns, max_tokens):
+    return (summary + " " if summary else "") + ",".join(
+        message["content"] for message in turns if message["role"] == "user"
+    )
+
+
+class TestConversationHistory(unittest.TestCase):
+    def setUp(self):
+        self.executor = DeferredExecutor()
+        self.history = ConversationHistory(
+            max_turns=2, summarize=fake_summarize, executor=self.executor
+        )
+
+    def contents(self, messages):
+        # Cache breakpoints turn some contents into text blocks
+        return [
+            (
+                message["content"]
+                if isinstance(message["content"], str)
+                else message["content"][0]["text"]
+            )
+            for message in messages
+        ]
+
+    def test_window_is_bounded_once_summary_is_ready(self):
+        """Older turns are folded into the summary and the window stays flat"""
+        for n in range(6):
+            self.history.append(*exchange(n))
+        # Turns that arrive while a summary is running are folded by the next one
+        for _ in range(2):
+            self.executor.run_all()
+            self.history.request_messages({"role": "user", "content": "next"})
+
+        messages = self.history.request_messages({"role": "user", "content": "next"})
+        contents = self.contents(messages)
+
+        # Opening exchange, summary pair, last two turns, new message
+        self.assertEqual(len(messages), 2 + 2 + 4 + 1)
+        self.assertEqual(contents[:2], ["user 0", "assistant 0"])
+        self.assertTrue(contents[2].startswith(SUMMARY_PREFIX))
+        self.assertIn("user 1 user 2,user 3", contents[2])
+        self.assertEqual(contents[-3:], ["user 5", "assistant 5", "next"])
+
+    def test_turns_stay_verbatim_while_summary_is_pending(self):
+        """Nothing is dropped before the background summary completes"""
+        for n in range(5):
+            self.history.append(*exchange(n))
+
+        messages = self.history.request_messages({"role": "user", "content": "next"})
+        self.assertEqual(len(messages), 11)
+        self.assertEqual(self.history.summary, "")
+
+    def test_restored_history_keeps_summary(self):
+        """A rehydrated history sends its stored summary"""
+        history = ConversationHistory(
+            [*exchange(0), *exchange(9)], summary="earlier state", max_turns=2
+        )
+        contents = self.contents(
+            history.request_messages({"role": "user", "content": "next"})
+        )
+        self.assertIn("earlier state", contents[2])
+        self.assertEqual(contents[-3:], ["user 9", "assistant 9", "next"])
+
+    def test_summary_is_charged_to_the_sessions_user(self):
+        """The background summary queues under the user, with the turn's budget"""
+        seen = []
+
+        def summarize(summary, turns, max_tokens):
+            deadline = current_deadline()
+            seen.append(
+                (
+                    current_call_context()["user"],
+                    current_call_context()["on_position"],
+                    deadline.label,
+                    deadline.max_retries,
+                )
+            )
+            return "summary"
+
+        history = ConversationHistory(
+            max_turns=1, summarize=summarize, executor=self.executor
+        )
+        with (
+            llm_call_context(user="alice", on_position=print),
+            deadline_scope(60, max_retries=1, label="simulation turn"),
+        ):
+            for n in range(3):
+                history.append(*exchange(n))
+        # The summary runs after the turn has finished
+        self.executor.run_all()
+        self.assertEqual(seen, [("alice", None, "history summary", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+# test_import_time.py
+# Keeps importing the app fast and free of side effects: no provider SDKs, no API keys,
+# measured with python -X importtime in a clean interpreter.
+
+import sys
+import os
+import re
+import tempfile
+import unittest
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from providers import ProviderRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cumulative import time allowed for main:app, including create_app()
+IMPORT_BUDGET_SECONDS = float(os.environ.get("IMPORT_TIME_BUDGET_SECONDS", 2.0))
+CHECK_MODULES = (
+    "import sys, main; print(sorted({'anthropic', 'groq'} & set(sys.modules)))"
+)
+
+
+class TestImportTime(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                key: value
+                for key, value in os.environ.items()
+                if key not in ("ANTHROPIC_API_KEY", "GROQ_API_KEY")
+            }
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'app.db')}"
+            cls.result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", CHECK_MODULES],
+                cwd=ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                timeout=120,
+            )
+
+    def test_imports_without_api_keys(self):
+        self.assertEqual(self.result.returncode, 0, self.result.stderr[-2000:])
+
+    def test_provider_sdks_are_not_imported(self):
+        self.assertEqual(self.result.stdout.strip().splitlines()[-1], "[]")
+
+    def test_within_budget(self):
+        match = re.search(
+            r"^import time:\s+\d+ \|\s+(\d+) \| main$", self.result.stderr, re.M
+        )
+        self.assertIsNotNone(match, "no importtime line for main")
+        seconds = int(match.group(1)) / 1e6
+        self.assertLess(
+            seconds,
+            IMPORT_BUDGET_SECONDS,
+            f"importing main:app took {seconds:.2f}s",
+        )
+
+
+class TestProviderRegistry(unittest.TestCase):
+    def test_client_is_created_once_on_first_use(self):
+        calls = []
+        registry = ProviderRegistry()
+        registry.register("fake", lambda: calls.append(1) or object())
+        self.assertEqual(calls, [])
+        self.assertIs(registry.get("fake"), registry.get("fake"))
+        self.assertEqual(calls, [1])
+        registry.reset("fake")
+        registry.get("fake")
+        self.assertEqual(calls, [1, 1])
+
+    def test_missing_key_is_reported_on_use(self):
+        registry = ProviderRegistry()
+
+        def needs_key():
+            raise ValueError("FAKE_API_KEY environment variable is not set")
+
+        registry.register("fake", needs_key)
+        with self.assertRaises(ValueError):
+            registry.get("fake")
+
+    def test_unknown_provider(self):
+        with self.assertRaises(KeyError):
+            ProviderRegistry().get("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
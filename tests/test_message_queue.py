@@ -0,0 +1,88 @@
+# test_message_queue.py
+# Tests that emits from one worker reach sockets held by another through the message queue.
+# Uses kombu's in-memory transport, so no Redis or RabbitMQ server is needed.
+
+import sys
+import os
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from app import MAX_MESSAGE_BYTES, socketio_options
+
+try:
+    import kombu
+except ImportError:
+    kombu = None
+
+QUEUE_URL = "memory://"
+
+
+class TestSocketIOOptions(unittest.TestCase):
+    def test_no_queue_by_default(self):
+        """A single worker needs no message queue"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertNotIn("message_queue", socketio_options())
+
+    def test_message_size_limit(self):
+        """The browser checks uploads against the same limit the server enforces"""
+        self.assertEqual(socketio_options()["max_http_buffer_size"], MAX_MESSAGE_BYTES)
+
+    def test_queue_from_environment(self):
+        """SOCKETIO_MESSAGE_QUEUE switches on the shared queue"""
+        env = {"SOCKETIO_MESSAGE_QUEUE": QUEUE_URL, "SOCKETIO_CHANNEL": "orac"}
+        with mock.patch.dict(os.environ, env, clear=True):
+            options = socketio_options()
+        self.assertEqual(options["message_queue"], QUEUE_URL)
+        self.assertEqual(options["channel"], "orac")
+
+
+@unittest.skipIf(kombu is None, "kombu is not installed")
+class TestMessageQueueDelivery(unittest.TestCase):
+    def setUp(self):
+        env = {"SOCKETIO_MESSAGE_QUEUE": QUEUE_URL, "SOCKETIO_CHANNEL": self.id()}
+        with mock.patch.dict(os.environ, env, clear=True):
+            options = socketio_options()
+        # The worker holding the socket; the test runs without eventlet
+        options["async_mode"] = "threading"
+        self.worker = SocketIO(Flask(__name__), **options)
+        self.server = self.worker.server
+        self.delivered = []
+        self.server._send_eio_packet = lambda eio_sid, packet: self.delivered.append(
+            (eio_sid, packet.encode())
+        )
+        self.server.manager.initialize()
+        self.sid = self.server.manager.connect("eio-1", "/")
+        self.server.manager.enter_room(self.sid, "/", "user:1")
+        # A second worker that only publishes
+        self.publisher = SocketIO(
+            message_queue=options["message_queue"], channel=options["channel"]
+        )
+
+    def wait_for_delivery(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not self.delivered and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def test_emit_to_room_crosses_workers(self):
+        """Only the socket in the target room receives the event"""
+        # Give the listener time to bind its queue before publishing
+        time.sleep(0.5)
+        self.publisher.emit("simulation_chunk", {"delta": "other"}, to="user:2")
+        self.publisher.emit("simulation_chunk", {"delta": "hello"}, to="user:1")
+        self.wait_for_delivery()
+        time.sleep(0.2)
+
+        self.assertEqual(len(self.delivered), 1)
+        eio_sid, packet = self.delivered[0]
+        self.assertEqual(eio_sid, "eio-1")
+        self.assertIn("hello", packet)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
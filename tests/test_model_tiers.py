@@ -0,0 +1,118 @@
+# test_model_tiers.py
+# Tests per-stage model tiers, confidence escalation and the benchmark hooks
+
+import sys
+import os
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model_tiers
+import routing_and_logic
+from heuristic_catalog import HeuristicCatalog
+from model_tiers import benchmark, model_for
+
+CATALOG = HeuristicCatalog(
+    {
+        "heuristics": {
+            "corporate_negotiation": {
+                "name": "Corporate Negotiation",
+                "description": "Negotiate",
+                "parameters": {"min_confidence": 0.8},
+                "rules": {"must_do": [], "must_not_do": []},
+            },
+            "trading_strategy": {
+                "name": "Trading Strategy",
+                "description": "Trade",
+                "parameters": {},
+                "rules": {"must_do": [], "must_not_do": []},
+            },
+        }
+    },
+    version="test",
+)
+
+
+class TestModelFor(unittest.TestCase):
+    def test_stage_overrides(self):
+        """Stages use their own tier models and fall back to the large tier"""
+        with mock.patch.dict(os.environ, {"MODEL_ROUTING_FAST": "fast-router"}):
+            self.assertEqual(model_for("routing", "fast"), "fast-router")
+        self.assertEqual(model_for("simulation", "fast"), model_tiers.LARGE_MODEL)
+
+    def test_history_summary_runs_on_the_fast_tier(self):
+        self.assertEqual(model_for("summary", "large"), model_tiers.FAST_MODEL)
+        with mock.patch.dict(os.environ, {"MODEL_SUMMARY_FAST": "summarizer"}):
+            self.assertEqual(model_for("summary", "fast"), "summarizer")
+
+
+class TestRoutingEscalation(unittest.TestCase):
+    def run_match(self, answers):
+        """answers maps a model id to the (heuristic, confidence) it returns"""
+        calls = []
+
+        def fake_create(model, **kwargs):
+            calls.append(model)
+            heuristic, confidence = answers[model]
+            text = json.dumps({"heuristic": heuristic, "confidence": confidence})
+            return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+        with mock.patch.object(routing_and_logic, "create_message", fake_create):
+            result = routing_and_logic.match_heuristic_with_llm("merger talks", CATALOG)
+        return result, calls
+
+    def test_confident_fast_answer_is_kept(self):
+        """No large model call when the fast tier clears min_confidence"""
+        result, calls = self.run_match(
+            {model_for("routing", "fast"): ("trading_strategy", 0.75)}
+        )
+        self.assertEqual(result[0], "trading_strategy")
+        self.assertEqual(calls, [model_for("routing", "fast")])
+
+    def test_escalates_below_heuristic_min_confidence(self):
+        """0.75 is below corporate_negotiation's min_confidence of 0.8"""
+        result, calls = self.run_match(
+            {
+                model_for("routing", "fast"): ("corporate_negotiation", 0.75),
+                model_for("routing", "large"): ("corporate_negotiation", 0.9),
+            }
+        )
+        self.assertEqual(result[0], "corporate_negotiation")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1], model_for("routing", "large"))
+
+    def test_hooks_see_every_tiered_call(self):
+        records = []
+        model_tiers.add_benchmark_hook(records.append)
+        try:
+            self.run_match(
+                {
+                    model_for("routing", "fast"): ("none", 0.1),
+                    model_for("routing", "large"): ("trading_strategy", 0.9),
+                }
+            )
+        finally:
+            model_tiers.stats._hooks.remove(records.append)
+        self.assertEqual([r["tier"] for r in records], ["fast", "large"])
+        self.assertTrue(records[0]["escalated"])
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_accuracy_per_tier(self):
+        """Each tier is scored on the same labelled cases"""
+        fast, large = model_for("routing", "fast"), model_for("routing", "large")
+
+        def run(message, model):
+            return "a" if model == large or message == "easy" else "b"
+
+        report = benchmark("routing", run, [("easy", "a"), ("hard", "a")])
+        self.assertEqual(report["fast"]["accuracy"], 0.5)
+        self.assertEqual(report["large"]["accuracy"], 1.0)
+        self.assertEqual(report["fast"]["model"], fast)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
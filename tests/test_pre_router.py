@@ -0,0 +1,145 @@
+# test_pre_router.py
+# Tests the local TF-IDF pre-router and its short-circuit of the LLM matcher
+
+import sys
+import os
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routing_and_logic
+from heuristic_catalog import HeuristicCatalog, get_catalog
+from pre_router import PreRouter, features, pre_route, router_for
+
+CATALOG = HeuristicCatalog(
+    {
+        "heuristics": {
+            "corporate_negotiation": {
+                "name": "Corporate Negotiation",
+                "description": "Calculate the optimum strategy for negotiators",
+                "keywords": ["contract", "supplier", "merger", "deal"],
+                "parameters": {},
+                "rules": {"must_do": ["Make proportional concessions"]},
+            },
+            "trading_strategy": {
+                "name": "Trading Strategy",
+                "description": "Develop optimal trading strategies",
+                "keywords": ["stock", "shares", "portfolio", "stop loss"],
+                "parameters": {},
+                "rules": {"must_do": ["Maintain strict risk management"]},
+            },
+            "default_agent": {
+                "name": "Default Reasoning Agent",
+                "description": "A general model for any kind of question",
+                "parameters": "Inherited from the query",
+                "rules": "Inherited from the query",
+            },
+        }
+    },
+    version="test",
+)
+
+
+class TestFeatures(unittest.TestCase):
+    def test_word_forms_share_character_ngrams(self):
+        negotiating = {f for f in features("negotiating") if f.startswith("c:")}
+        negotiation = {f for f in features("negotiation") if f.startswith("c:")}
+        self.assertGreaterEqual(len(negotiating & negotiation), 6)
+
+    def test_stop_words_are_dropped(self):
+        self.assertEqual(features("the and of"), {})
+
+
+class TestPreRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = PreRouter(CATALOG)
+
+    def test_clear_prompt_is_routed(self):
+        heuristic, score, margin = self.router.route(
+            "Our supplier wants to renegotiate the contract before the merger closes"
+        )
+        self.assertEqual(heuristic, "corporate_negotiation")
+        self.assertGreater(margin, 0.35)
+
+    def test_ambiguous_prompt_falls_back(self):
+        heuristic, _, _ = self.router.route("What should I do about this?")
+        self.assertIsNone(heuristic)
+
+    def test_heuristic_without_keywords_never_wins(self):
+        heuristic, _, _ = self.router.route(
+            "A general model for any kind of question", min_score=0, min_margin=0
+        )
+        self.assertIsNone(heuristic)
+
+    def test_thresholds(self):
+        message = "Buy shares and set a stop loss on the portfolio"
+        self.assertEqual(self.router.route(message)[0], "trading_strategy")
+        self.assertIsNone(self.router.route(message, min_score=0.99)[0])
+        self.assertIsNone(self.router.route(message, min_margin=0.999)[0])
+
+    def test_router_is_built_once_per_catalog(self):
+        self.assertIs(router_for(CATALOG), router_for(CATALOG))
+
+
+class TestShippedCatalog(unittest.TestCase):
+    CASES = [
+        (
+            "We are negotiating a new supply contract with our main vendor",
+            "corporate_negotiation",
+        ),
+        ("How would new sanctions affect the alliance?", "geopolitical_strategy"),
+        ("Should I buy Tesla stock or wait for a pullback?", "trading_strategy"),
+        ("Forecast our quarterly sales revenue for next year", "standard_forecast"),
+        (
+            "Simulate how players in an ecosystem adapt their behavior to each other",
+            "multi_agent_forecast",
+        ),
+    ]
+
+    def test_common_prompts_route_locally(self):
+        catalog = get_catalog()
+        for message, expected in self.CASES:
+            with self.subTest(message=message):
+                self.assertEqual(pre_route(message, catalog), expected)
+
+    def test_vague_prompt_is_left_to_the_llm(self):
+        self.assertIsNone(pre_route("What is the meaning of life?", get_catalog()))
+
+    def test_prompts_spanning_two_heuristics_are_left_to_the_llm(self):
+        catalog = get_catalog()
+        for message in (
+            "We need to negotiate a peace treaty between these nations",
+            "Negotiate a trade deal between the US and China over tariffs",
+        ):
+            with self.subTest(message=message):
+                self.assertIsNone(pre_route(message, catalog))
+
+
+class TestProcessScenario(unittest.TestCase):
+    def test_confident_pre_route_skips_llm_match(self):
+        parsed = {"heuristic": "trading_strategy", "parameters": {}}
+        with (
+            mock.patch.object(routing_and_logic, "scenario_cache", None),
+            mock.patch.object(routing_and_logic, "get_catalog", return_value=CATALOG),
+            mock.patch.object(routing_and_logic, "match_heuristic_with_llm") as match,
+            mock.patch.object(
+                routing_and_logic.query_parser, "parse_scenario", return_value=parsed
+            ) as parse,
+            mock.patch.object(
+                routing_and_logic.query_parser, "format_for_display", return_value=""
+            ),
+        ):
+            result = routing_and_logic.process_scenario(
+                "Buy shares and set a stop loss on the portfolio"
+            )
+
+        match.assert_not_called()
+        parse.assert_called_once_with(
+            "Buy shares and set a stop loss on the portfolio", "trading_strategy"
+        )
+        self.assertEqual(result["heuristic"], "trading_strategy")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+# test_query_parser.py
+# Tests local JSON repair and the bounded scenario parsing retries
+
+import sys
+import os
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_parser
+from query_parser import ScenarioParser, repair_json
+
+SCENARIO = {
+    "goal": "win the deal",
+    "constraints": ["two weeks"],
+    "conditions": ["no layoffs"],
+    "heuristic": "corporate_negotiation",
+    "response_format": "text",
+}
+
+
+def tool_response(payload):
+    return SimpleNamespace(
+        content=[
+            SimpleNamespace(
+                type="tool_use", id="toolu_1", name="record_scenario", input=payload
+            )
+        ]
+    )
+
+
+def text_response(text):
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)])
+
+
+class TestRepairJson(unittest.TestCase):
+    def test_fences_prose_and_trailing_commas(self):
+        """Common formatting slips are fixed without another call"""
+        text = 'Here you go:\n```json\n{"goal": "x", "constraints": ["a",],}\n```'
+        self.assertEqual(repair_json(text), {"goal": "x", "constraints": ["a"]})
+
+    def test_truncated_output(self):
+        """A response cut off mid-object is closed"""
+        text = '{"goal": "x", "constraints": ["a", "b'
+        self.assertEqual(repair_json(text), {"goal": "x", "constraints": ["a", "b"]})
+        self.assertEqual(repair_json('{"goal": "x", "cond'), {"goal": "x"})
+
+    def test_unrepairable(self):
+        with self.assertRaises(ValueError):
+            repair_json("no json here")
+
+
+class TestParseScenario(unittest.TestCase):
+    def setUp(self):
+        self.parser = ScenarioParser()
+        self.calls = []
+
+    def run_parser(self, responses, heuristic=None):
+        responses = list(responses)
+
+        def fake_create(**kwargs):
+            self.calls.append(kwargs)
+            return responses.pop(0)
+
+        with mock.patch.object(query_parser, "create_message", fake_create):
+            return self.parser.parse_scenario("negotiate a merger", heuristic)
+
+    def test_tool_output_is_used_directly(self):
+        """Schema-constrained output needs a single call"""
+        self.assertEqual(self.run_parser([tool_response(dict(SCENARIO))]), SCENARIO)
+        self.assertEqual(self.calls[0]["tool_choice"]["name"], "record_scenario")
+
+    def test_text_output_is_repaired_locally(self):
+        """Near-valid JSON text does not trigger a network retry"""
+        text = "```json\n" + str(SCENARIO).replace("'", '"')[:-1] + ",}\n```"
+        self.assertEqual(self.run_parser([text_response(text)]), SCENARIO)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_retry_reports_the_problem(self):
+        """A rejected output is replayed with the error instead of starting over"""
+        partial = {key: SCENARIO[key] for key in ("goal", "heuristic")}
+        result = self.run_parser([tool_response(partial), tool_response(SCENARIO)])
+
+        self.assertEqual(result, SCENARIO)
+        retry_messages = self.calls[1]["messages"]
+        self.assertEqual(len(retry_messages), 3)
+        tool_result = retry_messages[2]["content"][0]
+        self.assertTrue(tool_result["is_error"])
+        self.assertIn("constraints", tool_result["content"])
+
+    def test_retries_follow_the_heuristic_budget(self):
+        """corporate_negotiation declares max_retries 2, so three attempts at most"""
+        with self.assertRaises(ValueError):
+            self.run_parser(
+                [text_response("nothing useful")] * 5, "corporate_negotiation"
+            )
+        self.assertEqual(len(self.calls), 3)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,159 @@
+# test_rate_limiter.py
+# Tests the token buckets and the fair-share LLM request queue
+
+import sys
+import os
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anthropic
+import httpx
+
+from llm_gateway import LLMGateway
+from rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    current_call_context,
+    llm_call_context,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refill_and_debt(self):
+        """Buckets refill per second and oversized requests wait for a full bucket"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.consume(90)
+        self.assertEqual(bucket.wait_time(60), 90.0)
+        clock.now = 30
+        self.assertEqual(bucket.wait_time(1), 1.0)
+        bucket.refund(100)
+        self.assertEqual(bucket.tokens, 60)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_fair_share_between_users(self):
+        """A user with a backlog does not starve a user who arrives later"""
+        limiter = RateLimiter(rpm=600, tpm=10**9, user_rpm=600, user_tpm=10**9)
+        # Drain the global bucket so every call queues behind the refill
+        limiter._requests.tokens = 0
+        order = []
+
+        def call(user):
+            limiter.acquire(100, user=user)
+            order.append(user)
+
+        threads = [threading.Thread(target=call, args=("noisy",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        late = threading.Thread(target=call, args=("quiet",))
+        late.start()
+        for thread in threads + [late]:
+            thread.join(timeout=5)
+
+        self.assertEqual(len(order), 5)
+        # Fair queueing puts the quiet user's single call ahead of the noisy backlog
+        self.assertLessEqual(order.index("quiet"), 2)
+
+    def test_user_limit_does_not_block_others(self):
+        """A user over their own limit is skipped while others proceed"""
+        limiter = RateLimiter(rpm=600, tpm=10**9, user_rpm=1, user_tpm=10**9)
+        limiter.acquire(10, user="busy")
+        started = time.monotonic()
+        limiter.acquire(10, user="other")
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_queue_position_reported(self):
+        """Waiting calls are told their position"""
+        limiter = RateLimiter(rpm=120, tpm=10**9, user_rpm=600, user_tpm=10**9)
+        limiter._requests.tokens = 0
+        positions = []
+        limiter.acquire(10, user="a", on_position=positions.append)
+        self.assertEqual(positions, [1])
+
+    def test_settle_returns_unused_tokens(self):
+        """Calls are charged their estimate and settled with the real usage"""
+        limiter = RateLimiter(rpm=600, tpm=1000, user_rpm=600, user_tpm=1000)
+        grant = limiter.acquire(800, user="a")
+        limiter.settle(grant, 200)
+        self.assertGreaterEqual(limiter._tokens.tokens, 799)
+
+    def test_idle_user_buckets_are_pruned(self):
+        """Users whose buckets have refilled do not accumulate forever"""
+        clock = FakeClock()
+        limiter = RateLimiter(
+            rpm=10**6, tpm=10**9, user_rpm=60, user_tpm=10**6, clock=clock
+        )
+        with mock.patch("rate_limiter.MAX_TRACKED_USERS", 10):
+            for user in range(20):
+                limiter.acquire(10, user=user)
+            # Everyone's buckets refill, then one more call triggers the pruning
+            clock.now = 120
+            limiter.acquire(10, user="last")
+        self.assertEqual(list(limiter._user_buckets), ["last"])
+
+    def test_call_context(self):
+        """The call context applies inside the block only"""
+        with llm_call_context(user=7):
+            self.assertEqual(current_call_context()["user"], 7)
+        self.assertIsNone(current_call_context()["user"])
+
+
+class FlakyMessages:
+    """Returns a 429 for the first failures calls, then succeeds."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            response = httpx.Response(
+                429,
+                headers={"retry-after": "2"},
+                request=httpx.Request("POST", "https://api.anthropic.com/v1/messages"),
+            )
+            raise anthropic.RateLimitError("rate limited", response=response, body=None)
+        return "ok"
+
+
+class TestGatewayRetries(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.limiter = RateLimiter(rpm=600, tpm=10**9, user_rpm=600, user_tpm=10**9)
+        self.gateway = LLMGateway(
+            max_workers=1, limiter=self.limiter, sleep=self.sleeps.append
+        )
+        self.messages = FlakyMessages(failures=2)
+        self.gateway._client = type("Client", (), {"messages": self.messages})()
+
+    def test_429_is_retried_after_retry_after(self):
+        """Rate limited calls back off for the provider's retry-after and succeed"""
+        response = self.gateway.create(model="m", max_tokens=10, messages=[])
+        self.assertEqual(response, "ok")
+        self.assertEqual(self.sleeps, [2.0, 2.0])
+        self.assertEqual(self.limiter.stats()["throttled"], 2)
+
+    def test_gives_up_after_retries(self):
+        """Persistent 429s are raised once the retries are used up"""
+        self.messages.failures = 100
+        with self.assertRaises(anthropic.RateLimitError):
+            self.gateway.create(model="m", max_tokens=10, messages=[])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -17,8 +17,13 @@ class TestRouting(unittest.TestCase):
         print("\n=== Testing Shortcode Detection ===")
 
         # Test valid shortcodes
-        self.assertEqual(check_shortcode("/negotiation"), "negotiation")
-        self.assertEqual(check_shortcode("Apply /geopolitics here"), "geopolitics")
+        self.assertEqual(check_shortcode("/negotiation"), "corporate_negotiation")
+        self.assertEqual(
+            check_shortcode("Apply /geopolitics here"), "geopolitical_strategy"
+        )
+        self.assertEqual(
+            check_shortcode("/trading_strategy for AAPL"), "trading_strategy"
+        )
 
         # Test invalid or missing shortcodes
         self.assertIsNone(check_shortcode("No shortcode here"))
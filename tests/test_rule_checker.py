@@ -0,0 +1,246 @@
+# test_rule_checker.py
+# Tests compiling threshold-style heuristic rules and checking simulation metrics against them
+
+import sys
+import os
+import json
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heuristic_catalog import HeuristicCatalog
+from simulation import WorldSimulator
+from rule_checker import (
+    check_metrics,
+    check_response,
+    compile_rule,
+    compiled_rules,
+    correction_message,
+    extract_metrics,
+    metrics_instructions,
+)
+
+
+def catalog(rules):
+    return HeuristicCatalog(
+        {
+            "heuristics": {
+                "strategy": {
+                    "name": "Strategy",
+                    "description": "Plan",
+                    "rules": rules,
+                }
+            }
+        },
+        version="test",
+    )
+
+
+class TestCompileRule(unittest.TestCase):
+    def test_must_not_do_percentage_is_an_upper_bound(self):
+        rule = compile_rule("Commit >30% resources to single strategy", "must_not_do")
+        self.assertEqual(rule.metric, "resources_single_strategy")
+        self.assertEqual(rule.requirement, "<= 0.3")
+        self.assertTrue(rule.complies(0.3))
+        self.assertFalse(rule.complies(0.31))
+
+    def test_must_do_thresholds(self):
+        paths = compile_rule("Maintain 3+ independent paths", "must_do")
+        self.assertEqual((paths.unit, paths.requirement), ("count", ">= 3"))
+        ratio = compile_rule("Maintain 3:1 advantage in critical domains", "must_do")
+        self.assertEqual((ratio.unit, ratio.requirement), ("ratio", ">= 3"))
+        leverage = compile_rule(
+            "Hold leverage worth 2x any requested concession", "must_do"
+        )
+        self.assertEqual((leverage.unit, leverage.requirement), ("ratio", ">= 2"))
+        share = compile_rule("Keep secondary partnerships at 50%+ value", "must_do")
+        self.assertEqual((share.unit, share.requirement), ("fraction", ">= 0.5"))
+
+    def test_spelled_out_threshold(self):
+        rule = compile_rule("Risk more than 2% per trade", "must_not_do")
+        self.assertEqual(rule.metric, "risk_per_trade")
+        self.assertEqual(rule.requirement, "<= 0.02")
+
+    def test_qualitative_concession_rules(self):
+        rule = compile_rule("Make disproportionate concessions", "must_not_do")
+        self.assertEqual(rule.metric, "concession_ratio")
+        self.assertFalse(rule.complies(2.0))
+        self.assertTrue(rule.complies(1.0))
+
+    def test_upper_bounds(self):
+        for text in (
+            "Never exceed 3 escalation steps",
+            "Take at most 3 escalation steps",
+            "Take no more than 3 escalation steps",
+            "Take up to 3 escalation steps",
+            "Max 3 escalation steps",
+        ):
+            with self.subTest(text=text):
+                rule = compile_rule(text, "must_do")
+                self.assertEqual(rule.requirement, "<= 3")
+                self.assertTrue(rule.metric.endswith("escalation_steps"))
+        rule = compile_rule("Exceed 3 escalation steps", "must_not_do")
+        self.assertEqual(rule.requirement, "<= 3")
+
+    def test_metric_names_drop_the_leading_verb(self):
+        for text, kind, metric in (
+            (
+                "Let single adversary control >40% of vital supply",
+                "must_not_do",
+                "single_adversary_control_vital_supply",
+            ),
+            (
+                "Hold leverage worth 2x any requested concession",
+                "must_do",
+                "leverage_worth_requested_concession",
+            ),
+            ("Do not allow >50% adversary control", "must_do", "adversary_control"),
+            ("Risk more than 2% per trade", "must_not_do", "risk_per_trade"),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(compile_rule(text, kind).metric, metric)
+
+    def test_rules_without_a_threshold_are_not_compiled(self):
+        self.assertIsNone(compile_rule("Build trust before asking", "must_do"))
+        # A bare number does not say which side of it is allowed
+        self.assertIsNone(
+            compile_rule("Keep position viable if 2 assumptions fail", "must_do")
+        )
+        self.assertIsNone(compile_rule("Take 3 escalation steps", "must_do"))
+
+    def test_compiled_rules_from_catalog(self):
+        rules = compiled_rules(
+            catalog(
+                {
+                    "must_do": ["Maintain 3+ independent paths", "Stay flexible"],
+                    "must_not_do": ["Risk more than 2% per trade"],
+                }
+            ),
+            "strategy",
+        )
+        self.assertEqual(
+            [rule.metric for rule in rules],
+            ["independent_paths", "risk_per_trade"],
+        )
+        self.assertEqual(compiled_rules(catalog({}), "strategy"), ())
+        self.assertIsNone(metrics_instructions(()))
+        self.assertIn("risk_per_trade", metrics_instructions(rules))
+
+    def test_mirrored_rules_are_compiled_once(self):
+        rules = compiled_rules(
+            catalog(
+                {
+                    "must_do": ["Make proportional concessions"],
+                    "must_not_do": ["Make disproportionate concessions"],
+                }
+            ),
+            "strategy",
+        )
+        self.assertEqual(
+            [rule.text for rule in rules], ["Make proportional concessions"]
+        )
+        report = check_metrics({"concession_ratio": 2}, rules)
+        self.assertEqual(len(report["violations"]), 1)
+        self.assertEqual(correction_message(report).count("concession_ratio"), 1)
+
+
+class TestCheckMetrics(unittest.TestCase):
+    def setUp(self):
+        self.rules = compiled_rules(
+            catalog(
+                {
+                    "must_do": ["Maintain 3+ independent paths"],
+                    "must_not_do": ["Commit >30% resources to single strategy"],
+                }
+            ),
+            "strategy",
+        )
+
+    def test_reported_violation(self):
+        report = check_metrics(
+            {"independent_paths": 4, "resources_single_strategy": 0.45},
+            self.rules,
+        )
+        self.assertEqual(report["status"], "violations")
+        self.assertEqual(len(report["passed"]), 1)
+        [violation] = report["violations"]
+        self.assertEqual(violation["metric"], "resources_single_strategy")
+        self.assertIn("<= 0.3", correction_message(report))
+
+    def test_percentages_are_read_as_fractions(self):
+        for value in ("25%", 25, 0.25):
+            report = check_metrics(
+                {
+                    "independent_paths": 3,
+                    "resources_single_strategy": value,
+                },
+                self.rules,
+            )
+            self.assertEqual(report["status"], "compliant", value)
+
+    def test_missing_metrics_are_not_violations(self):
+        report = check_metrics({"independent_paths": 3}, self.rules)
+        self.assertEqual(report["status"], "compliant")
+        self.assertEqual(report["missing"], ["resources_single_strategy"])
+        self.assertEqual(check_metrics(None, self.rules)["status"], "unreported")
+        self.assertEqual(
+            check_metrics({"other": 1}, self.rules)["status"], "unreported"
+        )
+
+
+class TestCheckResponse(unittest.TestCase):
+    def setUp(self):
+        self.rules = compiled_rules(
+            catalog({"must_not_do": ["Risk more than 2% per trade"]}), "strategy"
+        )
+
+    def test_metrics_block_is_stripped_from_text(self):
+        text = 'Buy the dip.\n```metrics\n{"risk_per_trade": 0.05}\n```'
+        response, report = check_response(text, self.rules)
+        self.assertEqual(response, "Buy the dip.")
+        self.assertEqual(report["status"], "violations")
+
+    def test_metrics_block_is_stripped_from_opening_payload(self):
+        payload = json.dumps(
+            {
+                "response": 'Hold.\n```metrics\n{"risk_per_trade": 0.01,}\n```',
+                "state_update": "",
+            }
+        )
+        response, report = check_response(payload, self.rules)
+        self.assertEqual(json.loads(response)["response"], "Hold.")
+        self.assertEqual(report["status"], "compliant")
+
+    def test_blank_lines_in_the_block_survive_the_opening_turn(self):
+        rules = compiled_rules(
+            catalog(
+                {
+                    "must_do": ["Maintain 3+ independent paths"],
+                    "must_not_do": ["Risk more than 2% per trade"],
+                }
+            ),
+            "strategy",
+        )
+        text = (
+            "Hold.\n\nState Update: calm\n```metrics\n"
+            '{"independent_paths": 2,\n\n"risk_per_trade": 0.01}\n```'
+        )
+        opening = json.dumps(WorldSimulator.parse_response(text))
+        response, report = check_response(opening, rules)
+        self.assertEqual(
+            json.loads(response)["response"], "Hold.\n---\nState Update: calm"
+        )
+        self.assertEqual(report["status"], "violations")
+        self.assertEqual(len(report["passed"]), 1)
+
+    def test_no_rules_leaves_response_untouched(self):
+        text = 'Hold.\n```metrics\n{"risk_per_trade": 0.05}\n```'
+        self.assertEqual(check_response(text, ()), (text, None))
+
+    def test_unparseable_block(self):
+        text, metrics = extract_metrics("Hold.\n```metrics\nnot json\n```")
+        self.assertEqual((text, metrics), ("Hold.", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
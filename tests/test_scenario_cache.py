@@ -0,0 +1,129 @@
+# test_scenario_cache.py
+# Tests the scenario cache keys, TTL eviction and counters
+
+import sys
+import os
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from app import create_app, db
+from models import User
+from scenario_cache import (
+    DatabaseCacheBackend,
+    MemoryCacheBackend,
+    ScenarioCache,
+    cache_key,
+)
+
+app = None
+
+
+def setUpModule():
+    global app
+    app = create_app()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestScenarioCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ScenarioCache(
+            MemoryCacheBackend(max_entries=2, clock=self.clock), ttl_seconds=60
+        )
+        self.scenario = {"heuristic": "trading_strategy", "parsed_scenario": {}}
+
+    def test_keys_ignore_case_and_whitespace(self):
+        """Resubmitted prompts with cosmetic edits share a key"""
+        self.assertEqual(
+            cache_key("Buy  AAPL\n now", "v1"), cache_key("buy aapl now ", "v1")
+        )
+        self.assertNotEqual(cache_key("buy aapl", "v1"), cache_key("buy aapl", "v2"))
+
+    def test_hit_and_miss_counters(self):
+        """Lookups are counted and cached values are returned as copies"""
+        self.assertIsNone(self.cache.get("prompt", "v1"))
+        self.cache.set("prompt", "v1", self.scenario)
+        cached = self.cache.get("Prompt", "v1")
+        cached["heuristic"] = "changed"
+
+        self.assertEqual(self.cache.get("prompt", "v1"), self.scenario)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+
+    def test_ttl_expiry(self):
+        """Entries expire after the TTL"""
+        self.cache.set("prompt", "v1", self.scenario)
+        self.clock.now += 61
+        self.assertIsNone(self.cache.get("prompt", "v1"))
+
+    def test_lru_bound(self):
+        """The backend keeps at most max_entries"""
+        for prompt in ("a", "b", "c"):
+            self.cache.set(prompt, "v1", self.scenario)
+        self.assertIsNone(self.cache.get("a", "v1"))
+        self.assertEqual(len(self.cache.backend), 2)
+
+    def test_invalidate_heuristics(self):
+        """Only entries routed to changed heuristics are dropped"""
+        self.cache.set("a", "v1", self.scenario)
+        self.cache.set("b", "v1", {"heuristic": "standard_forecast"})
+
+        self.assertEqual(self.cache.invalidate_heuristics({"trading_strategy"}), 1)
+        self.assertIsNone(self.cache.get("a", "v1"))
+        self.assertIsNotNone(self.cache.get("b", "v1"))
+
+
+class TestDatabaseCacheBackend(unittest.TestCase):
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        self.cache = ScenarioCache(DatabaseCacheBackend())
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_round_trip(self):
+        self.cache.set("Buy AAPL", "v1", {"heuristic": "trading_strategy"})
+        self.assertEqual(
+            self.cache.get("buy  aapl", "v1"), {"heuristic": "trading_strategy"}
+        )
+        self.assertEqual(self.cache.invalidate_heuristics({"trading_strategy"}), 1)
+        self.assertIsNone(self.cache.get("Buy AAPL", "v1"))
+
+    def test_cache_calls_leave_the_request_session_alone(self):
+        """A cache lookup must not commit or discard the handler's pending work"""
+        db.session.add(User(username="alice", email="alice@example.com"))
+        self.cache.set("Buy AAPL", "v1", {"heuristic": "trading_strategy"})
+        self.assertIsNotNone(self.cache.get("Buy AAPL", "v1"))
+        self.assertEqual(len(db.session.new), 1)
+
+        db.session.rollback()
+        self.assertEqual(User.query.count(), 0)
+        self.assertIsNotNone(self.cache.get("Buy AAPL", "v1"))
+
+    def test_failed_write_leaves_the_request_session_usable(self):
+        with mock.patch("scenario_cache.json.dumps", return_value=None):
+            self.cache.set("Buy AAPL", "v1", {"heuristic": "trading_strategy"})
+        self.assertEqual(self.cache.errors, 1)
+
+        db.session.add(User(username="alice", email="alice@example.com"))
+        db.session.commit()
+        self.assertEqual(User.query.count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,274 @@
+# test_sessions.py
+# Tests storing simulation sessions and their turns, and rebuilding a simulator from them,
+# against an in-memory SQLite database
+
+import sys
+import os
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from sqlalchemy.exc import IntegrityError
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app import create_app, db
+from models import SimulationSession, SimulationTurn, User
+from routes import (
+    create_session,
+    find_user_session,
+    load_simulator,
+    save_conversation_history,
+    simulator_is_current,
+)
+
+app = None
+
+
+def setUpModule():
+    global app
+    app = create_app()
+
+
+def exchange(number):
+    return [
+        {"role": "user", "content": f"move {number}"},
+        {"role": "assistant", "content": f"result {number}"},
+    ]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        self.user = User(username="alice", email="alice@example.com")
+        self.user.set_password("secret")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def new_session(self, world_state=None, user=None):
+        session = SimulationSession(
+            user_id=(user or self.user).id, world_state=world_state or {}
+        )
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+
+class TestSimulationTurns(DatabaseTestCase):
+    def test_append_orders_by_seq(self):
+        session = self.new_session()
+        self.assertEqual(SimulationTurn.next_seq(session.id), 0)
+        # Written out of order, read back in seq order
+        SimulationTurn.append(session.id, exchange(1), 2)
+        SimulationTurn.append(session.id, exchange(0), 0)
+        db.session.commit()
+
+        self.assertEqual(SimulationTurn.next_seq(session.id), 4)
+        self.assertEqual(
+            [turn.content for turn in SimulationTurn.load_range(session.id)],
+            ["move 0", "result 0", "move 1", "result 1"],
+        )
+
+    def test_seq_is_unique_per_session(self):
+        session = self.new_session()
+        other = self.new_session()
+        SimulationTurn.append(session.id, exchange(0), 0)
+        SimulationTurn.append(other.id, exchange(0), 0)
+        db.session.commit()
+        self.assertEqual(SimulationTurn.next_seq(other.id), 2)
+
+        SimulationTurn.append(session.id, exchange(1), 0)
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+        self.assertEqual(SimulationTurn.next_seq(session.id), 2)
+
+    def test_paging(self):
+        session = self.new_session()
+        for number in range(5):
+            SimulationTurn.append(session.id, exchange(number), 2 * number)
+        db.session.commit()
+
+        page = SimulationTurn.load_page(session.id, after_seq=2, limit=3)
+        self.assertEqual([turn.seq for turn in page], [3, 4, 5])
+        page = SimulationTurn.load_page(session.id, after_seq=2, before_seq=5)
+        self.assertEqual([turn.seq for turn in page], [3, 4])
+        # load_range walks every page, including a last full one
+        for page_size in (2, 3, 10):
+            turns = SimulationTurn.load_range(
+                session.id, after_seq=1, page_size=page_size
+            )
+            self.assertEqual([turn.seq for turn in turns], list(range(2, 10)))
+
+
+class TestLoadSimulator(DatabaseTestCase):
+    def test_rebuild_skips_summarized_turns(self):
+        session = self.new_session()
+        for number in range(5):
+            SimulationTurn.append(session.id, exchange(number), 2 * number)
+        session.history_summary = "moves 1 and 2 happened"
+        session.summarized_turns = 4
+        db.session.commit()
+
+        simulator = load_simulator(session.id)
+        self.assertEqual(
+            [message["content"] for message in simulator.conversation_history],
+            ["move 0", "result 0", "move 3", "result 3", "move 4", "result 4"],
+        )
+        self.assertEqual(simulator.history.summary, "moves 1 and 2 happened")
+        self.assertEqual(simulator.history.message_count, 10)
+        self.assertTrue(simulator_is_current(session.id, simulator))
+
+        SimulationTurn.append(session.id, exchange(5), 10)
+        db.session.commit()
+        self.assertFalse(simulator_is_current(session.id, simulator))
+
+    def test_save_appends_the_latest_exchange(self):
+        session = self.new_session()
+        SimulationTurn.append(session.id, exchange(0), 0)
+        db.session.commit()
+
+        simulator = load_simulator(session.id)
+        simulator.history.append(*exchange(1))
+        save_conversation_history(session.id, simulator)
+        self.assertEqual(
+            [turn.content for turn in SimulationTurn.load_range(session.id)],
+            ["move 0", "result 0", "move 1", "result 1"],
+        )
+
+    def test_legacy_history_is_migrated(self):
+        session = self.new_session()
+        session.session_settings = {
+            "language": "en",
+            "conversation_history": exchange(0) + exchange(1),
+        }
+        db.session.commit()
+
+        simulator = load_simulator(session.id)
+        self.assertEqual(simulator.history.message_count, 4)
+        self.assertEqual(SimulationTurn.next_seq(session.id), 4)
+        self.assertEqual(
+            db.session.get(SimulationSession, session.id).session_settings,
+            {"language": "en"},
+        )
+        # A second load reads the turns table, not the settings
+        self.assertEqual(load_simulator(session.id).history.message_count, 4)
+
+
+class TestFindUserSession(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_user = User(username="bob", email="bob@example.com")
+        self.other_user.set_password("secret")
+        db.session.add(self.other_user)
+        db.session.commit()
+        self.owner = SimpleNamespace(user_id=self.user.id)
+
+    def test_fetch_by_primary_key(self):
+        session = self.new_session()
+        self.new_session()
+        self.assertIs(find_user_session(self.owner, session.id), session)
+        # Ids arrive from the client as JSON, sometimes as strings
+        self.assertIs(find_user_session(self.owner, str(session.id)), session)
+
+    def test_another_users_session_is_not_found(self):
+        session = self.new_session(user=self.other_user)
+        self.assertIsNone(find_user_session(self.owner, session.id))
+        self.assertIsNone(find_user_session(self.owner, 9999))
+
+    def test_non_numeric_id_is_not_found(self):
+        self.new_session()
+        for session_id in ("abc", "1; DROP TABLE user", [1], {}):
+            with self.subTest(session_id=session_id):
+                self.assertIsNone(find_user_session(self.owner, session_id))
+
+    def test_without_an_id_the_latest_session_is_used(self):
+        now = datetime.utcnow()
+        older = self.new_session()
+        latest = self.new_session()
+        older.started_at = now - timedelta(hours=1)
+        latest.started_at = now
+        newest_of_other_user = self.new_session(user=self.other_user)
+        newest_of_other_user.started_at = now + timedelta(hours=1)
+        db.session.commit()
+
+        self.assertIs(find_user_session(self.owner, None), latest)
+        self.assertIsNone(find_user_session(SimpleNamespace(user_id=9999), None))
+
+    def test_latest_session_lookup_uses_the_user_index(self):
+        query = (
+            SimulationSession.query.filter_by(user_id=self.user.id)
+            .order_by(SimulationSession.started_at.desc())
+            .limit(1)
+        )
+        compiled = query.statement.compile(
+            db.engine, compile_kwargs={"literal_binds": True}
+        )
+        plan = db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+        self.assertIn("ix_simulation_session_user_started", str(plan))
+
+
+class TestCreateSession(DatabaseTestCase):
+    WORLD_STATE = {
+        "parsed_scenario": {
+            "parameters": {"heuristic": "trading_strategy", "risk": 0.02},
+            "actors": ["Fund", "Börse"],
+        },
+        "heuristic_settings": {"heuristic_prompt": "Heuristic: Trading"},
+        "catalog_version": "abc123",
+        "series": {"sales": [1200.0, 1350.5, None]},
+    }
+
+    def test_session_round_trips(self):
+        self.user.user_settings = {"language": "de", "auto_save": False}
+        db.session.commit()
+
+        user_id = self.user.id
+        session_id = create_session(SimpleNamespace(user_id=user_id), self.WORLD_STATE)
+        # Read back through a fresh session, not the identity map
+        db.session.remove()
+        session = db.session.get(SimulationSession, session_id)
+        self.assertEqual(session.user_id, user_id)
+        self.assertEqual(session.world_state, self.WORLD_STATE)
+        self.assertEqual(
+            session.session_settings,
+            {"language": "de", "auto_save": False, "first_message": False},
+        )
+
+    def test_session_and_settings_commit_together(self):
+        context = SimpleNamespace(user_id=self.user.id)
+        with mock.patch.object(db.session, "commit", wraps=db.session.commit) as commit:
+            create_session(context, self.WORLD_STATE)
+        commit.assert_called_once()
+
+        with mock.patch.object(db.session, "commit", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                create_session(context, self.WORLD_STATE)
+        db.session.rollback()
+        self.assertEqual(SimulationSession.query.count(), 1)
+
+    def test_anonymous_users_get_no_session(self):
+        self.assertIsNone(create_session(SimpleNamespace(user_id=None), {}))
+        self.assertEqual(SimulationSession.query.count(), 0)
+
+    def test_world_state_is_jsonb_on_postgresql(self):
+        column = SimulationSession.__table__.c.world_state
+        self.assertIsInstance(column.type.dialect_impl(postgresql.dialect()), JSONB)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
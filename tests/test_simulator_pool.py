@@ -0,0 +1,130 @@
+# test_simulator_pool.py
+# Tests the per-session simulator pool
+
+import sys
+import os
+import time
+import threading
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulator_pool import SimulatorPool
+
+
+class FakeSimulator:
+    def __init__(self, session_id, history=None):
+        self.session_id = session_id
+        self.conversation_history = list(history or [])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSimulatorPool(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.clock = FakeClock()
+
+    def factory(self, session_id):
+        self.loads.append(session_id)
+        return FakeSimulator(session_id)
+
+    def test_sessions_are_isolated(self):
+        """Each session gets its own simulator and history"""
+        pool = SimulatorPool(self.factory, clock=self.clock)
+        first = pool.get(1)
+        second = pool.get(2)
+        first.conversation_history.append({"role": "user", "content": "hello"})
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.conversation_history, [])
+        self.assertIs(pool.get(1), first)
+        self.assertEqual(self.loads, [1, 2])
+
+    def test_lru_eviction_on_session_cap(self):
+        """The least recently used session is evicted and rehydrated on demand"""
+        pool = SimulatorPool(self.factory, max_sessions=2, clock=self.clock)
+        pool.get(1)
+        pool.get(2)
+        pool.get(1)  # 2 is now least recently used
+        pool.get(3)
+
+        self.assertIn(1, pool)
+        self.assertNotIn(2, pool)
+        pool.get(2)
+        self.assertEqual(self.loads, [1, 2, 3, 2])
+
+    def test_idle_eviction(self):
+        """Sessions idle longer than the limit are dropped"""
+        pool = SimulatorPool(self.factory, idle_seconds=60, clock=self.clock)
+        pool.get(1)
+        self.clock.now = 30
+        pool.get(2)
+        self.clock.now = 75
+        pool.get(2)
+
+        self.assertNotIn(1, pool)
+        self.assertIn(2, pool)
+
+    def test_memory_cap(self):
+        """Total history size is bounded, keeping the session in use"""
+        pool = SimulatorPool(self.factory, max_history_chars=10, clock=self.clock)
+        pool.put(1, FakeSimulator(1, [{"role": "user", "content": "x" * 8}]))
+        pool.put(2, FakeSimulator(2, [{"role": "user", "content": "y" * 8}]))
+
+        self.assertNotIn(1, pool)
+        self.assertIn(2, pool)
+        self.assertEqual(pool.stats()["evictions"], 1)
+
+    def test_stale_simulator_is_reloaded(self):
+        """A simulator another worker has moved past is rebuilt from the database"""
+        stored_turns = {1: 0}
+        pool = SimulatorPool(
+            self.factory,
+            clock=self.clock,
+            validate=lambda session_id, simulator: len(simulator.conversation_history)
+            == stored_turns[session_id],
+        )
+        first = pool.get(1)
+        self.assertIs(pool.get(1), first)
+
+        stored_turns[1] = 2
+        second = pool.get(1)
+        self.assertIsNot(second, first)
+        self.assertEqual(self.loads, [1, 1])
+        self.assertEqual(pool.stats()["stale"], 1)
+
+    def test_turns_on_one_session_run_one_at_a_time(self):
+        pool = SimulatorPool(self.factory, max_sessions=10)
+        events = []
+
+        def turn(session_id, name):
+            with pool.turn(session_id):
+                events.append(f"{name} start")
+                time.sleep(0.1)
+                events.append(f"{name} end")
+
+        first = threading.Thread(target=turn, args=(1, "a"))
+        first.start()
+        time.sleep(0.02)
+        second = threading.Thread(target=turn, args=(1, "b"))
+        other = threading.Thread(target=turn, args=(2, "c"))
+        second.start()
+        other.start()
+        for thread in (first, second, other):
+            thread.join()
+
+        self.assertLess(events.index("a end"), events.index("b start"))
+        # Another session does not wait for the first one's turn
+        self.assertLess(events.index("c start"), events.index("a end"))
+        self.assertEqual(pool._turn_locks, {})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
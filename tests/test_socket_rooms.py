@@ -0,0 +1,284 @@
+# test_socket_rooms.py
+# Tests which sockets receive simulation events: user-scoped events reach every socket of
+# that user only, and simulation output only the sockets in the simulation's room.
+# Also tests that an edited scenario is routed as a new scenario, not as a chat turn, and
+# that market data can only be attached before a simulation starts.
+
+import sys
+import os
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from app import create_app, db, socketio
+from models import SimulationSession, SimulationTurn, User
+import routing_and_logic
+from scenario_cache import DatabaseCacheBackend, ScenarioCache
+from routes import simulation_room
+from simulation import WorldSimulator
+import llm_gateway
+
+app = None
+
+SCENARIO = {
+    "heuristic": "trading_strategy",
+    "heuristic_description": "Trading Strategy",
+    "display_format": "Scenario: buy AAPL",
+    "parsed_scenario": {"parameters": {"heuristic": "trading_strategy"}},
+    "catalog_version": None,
+}
+
+
+def setUpModule():
+    global app
+    app = create_app()
+
+
+def fake_send(simulator, messages, on_chunk=None):
+    if on_chunk:
+        on_chunk("Opening ")
+    return "Opening move.\nState Update: calm"
+
+
+class SocketTestCase(unittest.TestCase):
+    def setUp(self):
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            users = []
+            for name in ("alice", "bob"):
+                user = User(username=name, email=f"{name}@example.com")
+                user.set_password("secret")
+                db.session.add(user)
+                users.append(user)
+            db.session.commit()
+            self.alice_id, self.bob_id = (user.id for user in users)
+
+        patch = mock.patch.object(
+            WorldSimulator, "_send", autospec=True, side_effect=fake_send
+        )
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.alice = self.connect(self.alice_id)
+        self.alice_tab = self.connect(self.alice_id)
+        self.bob = self.connect(self.bob_id)
+
+    def tearDown(self):
+        for client in (self.alice, self.alice_tab, self.bob):
+            if client.is_connected():
+                client.disconnect()
+
+    def connect(self, user_id):
+        http = app.test_client()
+        with http.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+        client = socketio.test_client(app, flask_test_client=http)
+        self.assertTrue(client.is_connected())
+        return client
+
+    def received(self, client, name, wait=True):
+        """
+        Names of the events a client got, waiting for name to arrive when wait is set.
+        """
+        names = []
+        for _ in range(100):
+            names += [event["name"] for event in client.get_received()]
+            if not wait or name in names:
+                return names
+            socketio.sleep(0.02)
+        self.fail(f"{name} never arrived, got {names}")
+
+    def start_simulation(self):
+        self.alice.emit("route_message", {"input": "Buy AAPL", "session_id": None})
+        self.received(self.alice, "simulation_confirmation")
+        with app.app_context():
+            return (
+                SimulationSession.query.filter_by(user_id=self.alice_id)
+                .order_by(SimulationSession.id.desc())
+                .first()
+                .id
+            )
+
+
+class TestSocketRooms(SocketTestCase):
+    def setUp(self):
+        super().setUp()
+        patch = mock.patch(
+            "routing_and_logic.process_scenario",
+            side_effect=lambda message: dict(SCENARIO),
+        )
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_confirmation_reaches_only_the_users_sockets(self):
+        self.start_simulation()
+        self.assertIn(
+            "simulation_confirmation",
+            self.received(self.alice_tab, "simulation_confirmation"),
+        )
+        socketio.sleep(0.1)
+        self.assertEqual(self.received(self.bob, None, wait=False), [])
+
+    def test_simulation_output_reaches_only_the_simulation_room(self):
+        session_id = self.start_simulation()
+        self.alice_tab.get_received()
+        self.alice.emit(
+            "confirm_simulation", {"confirmed": True, "session_id": session_id}
+        )
+
+        names = self.received(self.alice, "simulation_complete")
+        self.assertIn("simulation_chunk", names)
+        socketio.sleep(0.1)
+        self.assertEqual(self.received(self.bob, None, wait=False), [])
+        # The other tab never joined the simulation's room
+        self.assertNotIn(
+            "simulation_chunk", self.received(self.alice_tab, None, wait=False)
+        )
+
+    def test_joining_a_simulation_leaves_the_previous_one(self):
+        with app.app_context():
+            sessions = [SimulationSession(user_id=self.alice_id) for _ in range(2)]
+            db.session.add_all(sessions)
+            db.session.commit()
+            first, second = (session.id for session in sessions)
+
+        self.alice.emit("join_simulation", {"session_id": first})
+        self.alice.emit("join_simulation", {"session_id": second})
+        for session_id, expected in ((first, []), (second, ["simulation_chunk"])):
+            socketio.emit(
+                "simulation_chunk", {"delta": "x"}, to=simulation_room(session_id)
+            )
+            socketio.sleep(0.05)
+            self.assertEqual(self.received(self.alice, None, wait=False), expected)
+
+    def test_another_users_simulation_cannot_be_joined(self):
+        with app.app_context():
+            session = SimulationSession(user_id=self.alice_id)
+            db.session.add(session)
+            db.session.commit()
+            session_id = session.id
+
+        self.bob.emit("join_simulation", {"session_id": session_id})
+        self.assertIn("simulation_error", self.received(self.bob, "simulation_error"))
+        socketio.emit(
+            "simulation_chunk", {"delta": "x"}, to=simulation_room(session_id)
+        )
+        socketio.sleep(0.05)
+        self.assertEqual(self.received(self.bob, None, wait=False), [])
+
+
+class TestResubmittedScenario(SocketTestCase):
+    def setUp(self):
+        super().setUp()
+        # The real pipeline, with the LLM-backed parse stubbed and a fresh cache
+        patches = [
+            mock.patch.object(
+                routing_and_logic.query_parser,
+                "parse_scenario",
+                side_effect=lambda *args: {
+                    "goal": "Buy AAPL",
+                    "constraints": [],
+                    "conditions": [],
+                    "parameters": {"ticker": "AAPL"},
+                },
+            ),
+            mock.patch(
+                "routing_and_logic.scenario_cache",
+                ScenarioCache(DatabaseCacheBackend()),
+            ),
+            mock.patch.object(llm_gateway.gateway, "create"),
+            mock.patch.object(llm_gateway.gateway, "stream"),
+        ]
+        self.parse, self.cache, self.create, self.stream = (
+            patch.start() for patch in patches
+        )
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def submit(self, session_id):
+        self.alice.emit(
+            "route_message",
+            {"input": "/trading_strategy Buy AAPL", "session_id": session_id},
+        )
+        self.received(self.alice, "simulation_confirmation")
+
+    def test_edited_scenario_is_a_cache_hit(self):
+        self.submit(None)
+        self.assertEqual(self.parse.call_count, 1)
+
+        # Edit and resubmit before confirming: the client has no active session
+        self.submit(None)
+        # An older client may send the unconfirmed session's id
+        with app.app_context():
+            session_id = SimulationSession.query.first().id
+        self.submit(session_id)
+
+        self.assertEqual(self.parse.call_count, 1)
+        self.assertEqual(self.cache.hits, 2)
+        self.create.assert_not_called()
+        self.stream.assert_not_called()
+        with app.app_context():
+            self.assertEqual(SimulationSession.query.count(), 3)
+
+
+def ohlcv_csv(bars=60):
+    rows = [
+        f"2024-{day // 28 + 1:02d}-{day % 28 + 1:02d},1,100,0.5,{1 + day * 0.1:.1f},100"
+        for day in range(bars)
+    ]
+    return "date,open,high,low,close,volume\n" + "\n".join(rows)
+
+
+class TestMarketDataUpload(SocketTestCase):
+    def new_session(self, world_state):
+        with app.app_context():
+            session = SimulationSession(user_id=self.alice_id, world_state=world_state)
+            db.session.add(session)
+            db.session.commit()
+            return session.id
+
+    def world_state(self, session_id):
+        with app.app_context():
+            return db.session.get(SimulationSession, session_id).world_state
+
+    def upload(self, session_id, event):
+        self.alice.emit(
+            "upload_market_data",
+            {"session_id": session_id, "filename": "aapl.csv", "csv": ohlcv_csv()},
+        )
+        return self.received(self.alice, event)
+
+    def test_replacing_data_drops_old_results(self):
+        session_id = self.new_session({"local_results": {"best": "old"}})
+        self.upload(session_id, "market_data_uploaded")
+        world_state = self.world_state(session_id)
+        self.assertEqual(world_state["market_data"]["filename"], "aapl.csv")
+        self.assertNotIn("local_results", world_state)
+
+    def test_upload_after_the_simulation_started_is_rejected(self):
+        session_id = self.new_session({"local_results": {"best": "old"}})
+        with app.app_context():
+            SimulationTurn.append(
+                session_id,
+                [
+                    {"role": "user", "content": "scenario"},
+                    {"role": "assistant", "content": "opening"},
+                ],
+                0,
+            )
+            db.session.commit()
+
+        names = self.upload(session_id, "simulation_error")
+        self.assertNotIn("market_data_uploaded", names)
+        world_state = self.world_state(session_id)
+        self.assertNotIn("market_data", world_state)
+        self.assertEqual(world_state["local_results"], {"best": "old"})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)